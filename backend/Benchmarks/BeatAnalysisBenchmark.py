@@ -0,0 +1,96 @@
+"""
+Compare CalculateBeats full and fast modes on a folder of audio fixtures.
+
+Usage (from backend/):
+    python -m Benchmarks.BeatAnalysisBenchmark <fixtureFolder> [--limit N] [--output result.json]
+
+Prints a JSON report with per-file timings and BPMs, the overall speedup and the BPM
+agreement rate (within 2%, half/double tempo counted as agreeing).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from Core.AudioProcessing import CalculateBeatsFull, EstimateTempoFast, FAST_BEAT_MIN_CONFIDENCE
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a")
+BPM_AGREEMENT_RATIO = 0.02
+
+def ListFixtures(fixtureFolder, limit=None):
+    fixtures = []
+    for root, _, files in os.walk(fixtureFolder):
+        for file in sorted(files):
+            if file.lower().endswith(AUDIO_EXTENSIONS):
+                fixtures.append(os.path.join(root, file))
+    fixtures.sort()
+    return fixtures[:limit] if limit else fixtures
+
+def BpmAgrees(referenceBpm, candidateBpm):
+    return any(
+        abs(candidateBpm * factor - referenceBpm) <= referenceBpm * BPM_AGREEMENT_RATIO
+        for factor in (0.5, 1.0, 2.0)
+    )
+
+def RunBenchmark(fixtures):
+    results = []
+    for fixture in fixtures:
+        startTime = time.perf_counter()
+        fullBpm = float(CalculateBeatsFull(fixture)[0])
+        fullSeconds = time.perf_counter() - startTime
+
+        # Same decision as CalculateBeats(mode="fast"), timed including the fallback.
+        startTime = time.perf_counter()
+        windowBpm, confidence = EstimateTempoFast(fixture)
+        fellBack = windowBpm is None or confidence < FAST_BEAT_MIN_CONFIDENCE
+        fastBpm = float(CalculateBeatsFull(fixture)[0]) if fellBack else windowBpm
+        fastSeconds = time.perf_counter() - startTime
+
+        results.append({
+            "file": fixture,
+            "fullBpm": fullBpm,
+            "fullSeconds": fullSeconds,
+            "fastBpm": fastBpm,
+            "fastWindowBpm": windowBpm,
+            "fastConfidence": confidence,
+            "fastFellBack": fellBack,
+            "fastSeconds": fastSeconds,
+            "agrees": BpmAgrees(fullBpm, fastBpm),
+        })
+
+    totalFull = sum(result["fullSeconds"] for result in results)
+    totalFast = sum(result["fastSeconds"] for result in results)
+    return {
+        "fixtures": len(results),
+        "fullSecondsTotal": totalFull,
+        "fastSecondsTotal": totalFast,
+        "speedup": (totalFull / totalFast) if totalFast else None,
+        "agreementRate": float(np.mean([result["agrees"] for result in results])) if results else None,
+        "results": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtureFolder")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--output", default=None)
+    arguments = parser.parse_args(argv)
+
+    fixtures = ListFixtures(arguments.fixtureFolder, arguments.limit)
+    if not fixtures:
+        print(f"No audio fixtures found in {arguments.fixtureFolder}", file=sys.stderr)
+        return 1
+
+    report = RunBenchmark(fixtures)
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as file:
+            file.write(output)
+    print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+"""
+Micro-benchmark suite on deterministic synthetic fixtures (see Benchmarks.SyntheticFixtures).
+
+Sections:
+    silence     pydub decode + silence detection, and detection alone, with error vs the known silence
+    beats       beat tracking on decoded samples, CalculateBeats cold (analysis pass) and warm (record)
+    transitions PlanTransition (the core of CalculateTransition) cold, from the store and from memory
+    playlist    PlaylistEngine (the core of FirstGenerativePattern) at several library sizes
+    metadata    _extract_track_metadata throughput and tag correctness
+    streaming   FileRangeResponse throughput for single ranges, whole files and multipart ranges
+
+Usage (from backend/):
+    python -m Benchmarks.BenchmarkSuite [--sections silence beats ...] [--repeat 3] [--output result.json]
+    python -m Benchmarks.BenchmarkSuite --compare before.json after.json
+
+The report is JSON. A section whose dependencies are missing (pydub, librosa, mutagen, fastapi,
+or ffmpeg for the MP3 fixtures) is reported as {"skipped": reason} instead of failing the run.
+--compare prints, for every timing both reports share, the after/before ratio (above 1 is slower).
+Analysis state (store, peaks) goes to a temporary folder, never to ConfigurationFiles.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+
+SUITE_VERSION = 1
+SECTIONS = ("silence", "beats", "transitions", "playlist", "metadata", "streaming")
+BPM_TOLERANCE_RATIO = 0.02
+RANGE_MIN_BYTES = 64 * 1024
+RANGE_MAX_BYTES = 4 * 1024 * 1024
+MULTIPART_RANGE_COUNT = 4
+
+class SectionSkipped(Exception):
+    pass
+
+def _BestOf(repeat, function, *args, **kwargs):
+    """
+    Run function repeat times. Returns (last result, fastest seconds).
+    """
+    fastest = None
+    result = None
+    for _ in range(max(1, repeat)):
+        startTime = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - startTime
+        fastest = elapsed if fastest is None else min(fastest, elapsed)
+    return result, fastest
+
+def _BpmError(referenceBpm, measuredBpm):
+    # Half and double time count as the same tempo, as in BeatAnalysisBenchmark.
+    return min(abs(measuredBpm * factor - referenceBpm) for factor in (0.5, 1.0, 2.0))
+
+def _Mp3Fixtures(manifest):
+    fixtures = [entry for entry in manifest if entry["mp3Path"]]
+    if not fixtures:
+        raise SectionSkipped("needs the MP3 fixtures, which need ffmpeg")
+    return fixtures
+
+def BenchmarkSilence(manifest, repeat):
+    from Core.AudioProcessing import AnalyzeSilence, AnalyzeSilenceFromSamples, GetSamplesAsArray
+
+    results = []
+    for entry in manifest:
+        _, decodeAndDetectSeconds = _BestOf(repeat, AnalyzeSilence, entry["wavPath"])
+        samples = GetSamplesAsArray(entry["wavPath"])
+        analysis, detectSeconds = _BestOf(repeat, AnalyzeSilenceFromSamples, *samples)
+        results.append({
+            "fixture": entry["name"],
+            "decodeAndDetectSeconds": decodeAndDetectSeconds,
+            "detectSeconds": detectSeconds,
+            "leadInErrorMs": abs(analysis["nonSilentStartSec"] - entry["leadInSec"]) * 1000.0,
+            "tailErrorMs": abs(analysis["silenceAtEndSec"] - entry["tailSec"]) * 1000.0,
+        })
+
+    audioSeconds = sum(entry["durationSec"] for entry in manifest)
+    detectSeconds = sum(result["detectSeconds"] for result in results)
+    return {
+        "decodeAndDetectSeconds": sum(result["decodeAndDetectSeconds"] for result in results),
+        "detectSeconds": detectSeconds,
+        "detectRealtimeFactor": audioSeconds / detectSeconds if detectSeconds else None,
+        "maxLeadInErrorMs": max(result["leadInErrorMs"] for result in results),
+        "maxTailErrorMs": max(result["tailErrorMs"] for result in results),
+        "fixtures": results,
+    }
+
+def BenchmarkBeats(manifest, repeat, workFolder):
+    from Core.AudioProcessing import CalculateBeats, DecodeTrack, AnalyzeBeatGridFromSamples
+    from Core.AnalysisStore import AnalysisStore
+
+    trackingResults = []
+    for entry in manifest:
+        samples, sampleRate = DecodeTrack(entry["wavPath"])
+        (tempo, _), trackingSeconds = _BestOf(repeat, AnalyzeBeatGridFromSamples, samples.mean(axis=1), sampleRate)
+        trackingResults.append({
+            "fixture": entry["name"],
+            "beatTrackingSeconds": trackingSeconds,
+            "bpm": tempo,
+            "bpmError": _BpmError(entry["bpm"], tempo),
+        })
+    report = {
+        "beatTrackingSeconds": sum(result["beatTrackingSeconds"] for result in trackingResults),
+        "bpmAccuracy": sum(
+            result["bpmError"] <= entry["bpm"] * BPM_TOLERANCE_RATIO for result, entry in zip(trackingResults, manifest)
+        ) / len(manifest),
+        "beatTracking": trackingResults,
+    }
+
+    try:
+        fixtures = _Mp3Fixtures(manifest)
+    except SectionSkipped as e:
+        report["calculateBeats"] = {"skipped": str(e)}
+        return report
+
+    store = AnalysisStore(os.path.join(workFolder, "beats.sqlite"))
+    coldSeconds = []
+    warmSeconds = []
+    for entry in fixtures:
+        _, seconds = _BestOf(1, CalculateBeats, entry["mp3Path"], store=store)
+        coldSeconds.append(seconds)
+        _, seconds = _BestOf(repeat, CalculateBeats, entry["mp3Path"], store=store)
+        warmSeconds.append(seconds)
+    report["calculateBeats"] = {
+        "coldSeconds": sum(coldSeconds),
+        "warmMedianSeconds": statistics.median(warmSeconds),
+    }
+    return report
+
+def BenchmarkTransitions(manifest, repeat, workFolder):
+    from Core.AudioProcessing import PlanTransition, analysisMemoryCache
+    from Core.AnalysisStore import AnalysisStore
+
+    fixtures = _Mp3Fixtures(manifest)
+    if len(fixtures) < 2:
+        raise SectionSkipped("needs at least two fixtures")
+    pairs = [(current["mp3Path"], following["mp3Path"]) for current, following in zip(fixtures, fixtures[1:])]
+    store = AnalysisStore(os.path.join(workFolder, "transitions.sqlite"))
+
+    def timePairs(repeatCount, clearMemoryCache):
+        seconds = []
+        transitions = []
+        for currentPath, nextPath in pairs:
+            if clearMemoryCache:
+                analysisMemoryCache.Clear()
+            transition, elapsed = _BestOf(repeatCount, PlanTransition, currentPath, nextPath, store=store)
+            seconds.append(elapsed)
+            transitions.append(transition)
+        return seconds, transitions
+
+    analysisMemoryCache.Clear()
+    coldSeconds, transitions = timePairs(1, False)
+    storeSeconds, _ = timePairs(1, True)
+    memorySeconds, _ = timePairs(repeat, False)
+    return {
+        "pairs": len(pairs),
+        "coldSeconds": sum(coldSeconds),
+        "storeHitMedianSeconds": statistics.median(storeSeconds),
+        "memoryHitMedianSeconds": statistics.median(memorySeconds),
+        "phraseAlignedPairs": sum(bool(transition.get("phraseAligned")) for transition in transitions),
+    }
+
+def BenchmarkPlaylist(sizes, runs, legacyMaxSize, seed):
+    from Benchmarks.PlaylistGenerationBenchmark import RunBenchmark
+
+    return RunBenchmark(sizes, runs, legacyMaxSize, seed)
+
+def BenchmarkMetadata(manifest, repeat):
+    from pathlib import Path
+    from extractTrackMetaData import _extract_track_metadata, MutagenFile
+
+    if MutagenFile is None:
+        raise SectionSkipped("mutagen is not installed")
+    fixtures = _Mp3Fixtures(manifest)
+    seconds = []
+    tagsMatched = 0
+    for entry in fixtures:
+        metadata, elapsed = _BestOf(repeat, _extract_track_metadata, Path(entry["mp3Path"]))
+        seconds.append(elapsed)
+        tagsMatched += metadata["title"] == entry["title"] and metadata["artist"] == entry["artist"]
+    return {
+        "files": len(fixtures),
+        "medianSeconds": statistics.median(seconds),
+        "filesPerSecond": len(fixtures) / sum(seconds) if sum(seconds) else None,
+        "tagsMatched": tagsMatched,
+    }
+
+async def _Serve(response):
+    sentBytes = 0
+
+    async def receive():
+        # Never disconnects; the response cancels this wait once the body is sent.
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal sentBytes
+        if message["type"] == "http.response.body":
+            sentBytes += len(message.get("body", b""))
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}, "method": "GET", "path": "/", "headers": [], "extensions": {}}
+    await response(scope, receive, send)
+    return sentBytes
+
+def BenchmarkRangeStreaming(workFolder, fileMegabytes, requestCount, seed):
+    from pathlib import Path
+    from streamAudio import FileRangeResponse, parse_byte_ranges, multipart_byteranges_response
+
+    generator = random.Random(seed)
+    filePath = Path(workFolder) / "range.bin"
+    fileSize = fileMegabytes * 1024 * 1024
+    with open(filePath, "wb") as file:
+        file.write(generator.randbytes(fileSize))
+
+    def singleRange():
+        length = generator.randint(RANGE_MIN_BYTES, min(RANGE_MAX_BYTES, fileSize))
+        start = generator.randint(0, fileSize - length)
+        (start, end), = parse_byte_ranges(f"bytes={start}-{start + length - 1}", fileSize)
+        return FileRangeResponse(filePath, start, end - start + 1, status_code=206, media_type="audio/mpeg")
+
+    def wholeFile():
+        return FileRangeResponse(filePath, 0, fileSize, status_code=200, media_type="audio/mpeg")
+
+    def multipart():
+        specs = []
+        for _ in range(MULTIPART_RANGE_COUNT):
+            start = generator.randint(0, fileSize - RANGE_MIN_BYTES)
+            specs.append(f"{start}-{start + RANGE_MIN_BYTES - 1}")
+        ranges = parse_byte_ranges("bytes=" + ",".join(specs), fileSize)
+        return multipart_byteranges_response(filePath, ranges, fileSize, "audio/mpeg", {})
+
+    def measure(makeResponse, count):
+        async def run():
+            total = 0
+            for _ in range(count):
+                total += await _Serve(makeResponse())
+            return total
+
+        startTime = time.perf_counter()
+        sentBytes = asyncio.run(run())
+        elapsed = time.perf_counter() - startTime
+        return {
+            "requests": count,
+            "bytes": sentBytes,
+            "seconds": elapsed,
+            "megabytesPerSecond": sentBytes / elapsed / (1024 * 1024) if elapsed else None,
+            "requestsPerSecond": count / elapsed if elapsed else None,
+        }
+
+    return {
+        "fileMegabytes": fileMegabytes,
+        "singleRange": measure(singleRange, requestCount),
+        "wholeFile": measure(wholeFile, max(1, requestCount // 50)),
+        "multipart": measure(multipart, requestCount),
+    }
+
+def _RunSection(function, *args):
+    try:
+        return function(*args)
+    except SectionSkipped as e:
+        return {"skipped": str(e)}
+    except ImportError as e:
+        return {"skipped": f"missing dependency: {e.name or e}"}
+    except Exception as e:
+        return {"error": repr(e)}
+
+def _GitCommit():
+    try:
+        completed = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() or None
+
+def RunSuite(sections, repeat, workFolder, playlistSizes, legacyMaxSize, rangeFileMegabytes, rangeRequests, seed):
+    from Benchmarks.SyntheticFixtures import GenerateFixtures, FfmpegBinary
+
+    manifest = GenerateFixtures(os.path.join(workFolder, "fixtures"))
+    runners = {
+        "silence": lambda: BenchmarkSilence(manifest, repeat),
+        "beats": lambda: BenchmarkBeats(manifest, repeat, workFolder),
+        "transitions": lambda: BenchmarkTransitions(manifest, repeat, workFolder),
+        "playlist": lambda: BenchmarkPlaylist(playlistSizes, 5, legacyMaxSize, seed),
+        "metadata": lambda: BenchmarkMetadata(manifest, repeat),
+        "streaming": lambda: BenchmarkRangeStreaming(workFolder, rangeFileMegabytes, rangeRequests, seed),
+    }
+    results = {}
+    for section in sections:
+        startTime = time.perf_counter()
+        results[section] = _RunSection(runners[section])
+        results[section]["sectionSeconds"] = time.perf_counter() - startTime
+
+    return {
+        "suiteVersion": SUITE_VERSION,
+        "createdAt": time.time(),
+        "gitCommit": _GitCommit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ffmpeg": FfmpegBinary() is not None,
+        "repeat": repeat,
+        "fixtures": [
+            {key: entry[key] for key in ("name", "bpm", "leadInSec", "tailSec", "durationSec")} for entry in manifest
+        ],
+        "sections": results,
+    }
+
+def _TimingLeaves(value, prefix=""):
+    # Every numeric field named like a duration, keyed by its dotted path.
+    leaves = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            leaves.update(_TimingLeaves(item, f"{prefix}{key}."))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            leaves.update(_TimingLeaves(item, f"{prefix}{index}."))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool) and prefix.rstrip(".").endswith("Seconds"):
+        leaves[prefix.rstrip(".")] = float(value)
+    return leaves
+
+def _CompletedSections(report):
+    return {
+        name: section for name, section in report.get("sections", {}).items()
+        if "skipped" not in section and "error" not in section
+    }
+
+def CompareReports(before, after):
+    beforeLeaves = _TimingLeaves(_CompletedSections(before))
+    afterLeaves = _TimingLeaves(_CompletedSections(after))
+    return {
+        "before": before.get("gitCommit"),
+        "after": after.get("gitCommit"),
+        "ratios": {
+            key: afterLeaves[key] / beforeLeaves[key]
+            for key in sorted(beforeLeaves.keys() & afterLeaves.keys())
+            if beforeLeaves[key] > 0
+        },
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--playlist-sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--legacy-max-size", type=int, default=10000)
+    parser.add_argument("--range-file-mb", type=int, default=64)
+    parser.add_argument("--range-requests", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--work-dir", default=None, help="keep fixtures and analysis state here instead of a temporary folder")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), default=None)
+    parser.add_argument("--output", default=None)
+    arguments = parser.parse_args(argv)
+
+    if arguments.compare:
+        reports = []
+        for path in arguments.compare:
+            with open(path, "r", encoding="utf-8") as file:
+                reports.append(json.load(file))
+        report = CompareReports(*reports)
+    else:
+        workFolder = arguments.work_dir or tempfile.mkdtemp(prefix="aidj-benchmark-")
+        # Read when Core.WaveformPeaks is imported, which only happens inside the sections.
+        os.environ["AIDJ_PEAKS_DIR"] = os.path.join(workFolder, "peaks")
+        try:
+            report = RunSuite(
+                arguments.sections, arguments.repeat, workFolder, arguments.playlist_sizes,
+                arguments.legacy_max_size, arguments.range_file_mb, arguments.range_requests, arguments.seed,
+            )
+        finally:
+            if arguments.work_dir is None:
+                shutil.rmtree(workFolder, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as file:
+            file.write(output)
+    print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Time playlist generation on synthetic libraries of increasing size.
+
+Usage (from backend/):
+    python -m Benchmarks.PlaylistGenerationBenchmark [--sizes 1000 10000 100000] [--runs 5]
+        [--legacy-max-size 10000] [--seed 1] [--output result.json]
+
+Each size builds one PlaylistEngine and generates --runs playlists from it, like a library
+build does. The dict-scan algorithm the engine replaced is timed as well, up to
+--legacy-max-size tracks. The JSON report includes microseconds per track so the scaling
+can be read directly.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+
+from Core.PatternGeneration import PlaylistEngine, Pattern
+
+SYNTHETIC_BPM_MEAN = 120.0
+SYNTHETIC_BPM_DEVIATION = 20.0
+SYNTHETIC_BPM_RANGE = (60, 200)
+
+def SyntheticLibrary(size, seed):
+    generator = np.random.default_rng(seed)
+    bpms = np.clip(generator.normal(SYNTHETIC_BPM_MEAN, SYNTHETIC_BPM_DEVIATION, size), *SYNTHETIC_BPM_RANGE)
+    return {f"/library/track{index:07d}.mp3": int(round(bpm)) for index, bpm in enumerate(bpms)}
+
+def LegacyGenerate(songData, rng):
+    # The pre-engine FirstGenerativePattern loop, without the songsList.json read.
+    filteredSongsBeat = dict(sorted(songData.items(), key=lambda item: item[1]))
+    _, limitBPM = list(filteredSongsBeat.items())[-1]
+    randomItem = rng.choice(list(filteredSongsBeat.items())[:10])
+    playlist = {randomItem[0]: randomItem[1]}
+    while True:
+        _, currentBPM = list(playlist.items())[-1]
+        if currentBPM + 5 > limitBPM:
+            break
+        candidates = {key: value for key, value in filteredSongsBeat.items() if 2.5 + currentBPM < value < 7 + currentBPM}
+        for song in playlist:
+            candidates.pop(song, None)
+        if not candidates:
+            break
+        song, bpm = rng.choice(list(candidates.items()))
+        playlist[song] = bpm
+    return playlist
+
+def TimeEngine(songData, runs, rng):
+    startTime = time.perf_counter()
+    engine = PlaylistEngine(songData)
+    buildSeconds = time.perf_counter() - startTime
+    playlistLengths = []
+    for run in range(runs):
+        pattern = Pattern.PATTERN_ASCENDING if run % 2 == 0 else Pattern.PATTERN_DESCENDING
+        playlistLengths.append(len(engine.Generate(pattern, rng)))
+    return buildSeconds, time.perf_counter() - startTime, playlistLengths
+
+def TimeLegacy(songData, runs, rng):
+    startTime = time.perf_counter()
+    for _ in range(runs):
+        LegacyGenerate(songData, rng)
+    return time.perf_counter() - startTime
+
+def RunBenchmark(sizes, runs, legacyMaxSize, seed):
+    results = []
+    for size in sizes:
+        songData = SyntheticLibrary(size, seed)
+        buildSeconds, engineSeconds, playlistLengths = TimeEngine(songData, runs, random.Random(seed))
+        result = {
+            "tracks": size,
+            "runs": runs,
+            "engineBuildSeconds": buildSeconds,
+            "engineSeconds": engineSeconds,
+            "engineMicrosecondsPerTrack": engineSeconds / size * 1e6,
+            "meanPlaylistLength": float(np.mean(playlistLengths)),
+            "legacySeconds": None,
+            "speedup": None,
+        }
+        if size <= legacyMaxSize:
+            legacySeconds = TimeLegacy(songData, runs, random.Random(seed))
+            result["legacySeconds"] = legacySeconds
+            result["speedup"] = legacySeconds / engineSeconds if engineSeconds else None
+        results.append(result)
+
+    return {"seed": seed, "results": results}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--legacy-max-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None)
+    arguments = parser.parse_args(argv)
+
+    report = RunBenchmark(arguments.sizes, arguments.runs, arguments.legacy_max_size, arguments.seed)
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as file:
+            file.write(output)
+    print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
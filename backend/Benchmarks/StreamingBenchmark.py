@@ -0,0 +1,176 @@
+"""
+CPU cost of serving audio bytes through the real ASGI stack: FileRangeResponse under uvicorn.
+
+Each configuration runs uvicorn in a child process serving one file through FileRangeResponse:
+    generator   stock uvicorn (httptools + uvloop, the default deployment): the
+                extension is not offered, so the 1 MiB chunked generator path is taken
+    zeroCopy    zeroCopyHttp.ZeroCopyHttpToolsProtocol on the asyncio loop: the range is
+                handed to the server in one zerocopysend message and written with os.sendfile
+This process downloads the file over keep-alive connections and discards it. The reported CPU
+time (user + system, from /proc) is the server process's alone, so results are the server's
+CPU seconds per Gbit served, HTTP parsing, ASGI dispatch and framing included.
+
+Usage (from backend/, Linux):
+    python -m Benchmarks.StreamingBenchmark [--file path] [--size-mb 256] [--requests 4] [--range-mb 0]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import http.client
+from pathlib import Path
+
+BITS_PER_GBIT = 1_000_000_000
+READ_BUFFER_BYTES = 4 * 1024 * 1024
+SERVER_START_TIMEOUT_SECONDS = 20.0
+CLOCK_TICKS_PER_SECOND = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+SERVER_CONFIGURATIONS = {
+    "generator": ["--loop", "uvloop", "--http", "httptools"],
+    "zeroCopy": ["--loop", "asyncio", "--http", "zeroCopyHttp:ZeroCopyHttpToolsProtocol"],
+}
+
+async def app(scope, receive, send):
+    """
+    The served app: GET /?<start>,<length> returns that range of AIDJ_BENCHMARK_FILE.
+    """
+    if scope["type"] != "http":
+        return
+    from streamAudio import FileRangeResponse
+
+    start, _, length = scope["query_string"].decode().partition(",")
+    response = FileRangeResponse(
+        Path(os.environ["AIDJ_BENCHMARK_FILE"]), int(start), int(length),
+        headers={"Content-Length": length}, media_type="audio/mpeg",
+    )
+    await response(scope, receive, send)
+
+def _processCpuSeconds(pid):
+    with open(f"/proc/{pid}/stat", "r") as statFile:
+        # Fields after the parenthesised command name; utime and stime are fields 14 and 15.
+        fields = statFile.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS_PER_SECOND
+
+def _freePort():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def _waitForServer(port, process):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("uvicorn did not start")
+
+def _download(port, start, length, requests):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    buffer = bytearray(READ_BUFFER_BYTES)
+    received = 0
+    try:
+        for _ in range(requests):
+            connection.request("GET", f"/?{start},{length}")
+            response = connection.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"Unexpected status {response.status}")
+            while True:
+                readBytes = response.readinto(buffer)
+                if not readBytes:
+                    break
+                received += readBytes
+    finally:
+        connection.close()
+    if received != length * requests:
+        raise RuntimeError(f"Received {received} bytes, expected {length * requests}")
+    return received
+
+def MeasureServer(serverArguments, filePath, start, length, requests):
+    port = _freePort()
+    backendFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "Benchmarks.StreamingBenchmark:app", "--host", "127.0.0.1",
+         "--port", str(port), "--lifespan", "off", "--no-access-log", "--log-level", "warning", *serverArguments],
+        cwd=backendFolder,
+        env={**os.environ, "AIDJ_BENCHMARK_FILE": filePath},
+    )
+    try:
+        _waitForServer(port, process)
+        # One warm-up request, so imports and the page cache are not billed to the measurement.
+        _download(port, start, length, 1)
+        cpuStart = _processCpuSeconds(process.pid)
+        wallStart = time.perf_counter()
+        receivedBytes = _download(port, start, length, requests)
+        wallSeconds = time.perf_counter() - wallStart
+        cpuSeconds = _processCpuSeconds(process.pid) - cpuStart
+    finally:
+        process.terminate()
+        process.wait(10)
+
+    gbits = receivedBytes * 8 / BITS_PER_GBIT
+    return {
+        "bytes": receivedBytes,
+        "serverCpuSeconds": cpuSeconds,
+        "wallSeconds": wallSeconds,
+        "serverCpuSecondsPerGbit": cpuSeconds / gbits if gbits else None,
+        "gbitPerSecond": gbits / wallSeconds if wallSeconds else None,
+    }
+
+def RunBenchmark(filePath, requests, repeat, rangeBytes=0):
+    fileSize = os.path.getsize(filePath)
+    # rangeBytes > 0 serves a mid-file range, like a seek request.
+    start = (fileSize - rangeBytes) // 2 if rangeBytes else 0
+    length = rangeBytes if rangeBytes else fileSize
+
+    report = {"file": filePath, "fileBytes": fileSize, "start": start, "length": length, "requests": requests}
+    for name, serverArguments in SERVER_CONFIGURATIONS.items():
+        runs = [MeasureServer(serverArguments, filePath, start, length, requests) for _ in range(repeat)]
+        best = min(runs, key=lambda run: run["serverCpuSeconds"])
+        report[name] = {"best": best, "runs": runs}
+
+    generatorCost = report["generator"]["best"]["serverCpuSecondsPerGbit"]
+    zeroCopyCost = report["zeroCopy"]["best"]["serverCpuSecondsPerGbit"]
+    report["cpuReduction"] = (1.0 - zeroCopyCost / generatorCost) if generatorCost else None
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default=None, help="file to serve; a temporary file is created when omitted")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--requests", type=int, default=4, help="downloads per measurement")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--range-mb", type=int, default=0)
+    arguments = parser.parse_args(argv)
+
+    if not hasattr(os, "sendfile") or not os.path.exists("/proc/self/stat"):
+        print("Linux with os.sendfile is required", file=sys.stderr)
+        return 1
+
+    temporaryPath = None
+    filePath = arguments.file
+    if filePath is None:
+        with tempfile.NamedTemporaryFile(suffix=".bin", delete=False) as temporaryFile:
+            block = os.urandom(1024 * 1024)
+            for _ in range(arguments.size_mb):
+                temporaryFile.write(block)
+            temporaryPath = filePath = temporaryFile.name
+
+    try:
+        report = RunBenchmark(os.path.abspath(filePath), arguments.requests, arguments.repeat, arguments.range_mb * 1024 * 1024)
+    finally:
+        if temporaryPath:
+            os.remove(temporaryPath)
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Deterministic synthetic audio fixtures with known silence, BPM and tags.
+
+Each fixture is a click track (accented on every downbeat) over a quiet A minor chord bed,
+framed by digital silence of known length. The WAV is always written; an MP3 with
+title/artist tags is encoded next to it when ffmpeg is available, because the analysis
+code only accepts .mp3 paths.
+
+Usage (from backend/):
+    python -m Benchmarks.SyntheticFixtures <outputFolder>
+"""
+import os
+import sys
+import json
+import wave
+import shutil
+import subprocess
+
+import numpy as np
+
+FIXTURE_SAMPLE_RATE = 44100
+FIXTURE_CHANNELS = 2
+FIXTURE_MP3_BITRATE = "192k"
+CLICK_SECONDS = 0.03
+CLICK_FREQUENCY = 1000.0
+CLICK_AMPLITUDE = 0.5
+ACCENT_AMPLITUDE = 0.9
+# A minor triad, loud enough to keep the music above the -35 dBFS silence threshold between clicks.
+BED_FREQUENCIES = (220.0, 261.63, 329.63)
+BED_AMPLITUDE = 0.06
+NOISE_AMPLITUDE = 0.002
+MANIFEST_NAME = "manifest.json"
+
+# (bpm, musicSeconds, leadInSeconds, tailSeconds)
+DEFAULT_FIXTURE_SPECS = (
+    (90, 30.0, 0.5, 1.0),
+    (100, 45.0, 1.0, 2.0),
+    (110, 30.0, 0.25, 0.5),
+    (120, 60.0, 1.5, 3.0),
+    (128, 45.0, 0.75, 1.5),
+    (140, 30.0, 2.0, 1.0),
+    (150, 45.0, 0.5, 2.5),
+    (174, 30.0, 1.0, 0.75),
+)
+
+def FfmpegBinary():
+    return os.getenv("AIDJ_FFMPEG_BINARY") or shutil.which("ffmpeg")
+
+def SynthesizeFixture(bpm, musicSeconds, leadInSeconds, tailSeconds, seed=0, sampleRate=FIXTURE_SAMPLE_RATE):
+    """
+    Float samples shaped (frames, FIXTURE_CHANNELS) in [-1, 1].
+    """
+    generator = np.random.default_rng(seed)
+    musicFrames = int(round(musicSeconds * sampleRate))
+    time = np.arange(musicFrames) / sampleRate
+
+    music = sum(BED_AMPLITUDE * np.sin(2 * np.pi * frequency * time) for frequency in BED_FREQUENCIES)
+    music += NOISE_AMPLITUDE * generator.standard_normal(musicFrames)
+
+    clickFrames = int(CLICK_SECONDS * sampleRate)
+    clickTime = np.arange(clickFrames) / sampleRate
+    click = np.sin(2 * np.pi * CLICK_FREQUENCY * clickTime) * np.exp(-clickTime / (CLICK_SECONDS / 4))
+    beatSeconds = 60.0 / bpm
+    for beatIndex in range(int(musicSeconds / beatSeconds)):
+        start = int(round(beatIndex * beatSeconds * sampleRate))
+        end = min(start + clickFrames, musicFrames)
+        amplitude = ACCENT_AMPLITUDE if beatIndex % 4 == 0 else CLICK_AMPLITUDE
+        music[start:end] += amplitude * click[:end - start]
+
+    samples = np.concatenate([
+        np.zeros(int(round(leadInSeconds * sampleRate))),
+        np.clip(music, -1.0, 1.0),
+        np.zeros(int(round(tailSeconds * sampleRate))),
+    ])
+    return np.repeat(samples[:, None], FIXTURE_CHANNELS, axis=1)
+
+def WriteWav(path, samples, sampleRate=FIXTURE_SAMPLE_RATE):
+    pcm = np.clip(np.round(samples * 32767), -32768, 32767).astype("<i2")
+    with wave.open(path, "wb") as wavFile:
+        wavFile.setnchannels(samples.shape[1])
+        wavFile.setsampwidth(2)
+        wavFile.setframerate(sampleRate)
+        wavFile.writeframes(pcm.tobytes())
+
+def EncodeMp3(ffmpegBinary, wavPath, mp3Path, title, artist):
+    command = [
+        ffmpegBinary, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", wavPath,
+        "-c:a", "libmp3lame", "-b:a", FIXTURE_MP3_BITRATE,
+        "-metadata", f"title={title}", "-metadata", f"artist={artist}",
+        mp3Path,
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+
+def GenerateFixtures(outputFolder, specs=DEFAULT_FIXTURE_SPECS):
+    """
+    Write the fixtures of specs into outputFolder along with a manifest.json.
+    Returns the manifest: a list of
+    {"name", "wavPath", "mp3Path" (None without ffmpeg), "title", "artist", "bpm",
+     "leadInSec", "tailSec", "durationSec"}
+    """
+    os.makedirs(outputFolder, exist_ok=True)
+    ffmpegBinary = FfmpegBinary()
+    manifest = []
+    for index, (bpm, musicSeconds, leadInSeconds, tailSeconds) in enumerate(specs):
+        name = f"fixture{index:02d}_{bpm}bpm"
+        wavPath = os.path.join(outputFolder, f"{name}.wav")
+        WriteWav(wavPath, SynthesizeFixture(bpm, musicSeconds, leadInSeconds, tailSeconds, seed=index))
+
+        entry = {
+            "name": name,
+            "wavPath": wavPath,
+            "mp3Path": None,
+            "title": f"Fixture {index:02d}",
+            "artist": "Synthetic",
+            "bpm": bpm,
+            "leadInSec": leadInSeconds,
+            "tailSec": tailSeconds,
+            "durationSec": leadInSeconds + musicSeconds + tailSeconds,
+        }
+        if ffmpegBinary:
+            mp3Path = os.path.join(outputFolder, f"{name}.mp3")
+            EncodeMp3(ffmpegBinary, wavPath, mp3Path, entry["title"], entry["artist"])
+            entry["mp3Path"] = mp3Path
+        manifest.append(entry)
+
+    with open(os.path.join(outputFolder, MANIFEST_NAME), "w", encoding="utf-8") as manifestFile:
+        json.dump(manifest, manifestFile, indent=2)
+    return manifest
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print(__doc__, file=sys.stderr)
+        return 1
+    print(json.dumps(GenerateFixtures(argv[0]), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from Core.FileHandling import analysisStoreFile
+
+# Largest number of bound parameters used in one IN (...) query.
+BULK_LOOKUP_CHUNK_SIZE = 500
+
+ANALYSIS_UPSERT_SQL = """
+    INSERT INTO analysis (path, size, mtime, record, updatedAt) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+        size = excluded.size,
+        mtime = excluded.mtime,
+        record = excluded.record,
+        updatedAt = excluded.updatedAt
+"""
+BEAT_GRID_UPSERT_SQL = """
+    INSERT INTO beatGrids (path, size, mtime, bpm, beats, downbeats, phrases, updatedAt)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+        size = excluded.size,
+        mtime = excluded.mtime,
+        bpm = excluded.bpm,
+        beats = excluded.beats,
+        downbeats = excluded.downbeats,
+        phrases = excluded.phrases,
+        updatedAt = excluded.updatedAt
+"""
+
+def StatSongFile(songPath):
+    """
+    Return (normalizedPath, size, mtime) for a song file, the key used by the store.
+    """
+    normalizedPath = os.path.abspath(songPath)
+    fileStats = os.stat(normalizedPath)
+    return normalizedPath, int(fileStats.st_size), float(fileStats.st_mtime)
+
+
+class AnalysisStore:
+    """
+    SQLite (WAL mode) store for per-track analysis records.
+
+    Rows are keyed by absolute path and are only returned while the file's size and
+    mtime still match the values they were computed for. Each thread and process gets
+    its own connection, so uvicorn workers and ingest processes can share one file.
+    """
+
+    def __init__(self, databasePath=analysisStoreFile):
+        self.databasePath = databasePath
+        self._local = threading.local()
+        self.SetupSchema()
+
+    def _Connection(self):
+        # Connections must not cross a fork, so they are cached per process id too.
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+
+        databaseDirectory = os.path.dirname(self.databasePath)
+        if databaseDirectory:
+            os.makedirs(databaseDirectory, exist_ok=True)
+
+        connection = sqlite3.connect(self.databasePath, timeout=30.0, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=30000")
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def SetupSchema(self):
+        connection = self._Connection()
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                record TEXT NOT NULL,
+                updatedAt REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS storeMeta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID"
+        )
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trackMetadata (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                title TEXT,
+                artist TEXT,
+                coverHash TEXT,
+                coverMime TEXT,
+                updatedAt REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        # Cover art is content addressed, so an album's tracks share one row.
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS covers (hash TEXT PRIMARY KEY, mime TEXT, data BLOB NOT NULL) WITHOUT ROWID"
+        )
+        # Beat, downbeat and phrase times as packed float32 arrays (Core.BeatGrid).
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS beatGrids (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                bpm REAL,
+                beats BLOB NOT NULL,
+                downbeats BLOB NOT NULL,
+                phrases BLOB NOT NULL,
+                updatedAt REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+
+    def Get(self, path, size, mtime):
+        """
+        Return the stored record for path, or None when missing or stale.
+        """
+        row = self._Connection().execute(
+            "SELECT record FROM analysis WHERE path = ? AND size = ? AND mtime = ?",
+            (path, size, mtime),
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def GetMany(self, entries):
+        """
+        Bulk lookup for a whole playlist.
+        entries: iterable of (path, size, mtime). Returns {path: record} for fresh rows only.
+        """
+        wanted = {path: (size, mtime) for path, size, mtime in entries}
+        paths = list(wanted.keys())
+        records = {}
+        connection = self._Connection()
+
+        for chunkStart in range(0, len(paths), BULK_LOOKUP_CHUNK_SIZE):
+            chunk = paths[chunkStart:chunkStart + BULK_LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT path, size, mtime, record FROM analysis WHERE path IN ({placeholders})",
+                chunk,
+            )
+            for path, size, mtime, record in rows:
+                if wanted[path] == (size, mtime):
+                    records[path] = json.loads(record)
+
+        return records
+
+    def Upsert(self, path, size, mtime, record):
+        self.UpsertMany([(path, size, mtime, record)])
+
+    def UpsertMany(self, rows):
+        """
+        rows: iterable of (path, size, mtime, record). Written in one transaction.
+        """
+        now = time.time()
+        parameters = [
+            (path, size, mtime, json.dumps(record, sort_keys=True), now)
+            for path, size, mtime, record in rows
+        ]
+        if not parameters:
+            return
+
+        connection = self._Connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(ANALYSIS_UPSERT_SQL, parameters)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def GetTrackMetadata(self, path, size, mtime):
+        """
+        Return {"title", "artist", "coverHash", "coverMime"} for path, or None when missing or stale.
+        """
+        row = self._Connection().execute(
+            "SELECT title, artist, coverHash, coverMime FROM trackMetadata WHERE path = ? AND size = ? AND mtime = ?",
+            (path, size, mtime),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"title": row[0], "artist": row[1], "coverHash": row[2], "coverMime": row[3]}
+
+    def GetManyTrackMetadata(self, entries):
+        """
+        entries: iterable of (path, size, mtime). Returns {path: metadata} for fresh rows only.
+        """
+        wanted = {path: (size, mtime) for path, size, mtime in entries}
+        paths = list(wanted.keys())
+        metadataByPath = {}
+        connection = self._Connection()
+
+        for chunkStart in range(0, len(paths), BULK_LOOKUP_CHUNK_SIZE):
+            chunk = paths[chunkStart:chunkStart + BULK_LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT path, size, mtime, title, artist, coverHash, coverMime FROM trackMetadata WHERE path IN ({placeholders})",
+                chunk,
+            )
+            for path, size, mtime, title, artist, coverHash, coverMime in rows:
+                if wanted[path] == (size, mtime):
+                    metadataByPath[path] = {"title": title, "artist": artist, "coverHash": coverHash, "coverMime": coverMime}
+
+        return metadataByPath
+
+    def UpsertTrackMetadata(self, path, size, mtime, metadata, coverData=None):
+        """
+        Store a track's metadata; coverData is stored once under metadata["coverHash"].
+        """
+        connection = self._Connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if coverData is not None and metadata.get("coverHash"):
+                connection.execute(
+                    "INSERT OR IGNORE INTO covers (hash, mime, data) VALUES (?, ?, ?)",
+                    (metadata["coverHash"], metadata.get("coverMime"), sqlite3.Binary(coverData)),
+                )
+            connection.execute(
+                """
+                INSERT INTO trackMetadata (path, size, mtime, title, artist, coverHash, coverMime, updatedAt)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    size = excluded.size,
+                    mtime = excluded.mtime,
+                    title = excluded.title,
+                    artist = excluded.artist,
+                    coverHash = excluded.coverHash,
+                    coverMime = excluded.coverMime,
+                    updatedAt = excluded.updatedAt
+                """,
+                (path, size, mtime, metadata.get("title"), metadata.get("artist"),
+                 metadata.get("coverHash"), metadata.get("coverMime"), time.time()),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def GetBeatGrid(self, path, size, mtime):
+        """
+        Return {"bpm", "beats", "downbeats", "phrases"} for path, the arrays as packed bytes,
+        or None when missing or stale.
+        """
+        row = self._Connection().execute(
+            "SELECT bpm, beats, downbeats, phrases FROM beatGrids WHERE path = ? AND size = ? AND mtime = ?",
+            (path, size, mtime),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"bpm": row[0], "beats": bytes(row[1]), "downbeats": bytes(row[2]), "phrases": bytes(row[3])}
+
+    def UpsertTrackFeatures(self, rows):
+        """
+        rows: iterable of (path, size, mtime, record, beatGrid), beatGrid being None or
+        {"beats", "downbeats", "phrases"} as packed bytes. Records and beat grids are
+        written in one transaction, so a track never has one without the other.
+        """
+        now = time.time()
+        analysisParameters = []
+        beatGridParameters = []
+        for path, size, mtime, record, beatGrid in rows:
+            analysisParameters.append((path, size, mtime, json.dumps(record, sort_keys=True), now))
+            if beatGrid is not None:
+                beatGridParameters.append((
+                    path, size, mtime, record.get("bpm"), sqlite3.Binary(beatGrid["beats"]),
+                    sqlite3.Binary(beatGrid["downbeats"]), sqlite3.Binary(beatGrid["phrases"]), now,
+                ))
+        if not analysisParameters:
+            return
+
+        connection = self._Connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(ANALYSIS_UPSERT_SQL, analysisParameters)
+            connection.executemany(BEAT_GRID_UPSERT_SQL, beatGridParameters)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def GetCover(self, coverHash):
+        """
+        Return (data, mime) for a cover hash, or None.
+        """
+        row = self._Connection().execute("SELECT data, mime FROM covers WHERE hash = ?", (coverHash,)).fetchone()
+        if row is None:
+            return None
+        return bytes(row[0]), row[1]
+
+    def GetMeta(self, key):
+        row = self._Connection().execute("SELECT value FROM storeMeta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def SetMeta(self, key, value):
+        self._Connection().execute(
+            "INSERT INTO storeMeta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value)),
+        )
+
+    def MigrateFromJson(self, jsonCacheFilePath):
+        """
+        One-time import of the legacy audio_analysis_cache.json.
+        Returns the number of imported entries (0 if already migrated or missing).
+        """
+        metaKey = f"migratedFromJson:{os.path.abspath(jsonCacheFilePath)}"
+        if self.GetMeta(metaKey) is not None or not os.path.exists(jsonCacheFilePath):
+            return 0
+
+        try:
+            with open(jsonCacheFilePath, "r", encoding="utf-8") as cacheFile:
+                legacyCache = json.load(cacheFile)
+        except Exception:
+            legacyCache = {}
+        if not isinstance(legacyCache, dict):
+            legacyCache = {}
+
+        rows = []
+        for path, entry in legacyCache.items():
+            if not isinstance(entry, dict) or "size" not in entry or "mtime" not in entry:
+                continue
+            record = {key: value for key, value in entry.items() if key not in ("size", "mtime")}
+            rows.append((path, int(entry["size"]), float(entry["mtime"]), record))
+
+        self.UpsertMany(rows)
+        self.SetMeta(metaKey, time.time())
+        return len(rows)
@@ -2,15 +2,21 @@ import os
 os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide" # Set PYGAME_HIDE_SUPPORT_PROMPT to hide the support prompt
 import pygame
 import librosa
-import tempfile
-import soundfile as sf
 import json
+import numpy as np
 from pydub import AudioSegment
 import os
 import time
+import threading
 import simpleaudio as sa
 from asyncio import to_thread
 from Core.FileHandling import DeleteAndCreate
+from Core.AnalysisStore import AnalysisStore, StatSongFile
+from Core.MemoryCache import LruCache
+from Core.WaveformPeaks import SavePeaks, GetFreshPeaksPath
+from Core.BeatGrid import ComputeBeatGrid, EncodeBeatGrid, DecodeBeatGrid, FindNearestTime
+from Core.TrackFeatures import ComputeIntegratedLoudness, EstimateKey
+from Core.Metrics import StageTimer, ObserveAnalysisStages, analysisLookupSeconds
 from Logging.MainLogger import mainLogger
 # TODO Continuous music beat
 
@@ -19,7 +25,27 @@ milisecondsToSeconds = 1/1000
 MIN_CROSSFADE_SECONDS = 2.0
 MAX_CROSSFADE_SECONDS = 20.0
 DEFAULT_CROSSFADE_SECONDS = 6.0
+BEAT_ANALYSIS_MODE_FULL = "full"
+BEAT_ANALYSIS_MODE_FAST = "fast"
+BEAT_ANALYSIS_MODE = os.getenv("AIDJ_BEAT_ANALYSIS_MODE", BEAT_ANALYSIS_MODE_FULL)
+FAST_BEAT_SAMPLE_RATE = 11025
+FAST_BEAT_WINDOW_COUNT = 3
+FAST_BEAT_WINDOW_SECONDS = 30.0
+FAST_BEAT_MIN_WINDOW_SECONDS = 5.0
+FAST_BEAT_AGREEMENT_RATIO = 0.04
+FAST_BEAT_MIN_CONFIDENCE = 0.66
 ANALYSIS_CACHE_FILE = os.path.join(os.path.dirname(__file__), "audio_analysis_cache.json")
+ANALYSIS_MEMORY_CACHE_ENTRIES = int(os.getenv("AIDJ_ANALYSIS_MEMORY_CACHE_ENTRIES", "2048"))
+ANALYSIS_MEMORY_CACHE_BYTES = int(os.getenv("AIDJ_ANALYSIS_MEMORY_CACHE_BYTES", str(8 * 1024 * 1024)))
+ANALYSIS_MEMORY_ENTRY_BYTES = 512 # rough footprint of one cached analysis dict
+# Peaks requests that miss decode the track on the request thread; at most this many at once.
+PEAKS_DECODE_CONCURRENCY = int(os.getenv("AIDJ_PEAKS_DECODE_CONCURRENCY", "2"))
+# Bumped whenever AnalyzeTrackFeatures adds or changes a feature; older records get re-analyzed at ingest.
+FEATURES_VERSION = 1
+PCM16_MAX_AMPLITUDE = 32768.0
+
+# In-process tier in front of the analysis store, revalidated on every stat().
+analysisMemoryCache = LruCache(ANALYSIS_MEMORY_CACHE_ENTRIES, ANALYSIS_MEMORY_CACHE_BYTES)
 
 # def fade_out_and_stop(play_obj, fade_duration_ms,song,current_position):
 #     remaining_segment = song[current_position:]
@@ -47,7 +73,7 @@ def Play(filePath, logUntilThisLimit,stopEvent,startPos=0):
     while playObj.is_playing():
         currentTime = time.time() - startTime + startPos 
         if currentTime<logUntilThisLimit:
-            mainLogger.debug(f"{filePath[-30:]} Current playback position: {currentTime:.2f} seconds")
+            mainLogger.debug("%s Current playback position: %.2f seconds", filePath[-30:], currentTime)
             DeleteAndCreate(filePath,currentTime)
         time.sleep(0.5)
         if stopEvent.is_set():
@@ -56,7 +82,7 @@ def Play(filePath, logUntilThisLimit,stopEvent,startPos=0):
             #fade_out_and_stop(playObj, 1000,song,currentPosition)
             break
     
-    mainLogger.debug(f" {filePath.split('/')[-1]} playing done.")
+    mainLogger.debug(" %s playing done.", os.path.basename(filePath))
 
     return currentTime
 
@@ -64,14 +90,117 @@ async def PlayAsync(filePath, logUntilThisLimit,stopEvent,startPos=0):
     await to_thread(Play, filePath, logUntilThisLimit, stopEvent,startPos)
 
 # Calculate beats 
-def CalculateBeats(mp3Path):
+def CalculateBeats(mp3Path, mode=None, store=None):
+    """
+    Tempo of a song from its feature record, analyzing and storing the song first when it
+    has none (see GetTrackFeatures). Returns a 1-element array with the BPM.
+    """
+    return np.atleast_1d(GetTrackFeatures(mp3Path, store=store, mode=mode)["bpm"])
+
+def CalculateBeatsFull(mp3Path):
     audio, sr = librosa.load(mp3Path, sr=None)
+    return np.atleast_1d(AnalyzeBeatGridFromSamples(audio, sr)[0])
 
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=True) as temp_wav:
-        sf.write(temp_wav.name, audio, sr)
-        tempo, beats = librosa.beat.beat_track(y=audio, sr=sr)
+def AnalyzeBeatGridFromSamples(audio, sr):
+    """
+    Beat track of a whole mono song at its native rate. Returns (tempo, beatGrid).
+    """
+    # The envelope beat_track would compute itself; kept so beats can be weighed by onset strength.
+    onsetEnvelope = librosa.onset.onset_strength(y=audio, sr=sr, aggregate=np.median)
+    tempo, beatFrames = librosa.beat.beat_track(onset_envelope=onsetEnvelope, sr=sr)
+    beatTimes = librosa.frames_to_time(beatFrames, sr=sr)
+    return float(np.atleast_1d(tempo)[0]), ComputeBeatGrid(beatTimes, onsetEnvelope[beatFrames])
 
-    return tempo
+def AnalyzeTempoFromSamples(audio, sr, mode=None):
+    """
+    Tempo and beat grid of a decoded mono song. mode "full" beat tracks the whole song;
+    mode "fast" estimates the tempo from a few downsampled windows and falls back to "full"
+    when they disagree. Returns (tempo, beatGrid), beatGrid None for a fast estimate.
+    """
+    mode = mode or BEAT_ANALYSIS_MODE
+    if mode == BEAT_ANALYSIS_MODE_FAST:
+        bpm, confidence = EstimateTempoFastFromSamples(audio, sr)
+        if bpm is not None and confidence >= FAST_BEAT_MIN_CONFIDENCE:
+            return bpm, None
+        mainLogger.debug("Fast tempo confidence %.2f too low, running full beat analysis", confidence)
+
+    return AnalyzeBeatGridFromSamples(audio, sr)
+
+def _getDurationInSeconds(mp3Path):
+    try:
+        return float(librosa.get_duration(path=mp3Path))
+    except TypeError:  # librosa < 0.10 names the argument filename
+        return float(librosa.get_duration(filename=mp3Path))
+
+def _foldTempoToReference(tempo, referenceTempo):
+    # beat_track often locks onto half or double time in one window but not in another.
+    candidates = (tempo / 2.0, tempo, tempo * 2.0)
+    return min(candidates, key=lambda candidate: abs(candidate - referenceTempo))
+
+def _fastBeatWindows(durationSec, windowCount, windowSeconds):
+    if durationSec <= windowCount * windowSeconds:
+        return [(0.0, None)]
+    # Window centers spread evenly, away from intro and outro.
+    return [
+        (max(0.0, durationSec * (index + 1) / (windowCount + 1) - windowSeconds / 2.0), windowSeconds)
+        for index in range(windowCount)
+    ]
+
+def _windowTempo(audio, sr):
+    if len(audio) < sr * FAST_BEAT_MIN_WINDOW_SECONDS:
+        return None
+    tempo, _ = librosa.beat.beat_track(y=audio, sr=sr)
+    tempo = float(np.atleast_1d(tempo)[0])
+    return tempo if tempo > 0 else None
+
+def _combineWindowTempos(tempos, windowCount):
+    tempos = [tempo for tempo in tempos if tempo is not None]
+    if not tempos:
+        return None, 0.0
+
+    medianTempo = float(np.median(tempos))
+    foldedTempos = [_foldTempoToReference(tempo, medianTempo) for tempo in tempos]
+    agreeingTempos = [tempo for tempo in foldedTempos if abs(tempo - medianTempo) <= medianTempo * FAST_BEAT_AGREEMENT_RATIO]
+    confidence = len(agreeingTempos) / windowCount
+    if not agreeingTempos:
+        return medianTempo, confidence
+    return float(np.mean(agreeingTempos)), confidence
+
+def EstimateTempoFast(mp3Path, windowCount=None, windowSeconds=None, sampleRate=None):
+    """
+    Tempo from windowCount mono windows of windowSeconds decoded at sampleRate.
+    Returns (bpm, confidence) where confidence is the fraction of windows whose tempo
+    agrees with the median within FAST_BEAT_AGREEMENT_RATIO. bpm is None when nothing
+    could be analyzed.
+    """
+    windowCount = windowCount or FAST_BEAT_WINDOW_COUNT
+    windowSeconds = windowSeconds or FAST_BEAT_WINDOW_SECONDS
+    sampleRate = sampleRate or FAST_BEAT_SAMPLE_RATE
+
+    windows = _fastBeatWindows(_getDurationInSeconds(mp3Path), windowCount, windowSeconds)
+    tempos = []
+    for offset, duration in windows:
+        audio, sr = librosa.load(mp3Path, sr=sampleRate, mono=True, offset=offset, duration=duration)
+        tempos.append(_windowTempo(audio, sr))
+    return _combineWindowTempos(tempos, len(windows))
+
+def EstimateTempoFastFromSamples(audio, sr, windowCount=None, windowSeconds=None, sampleRate=None):
+    """
+    EstimateTempoFast on an already decoded mono song: the same windows are cut out of
+    audio and resampled to sampleRate instead of being decoded again.
+    """
+    windowCount = windowCount or FAST_BEAT_WINDOW_COUNT
+    windowSeconds = windowSeconds or FAST_BEAT_WINDOW_SECONDS
+    sampleRate = sampleRate or FAST_BEAT_SAMPLE_RATE
+
+    windows = _fastBeatWindows(len(audio) / sr, windowCount, windowSeconds)
+    tempos = []
+    for offset, duration in windows:
+        startFrame = int(offset * sr)
+        endFrame = None if duration is None else startFrame + int(duration * sr)
+        window = librosa.resample(audio[startFrame:endFrame], orig_sr=sr, target_sr=sampleRate)
+        tempos.append(_windowTempo(window, sampleRate))
+    return _combineWindowTempos(tempos, len(windows))
 
 # Get mp3 from file
 def GetMP3FromFile(filePath):
@@ -80,30 +209,31 @@ def GetMP3FromFile(filePath):
     if extension.lower() == '.mp3':
         return filePath
     elif extension.lower() == '.m4a':
-        audio = AudioSegment.from_file(filePath, format="m4a")
         outputFile = root + '.mp3'
         if os.path.exists(outputFile):
             return outputFile
+        audio = AudioSegment.from_file(filePath, format="m4a")
         audio.export(outputFile,format="mp3")
         return outputFile
     else:
         return None
 
-def ConvertM4AtoMp3(folderPath):
+def ConvertM4AFilesToMp3(m4aFiles):
+    """
+    Convert the given .m4a files next to themselves. Returns the created .mp3 paths.
+    """
+    createdFiles = []
     try:
-        for root, dirs, files in os.walk(folderPath):
-            for file in files:
-                if file.endswith((".m4a")):
-                    mp3file = file[:-4] + ".mp3"
-                    outputFile = root + "/"+ mp3file
-                    if os.path.exists(outputFile):
-                        continue
-                    inputFile = root + "/"+ file
-                    audio = AudioSegment.from_file(inputFile, format="m4a")
-                    audio.export(outputFile, format="mp3")
+        for inputFile in m4aFiles:
+            outputFile = inputFile[:-4] + ".mp3"
+            if os.path.exists(outputFile):
+                continue
+            audio = AudioSegment.from_file(inputFile, format="m4a")
+            audio.export(outputFile, format="mp3")
+            createdFiles.append(outputFile)
     except Exception as e:
          raise ValueError("converting .m4a to .mp3 raise this exception ") from e
-         
+    return createdFiles
 
 def GetSongWithAudioSegment(song):
 
@@ -170,34 +300,127 @@ def GetSilenceAtEndDuration(song):
     return max(0.0, GetSongDuration(song) - GetNonSilentEndTime(song))
 
 
-def _loadAnalysisCache(cacheFilePath):
-    if not os.path.exists(cacheFilePath):
-        return {}
-    try:
-        with open(cacheFilePath, "r", encoding="utf-8") as cacheFile:
-            data = json.load(cacheFile)
-            if isinstance(data, dict):
-                return data
-            return {}
-    except Exception:
-        return {}
+def GetSamplesAsArray(song):
+    """
+    Decode an AudioSegment (or file path) into a NumPy array shaped (frames, channels).
+    Returns (samples, frameRate, maxAmplitude, durationMs) where durationMs matches len(song).
+    """
+    song = GetSongWithAudioSegment(song)
+    samples = np.array(song.get_array_of_samples())
+    samples = samples.reshape(-1, song.channels)
+    return samples, song.frame_rate, float(song.max_possible_amplitude), len(song)
+
 
+def ComputeFramedDbfs(samples, frameRate, maxAmplitude, durationMs, frameMs=1):
+    """
+    Compute the dBFS of every frameMs window in one pass.
+    Window boundaries follow pydub's song[ms] slicing, so the value at index i equals
+    song[i*frameMs:(i+1)*frameMs].dBFS (RMS over all interleaved channel samples).
+    Empty or digitally silent windows are -inf.
+    """
+    frameCount = samples.shape[0]
+    channels = samples.shape[1] if samples.ndim > 1 else 1
+    windowCount = int(np.ceil(durationMs / frameMs)) if durationMs > 0 else 0
+    if windowCount == 0:
+        return np.empty(0, dtype=np.float64)
+
+    windowStartsMs = np.arange(windowCount + 1, dtype=np.float64) * frameMs
+    boundaries = (windowStartsMs * (frameRate / 1000.0)).astype(np.int64)
+    # pydub pads a window that runs past the last frame with silence, so the
+    # sample count uses the requested bounds while the energy uses the real ones.
+    dataBoundaries = np.minimum(boundaries, frameCount)
+
+    squared = np.square(samples.astype(np.int64)).reshape(frameCount, -1).sum(axis=1)
+    # Prefix sums in exact integer arithmetic; float cumulative sums drift on long tracks.
+    prefix = np.concatenate(([0], np.cumsum(squared, dtype=np.int64)))
+    windowEnergy = prefix[dataBoundaries[1:]] - prefix[dataBoundaries[:-1]]
+    windowSampleCount = (boundaries[1:] - boundaries[:-1]) * channels
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # audioop.rms truncates to an integer, keep that so thresholds flip on the same ms.
+        rms = np.floor(np.sqrt(windowEnergy / np.maximum(windowSampleCount, 1)))
+        dbfs = 20.0 * np.log10(rms / maxAmplitude)
+    dbfs[dataBoundaries[1:] == dataBoundaries[:-1]] = -np.inf
+    return dbfs
+
+
+def DetectSilencePortionsOfSongVectorized(song):
+    """
+    Vectorized equivalent of DetectSilencePortionsOfSong.
+    Returns (nonSilentStartTime, nonSilentEndTime, silenceAtEndDuration, songDuration) in seconds.
+    """
+    samples, frameRate, maxAmplitude, durationMs = GetSamplesAsArray(song)
+    return DetectSilencePortionsFromSamples(samples, frameRate, maxAmplitude, durationMs)
 
-def _saveAnalysisCache(cacheFilePath, cache):
-    cacheDirectory = os.path.dirname(cacheFilePath)
-    if cacheDirectory:
-        os.makedirs(cacheDirectory, exist_ok=True)
 
-    tempCacheFilePath = f"{cacheFilePath}.tmp"
-    with open(tempCacheFilePath, "w", encoding="utf-8") as cacheFile:
-        json.dump(cache, cacheFile, indent=2, sort_keys=True)
+def DetectSilencePortionsFromSamples(samples, frameRate, maxAmplitude, durationMs):
+    dbfs = ComputeFramedDbfs(samples, frameRate, maxAmplitude, durationMs)
+    loudWindows = np.flatnonzero(dbfs > silenceThresholdInDbfs)
 
-    os.replace(tempCacheFilePath, cacheFilePath)
+    # Same fallbacks as the millisecond loops when nothing crosses the threshold.
+    if loudWindows.size:
+        nonSilentStartTimeInMs = int(loudWindows[0])
+        nonSilentEndTimeInMs = int(loudWindows[-1])
+    else:
+        nonSilentStartTimeInMs = max(durationMs - 1, 0)
+        nonSilentEndTimeInMs = 0
+
+    songDuration = durationMs*milisecondsToSeconds
+    nonSilentStartTime = nonSilentStartTimeInMs*milisecondsToSeconds
+    nonSilentEndTime = nonSilentEndTimeInMs*milisecondsToSeconds
+    silenceAtEndDuration = songDuration-nonSilentEndTime
 
+    return nonSilentStartTime, nonSilentEndTime, silenceAtEndDuration, songDuration
 
-def AnalyzeSongForTransitionWithCache(songPath, cacheFilePath=ANALYSIS_CACHE_FILE):
+
+def AnalyzeSilence(song):
+    """
+    One-pass silence analysis used by the transition code.
+    Returns {"durationSec", "silenceAtEndSec", "nonSilentStartSec"}.
     """
-    Analyze a song once and cache reusable transition metrics in JSON.
+    return AnalyzeSilenceFromSamples(*GetSamplesAsArray(song))
+
+
+def AnalyzeSilenceFromSamples(samples, frameRate, maxAmplitude, durationMs):
+    nonSilentStartTime, _, silenceAtEndDuration, songDuration = DetectSilencePortionsFromSamples(
+        samples, frameRate, maxAmplitude, durationMs
+    )
+    return {
+        "durationSec": max(0.0, songDuration),
+        "silenceAtEndSec": max(0.0, silenceAtEndDuration),
+        "nonSilentStartSec": max(0.0, nonSilentStartTime),
+    }
+
+
+_defaultAnalysisStore = None
+_defaultAnalysisStoreLock = threading.Lock()
+
+def GetDefaultAnalysisStore():
+    """
+    Process-wide AnalysisStore. On first use the legacy JSON cache is imported once.
+    """
+    global _defaultAnalysisStore
+    with _defaultAnalysisStoreLock:
+        if _defaultAnalysisStore is None:
+            store = AnalysisStore()
+            migratedEntries = store.MigrateFromJson(ANALYSIS_CACHE_FILE)
+            if migratedEntries:
+                mainLogger.info("Migrated %d entries from %s to %s", migratedEntries, ANALYSIS_CACHE_FILE, store.databasePath)
+            _defaultAnalysisStore = store
+        return _defaultAnalysisStore
+
+
+def _transitionAnalysisFromRecord(record):
+    return {
+        "durationSec": float(record.get("durationSec", 0.0)),
+        "silenceAtEndSec": float(record.get("silenceAtEndSec", 0.0)),
+        "nonSilentStartSec": float(record.get("nonSilentStartSec", 0.0)),
+    }
+
+
+def AnalyzeSongForTransitionWithCache(songPath, store=None):
+    """
+    Analyze a song once and cache reusable transition metrics in the analysis store.
     Returns:
     {
       "durationSec": float,
@@ -205,49 +428,237 @@ def AnalyzeSongForTransitionWithCache(songPath, cacheFilePath=ANALYSIS_CACHE_FIL
       "nonSilentStartSec": float
     }
     """
+    analysis, _ = AnalyzeSongForTransitionWithCacheStatus(songPath, store)
+    return analysis
+
+
+def AnalyzeSongForTransitionWithCacheStatus(songPath, store=None):
+    """
+    Same as AnalyzeSongForTransitionWithCache but also reports whether the
+    result came from the cache. Returns (analysis, cacheHit).
+    """
+    store = store or GetDefaultAnalysisStore()
     mp3Path = GetMP3FromFile(songPath)
     if mp3Path is None:
         raise ValueError(f"Unsupported audio extension for songPath={songPath}")
 
-    normalizedPath = os.path.abspath(mp3Path)
-    fileStats = os.stat(normalizedPath)
-    fileSize = int(fileStats.st_size)
-    modifiedTime = float(fileStats.st_mtime)
-
-    cache = _loadAnalysisCache(cacheFilePath)
-    cacheKey = normalizedPath
-    cachedEntry = cache.get(cacheKey)
-
-    if isinstance(cachedEntry, dict):
-        if cachedEntry.get("size") == fileSize and cachedEntry.get("mtime") == modifiedTime:
-            return {
-                "durationSec": float(cachedEntry.get("durationSec", 0.0)),
-                "silenceAtEndSec": float(cachedEntry.get("silenceAtEndSec", 0.0)),
-                "nonSilentStartSec": float(cachedEntry.get("nonSilentStartSec", 0.0)),
-            }
-
-    song = AudioSegment.from_file(normalizedPath)
-    analyzedDuration = max(0.0, GetSongDuration(song))
-    analyzedSilenceAtEnd = max(0.0, GetSilenceAtEndDuration(song))
-    analyzedNonSilentStart = max(0.0, GetNonSilentStartTime(song))
-
-    cache[cacheKey] = {
-        "size": fileSize,
-        "mtime": modifiedTime,
-        "durationSec": analyzedDuration,
-        "silenceAtEndSec": analyzedSilenceAtEnd,
-        "nonSilentStartSec": analyzedNonSilentStart,
+    lookupStartTime = time.perf_counter()
+    normalizedPath, fileSize, modifiedTime = StatSongFile(mp3Path)
+    validator = (fileSize, modifiedTime)
+
+    memoryEntry = analysisMemoryCache.Get(normalizedPath, validator)
+    if memoryEntry is not None:
+        analysisLookupSeconds.Observe(time.perf_counter() - lookupStartTime, ("memory",))
+        return dict(memoryEntry), True
+
+    cachedEntry = store.Get(normalizedPath, fileSize, modifiedTime)
+    if cachedEntry is not None:
+        analysis = _transitionAnalysisFromRecord(cachedEntry)
+        analysisMemoryCache.Put(normalizedPath, validator, analysis, ANALYSIS_MEMORY_ENTRY_BYTES)
+        analysisLookupSeconds.Observe(time.perf_counter() - lookupStartTime, ("store",))
+        return dict(analysis), True
+
+    record = _AnalyzeAndStore(normalizedPath, fileSize, modifiedTime, store)
+    analysisLookupSeconds.Observe(time.perf_counter() - lookupStartTime, ("analyzed",))
+    return _transitionAnalysisFromRecord(record), False
+
+
+def DecodeTrack(mp3Path):
+    """
+    Decode a song once, at its native rate, into float32 samples shaped (frames, channels)
+    in [-1, 1]. Returns (samples, sampleRate).
+    """
+    audio, sampleRate = librosa.load(mp3Path, sr=None, mono=False)
+    return np.atleast_2d(audio).T, sampleRate
+
+
+def _QuantizeSamples(samples):
+    # Back to the 16 bit scale pydub decoded to, so silence thresholds and peaks keep their meaning.
+    return np.clip(np.round(samples * PCM16_MAX_AMPLITUDE), -PCM16_MAX_AMPLITUDE, PCM16_MAX_AMPLITUDE - 1).astype(np.int16)
+
+
+def AnalyzeTrackFeatures(normalizedPath, fileSize, modifiedTime, mode=None, stageSeconds=None):
+    """
+    The analysis pass of a track: decode it once and derive every per-track feature from
+    that buffer. Also writes the waveform peaks file. mode is the beat analysis mode.
+    Returns (record, beatGrid) for StoreTrackFeatures, where record is
+    {
+      "featuresVersion": int,
+      "durationSec", "silenceAtEndSec", "nonSilentStartSec", "silenceThresholdInDbfs": float,
+      "bpm": float,
+      "loudnessLufs": float or None,   # BS.1770 integrated loudness
+      "key": str or None, "camelot": str or None, "keyConfidence": float or None,
+      "chroma": [12 floats]            # mean chroma, C first, loudest bin 1.0
+    }
+    and beatGrid is None when the tempo came from a confident fast estimate.
+    When given, the stageSeconds dict receives the wall time of each stage (decode, silence,
+    peaks, beats, loudness, key) for the caller to report with ObserveAnalysisStages.
+    """
+    stageTimer = StageTimer(stageSeconds)
+    with stageTimer.Stage("decode"):
+        samples, sampleRate = DecodeTrack(normalizedPath)
+    durationMs = round(1000 * len(samples) / sampleRate)
+
+    pcmSamples = _QuantizeSamples(samples)
+    with stageTimer.Stage("silence"):
+        silenceAnalysis = AnalyzeSilenceFromSamples(pcmSamples, sampleRate, PCM16_MAX_AMPLITUDE, durationMs)
+    with stageTimer.Stage("peaks"):
+        try:
+            SavePeaks(normalizedPath, fileSize, modifiedTime, pcmSamples, sampleRate, PCM16_MAX_AMPLITUDE)
+        except OSError as e:
+            mainLogger.warning("Could not write waveform peaks for %s: %s", normalizedPath, e)
+    del pcmSamples
+
+    monoSamples = samples.mean(axis=1)
+    with stageTimer.Stage("beats"):
+        tempo, beatGrid = AnalyzeTempoFromSamples(monoSamples, sampleRate, mode)
+    with stageTimer.Stage("loudness"):
+        loudnessLufs = ComputeIntegratedLoudness(samples, sampleRate)
+    with stageTimer.Stage("key"):
+        chroma = librosa.feature.chroma_stft(y=monoSamples, sr=sampleRate).mean(axis=1)
+        if chroma.max() > 0:
+            chroma = chroma / chroma.max()
+        keyEstimate = EstimateKey(chroma) or {"key": None, "camelot": None, "keyConfidence": None}
+
+    record = {
+        "featuresVersion": FEATURES_VERSION,
+        "durationSec": silenceAnalysis["durationSec"],
+        "silenceAtEndSec": silenceAnalysis["silenceAtEndSec"],
+        "nonSilentStartSec": silenceAnalysis["nonSilentStartSec"],
         "silenceThresholdInDbfs": silenceThresholdInDbfs,
+        "bpm": float(tempo),
+        "loudnessLufs": loudnessLufs,
+        "chroma": [round(float(value), 4) for value in chroma],
+        **keyEstimate,
     }
-    _saveAnalysisCache(cacheFilePath, cache)
+    return record, beatGrid
+
+
+def StoreTrackFeatures(store, rows):
+    """
+    Persist feature records and beat grids, each track's in the same transaction, and
+    refresh the in-process transition cache.
+    rows: iterable of (normalizedPath, fileSize, modifiedTime, record, beatGrid).
+    """
+    rows = list(rows)
+    store.UpsertTrackFeatures([
+        (normalizedPath, fileSize, modifiedTime, record, None if beatGrid is None else EncodeBeatGrid(beatGrid))
+        for normalizedPath, fileSize, modifiedTime, record, beatGrid in rows
+    ])
+    for normalizedPath, fileSize, modifiedTime, record, _ in rows:
+        analysisMemoryCache.Put(
+            normalizedPath, (fileSize, modifiedTime), _transitionAnalysisFromRecord(record), ANALYSIS_MEMORY_ENTRY_BYTES
+        )
+
+
+def _AnalyzeAndStore(normalizedPath, fileSize, modifiedTime, store, mode=None):
+    stageSeconds = {}
+    record, beatGrid = AnalyzeTrackFeatures(normalizedPath, fileSize, modifiedTime, mode, stageSeconds)
+    ObserveAnalysisStages(stageSeconds)
+    StoreTrackFeatures(store, [(normalizedPath, fileSize, modifiedTime, record, beatGrid)])
+    return record
+
+
+def GetTrackFeatures(songPath, store=None, mode=None):
+    """
+    Feature record of a song (see AnalyzeTrackFeatures). Songs without a record, changed
+    since, or analyzed by an older pipeline are analyzed and stored first.
+    """
+    store = store or GetDefaultAnalysisStore()
+    mp3Path = GetMP3FromFile(songPath)
+    if mp3Path is None:
+        raise ValueError(f"Unsupported audio extension for songPath={songPath}")
+
+    normalizedPath, fileSize, modifiedTime = StatSongFile(mp3Path)
+    record = store.Get(normalizedPath, fileSize, modifiedTime)
+    if record is None or record.get("featuresVersion") != FEATURES_VERSION:
+        record = _AnalyzeAndStore(normalizedPath, fileSize, modifiedTime, store, mode)
+    return record
 
+
+def GetSongsWithoutFeatures(songPaths, store=None):
+    """
+    The songs of songPaths without a current feature record, in order.
+    """
+    store = store or GetDefaultAnalysisStore()
+    statsByPath = {}
+    for songPath in songPaths:
+        try:
+            statsByPath[songPath] = StatSongFile(songPath)
+        except OSError:
+            continue
+
+    records = store.GetMany(statsByPath.values())
+    return [
+        songPath for songPath, (normalizedPath, _, _) in statsByPath.items()
+        if records.get(normalizedPath, {}).get("featuresVersion") != FEATURES_VERSION
+    ]
+
+
+_peaksDecodeSemaphore = threading.BoundedSemaphore(PEAKS_DECODE_CONCURRENCY)
+
+def GetPeaksFile(songPath):
+    """
+    Path of the waveform peaks file of a song. Songs analyzed before peaks existed, or
+    changed since, are decoded once for their peaks only; their feature record is left to
+    the ingest pipeline, so a request never pays for beat, loudness and key analysis.
+    """
+    mp3Path = GetMP3FromFile(songPath)
+    if mp3Path is None:
+        raise ValueError(f"Unsupported audio extension for songPath={songPath}")
+
+    normalizedPath, fileSize, modifiedTime = StatSongFile(mp3Path)
+    peaksPath = GetFreshPeaksPath(normalizedPath, fileSize, modifiedTime)
+    if peaksPath is None:
+        with _peaksDecodeSemaphore:
+            # A concurrent request for the same track may have written it while this one waited.
+            peaksPath = GetFreshPeaksPath(normalizedPath, fileSize, modifiedTime)
+            if peaksPath is None:
+                samples, sampleRate = DecodeTrack(normalizedPath)
+                peaksPath = SavePeaks(normalizedPath, fileSize, modifiedTime, _QuantizeSamples(samples), sampleRate, PCM16_MAX_AMPLITUDE)
+    return peaksPath
+
+
+def GetCachedTransitionAnalyses(songPaths, store=None):
+    """
+    Bulk lookup for a whole playlist without decoding anything.
+    Returns {songPath: analysis} for songs with a fresh cached analysis.
+    """
+    store = store or GetDefaultAnalysisStore()
+    statsByPath = {}
+    for songPath in songPaths:
+        try:
+            statsByPath[songPath] = StatSongFile(songPath)
+        except OSError:
+            continue
+
+    records = store.GetMany(statsByPath.values())
     return {
-        "durationSec": analyzedDuration,
-        "silenceAtEndSec": analyzedSilenceAtEnd,
-        "nonSilentStartSec": analyzedNonSilentStart,
+        songPath: _transitionAnalysisFromRecord(records[normalizedPath])
+        for songPath, (normalizedPath, _, _) in statsByPath.items()
+        if normalizedPath in records
     }
 
 
+
+def GetBeatGrid(songPath, store=None):
+    """
+    Stored beat grid of a song, {"beats", "downbeats", "phrases"} as float32 second arrays,
+    or None when ingest has not computed one for this file version. Never decodes audio.
+    """
+    mp3Path = GetMP3FromFile(songPath)
+    if mp3Path is None:
+        return None
+    store = store or GetDefaultAnalysisStore()
+    try:
+        normalizedPath, fileSize, modifiedTime = StatSongFile(mp3Path)
+    except OSError:
+        return None
+    record = store.GetBeatGrid(normalizedPath, fileSize, modifiedTime)
+    if record is None:
+        return None
+    return DecodeBeatGrid(record)
+
 # Beat/tempo match
 # Align BPM (or time-stretch slightly) so kicks/snare grids line up.
 
@@ -281,47 +692,119 @@ def AnalyzeSongForTransitionWithCache(songPath, cacheFilePath=ANALYSIS_CACHE_FIL
 # Silence detection thresholds can misclassify quiet intros/outros.
 # Loading full audio each time may be expensive.
 
-# Use AnalyzeSongForTransitionWithCache
-# caching analysis results (duration, end silence, non-silent start) per file so you decode once per track, not per transition.
+# Transitions are computed from AnalyzeSongForTransitionWithCache results, so
+# each track is decoded once per file version, not once per transition.
+def CalculateTransitionFromAnalysis(currentAnalysis, nextAnalysis):
+    """
+    Compute where the next song starts (seconds into the current song) from
+    two cached analyses. Pure function, no audio decoding.
+    """
+    silenceAtEndDuration = max(0.0, float(currentAnalysis["silenceAtEndSec"]))
+    currentSongDuration = max(0.0, float(currentAnalysis["durationSec"]))
+    nextSongLeadInSilenceSec = max(0.0, float(nextAnalysis["nonSilentStartSec"]))
+
+    rawCrossfade = silenceAtEndDuration + nextSongLeadInSilenceSec
+    crossfade = max(MIN_CROSSFADE_SECONDS, min(MAX_CROSSFADE_SECONDS, rawCrossfade))
+    crossfade = min(crossfade, currentSongDuration)
+    nextSongStartTimeSec = max(0.0, currentSongDuration - crossfade)
+
+    # Fallback for very short or problematic tracks.
+    if currentSongDuration == 0.0:
+        nextSongStartTimeSec = 0.0
+    elif rawCrossfade <= 0.0:
+        crossfade = min(max(DEFAULT_CROSSFADE_SECONDS, MIN_CROSSFADE_SECONDS), currentSongDuration)
+        nextSongStartTimeSec = max(0.0, currentSongDuration - crossfade)
+
+    mainLogger.debug(
+        "currentSongDuration=%.3fs, silenceAtEnd=%.3fs, nextSongLeadInSilenceSec=%.3fs, rawCrossfade=%.3fs, crossfade=%.3fs, nextSongStartTimeSec=%.3fs",
+        currentSongDuration, silenceAtEndDuration, nextSongLeadInSilenceSec, rawCrossfade, crossfade, nextSongStartTimeSec,
+    )
+
+    return nextSongStartTimeSec
+
+
+def AlignTransitionToPhrase(nextSongStartTimeSec, currentSongDurationSec, currentBeatGrid, nextBeatGrid=None):
+    """
+    Move a transition so the next song's first downbeat lands on a phrase start of the
+    current song, or on a downbeat when no phrase start fits. The overlap stays within
+    MIN_CROSSFADE_SECONDS..MAX_CROSSFADE_SECONDS. Pure index lookups into the stored grids.
+    Returns the aligned nextSongStartTimeSec, or None when nothing fits.
+    """
+    if currentBeatGrid is None:
+        return None
+
+    nextEntrySec = 0.0
+    if nextBeatGrid is not None and len(nextBeatGrid["downbeats"]):
+        nextEntrySec = float(nextBeatGrid["downbeats"][0])
+
+    # Starting the next song at t puts its first downbeat at t + nextEntrySec.
+    earliestSec = max(nextEntrySec, currentSongDurationSec - MAX_CROSSFADE_SECONDS + nextEntrySec)
+    latestSec = currentSongDurationSec - MIN_CROSSFADE_SECONDS + nextEntrySec
+    targetSec = nextSongStartTimeSec + nextEntrySec
+    for boundaries in (currentBeatGrid["phrases"], currentBeatGrid["downbeats"]):
+        boundarySec = FindNearestTime(boundaries, targetSec, earliestSec, latestSec)
+        if boundarySec is not None:
+            return boundarySec - nextEntrySec
+    return None
+
+
+def PlanTransition(currentSong, nextSong, store=None):
+    """
+    Build the transition between two songs from cached per-track analysis.
+    The silence based start is snapped to the current song's phrase grid when ingest
+    stored beat grids; without them it is used as is.
+    Raises on unsupported or unreadable files.
+    Returns:
+    {
+      "nextSongStartTimeSec": float,
+      "currentSongDurationSec": float,
+      "overlapSeconds": float,
+      "phraseAligned": bool,
+      "cacheHit": bool   # True when neither song had to be decoded
+    }
+    """
+    currentAnalysis, currentCacheHit = AnalyzeSongForTransitionWithCacheStatus(currentSong, store)
+    nextAnalysis, nextCacheHit = AnalyzeSongForTransitionWithCacheStatus(nextSong, store)
+
+    nextSongStartTimeSec = CalculateTransitionFromAnalysis(currentAnalysis, nextAnalysis)
+    currentSongDurationSec = float(currentAnalysis["durationSec"])
+
+    alignedStartTimeSec = AlignTransitionToPhrase(
+        nextSongStartTimeSec, currentSongDurationSec, GetBeatGrid(currentSong, store), GetBeatGrid(nextSong, store)
+    )
+    if alignedStartTimeSec is not None:
+        nextSongStartTimeSec = alignedStartTimeSec
+
+    return {
+        "nextSongStartTimeSec": nextSongStartTimeSec,
+        "currentSongDurationSec": currentSongDurationSec,
+        "overlapSeconds": max(0.0, currentSongDurationSec - nextSongStartTimeSec),
+        "phraseAligned": alignedStartTimeSec is not None,
+        "cacheHit": currentCacheHit and nextCacheHit,
+    }
+
+
 def CalculateTransition(currentSong,nextSong):
     currentMp3 = GetMP3FromFile(currentSong)
     nextMp3 = GetMP3FromFile(nextSong)
 
     if currentMp3 is None or nextMp3 is None:
         mainLogger.warning(
-            f"CalculateTransition fallback: unsupported audio extension. currentSong={currentSong}, nextSong={nextSong}"
+            "CalculateTransition fallback: unsupported audio extension. currentSong=%s, nextSong=%s", currentSong, nextSong
         )
         return 0.0
 
     try:
-        currentDeckSong = AudioSegment.from_file(currentMp3)
-        silenceAtEndDuration = max(0.0, GetSilenceAtEndDuration(currentDeckSong))
-        currentSongDuration = max(0.0, GetSongDuration(currentDeckSong))
-
-        nextDeckSong = AudioSegment.from_file(nextMp3)
-        nextSongLeadInSilenceSec = max(0.0, GetNonSilentStartTime(nextDeckSong))
+        transition = PlanTransition(currentMp3, nextMp3)
     except Exception as e:
         mainLogger.warning(
-            f"CalculateTransition fallback due to analysis error. currentSong={currentSong}, nextSong={nextSong}, error={e}"
+            "CalculateTransition fallback due to analysis error. currentSong=%s, nextSong=%s, error=%s", currentSong, nextSong, e
         )
         return 0.0
 
-    rawCrossfade = silenceAtEndDuration + nextSongLeadInSilenceSec
-    crossfade = max(MIN_CROSSFADE_SECONDS, min(MAX_CROSSFADE_SECONDS, rawCrossfade))
-    crossfade = min(crossfade, currentSongDuration)
-    nextSongStartTimeSec = max(0.0, currentSongDuration - crossfade)
-
-    # Fallback for very short or problematic tracks.
-    if currentSongDuration == 0.0:
-        nextSongStartTimeSec = 0.0
-    elif rawCrossfade <= 0.0:
-        crossfade = min(max(DEFAULT_CROSSFADE_SECONDS, MIN_CROSSFADE_SECONDS), currentSongDuration)
-        nextSongStartTimeSec = max(0.0, currentSongDuration - crossfade)
-
     mainLogger.debug(
-        f"currentSong={os.path.basename(currentSong)}, nextSong={os.path.basename(nextSong)}, "
-        f"currentSongDuration={currentSongDuration:.3f}s, silenceAtEnd={silenceAtEndDuration:.3f}s, "
-        f"nextSongLeadInSilenceSec={nextSongLeadInSilenceSec:.3f}s, rawCrossfade={rawCrossfade:.3f}s, crossfade={crossfade:.3f}s, nextSongStartTimeSec={nextSongStartTimeSec:.3f}s"
+        "currentSong=%s, nextSong=%s, nextSongStartTimeSec=%.3fs, cacheHit=%s",
+        os.path.basename(currentSong), os.path.basename(nextSong), transition["nextSongStartTimeSec"], transition["cacheHit"],
     )
 
-    return nextSongStartTimeSec
+    return transition["nextSongStartTimeSec"]
@@ -0,0 +1,62 @@
+import numpy as np
+
+BEATS_PER_BAR = 4
+PHRASE_BARS = 8
+# Beat grids are stored as packed little-endian float32 seconds: 4 bytes per beat,
+# exact to well under a millisecond for any track length that matters.
+BEAT_TIME_DTYPE = np.dtype("<f4")
+
+def EncodeTimes(times):
+    return np.asarray(times, dtype=BEAT_TIME_DTYPE).tobytes()
+
+def DecodeTimes(data):
+    if not data:
+        return np.zeros(0, dtype=BEAT_TIME_DTYPE)
+    return np.frombuffer(data, dtype=BEAT_TIME_DTYPE)
+
+def EmptyBeatGrid():
+    empty = np.zeros(0, dtype=BEAT_TIME_DTYPE)
+    return {"beats": empty, "downbeats": empty, "phrases": empty}
+
+def ComputeBeatGrid(beatTimes, beatStrengths):
+    """
+    Downbeats and phrase starts from a beat track, assuming 4/4 and 8 bar phrases.
+    The downbeat phase is the one of the BEATS_PER_BAR phases whose beats have the
+    strongest onsets on average; phrases start every PHRASE_BARS bars from the first downbeat.
+    Returns {"beats", "downbeats", "phrases"} as float32 second arrays.
+    """
+    beatTimes = np.asarray(beatTimes, dtype=BEAT_TIME_DTYPE)
+    beatStrengths = np.asarray(beatStrengths, dtype=np.float64)
+    if len(beatTimes) == 0:
+        return EmptyBeatGrid()
+
+    phaseCount = min(BEATS_PER_BAR, len(beatTimes))
+    phaseStrengths = [beatStrengths[phase::BEATS_PER_BAR].mean() for phase in range(phaseCount)]
+    downbeats = beatTimes[int(np.argmax(phaseStrengths))::BEATS_PER_BAR]
+    return {
+        "beats": beatTimes,
+        "downbeats": downbeats,
+        "phrases": downbeats[::PHRASE_BARS],
+    }
+
+def FindNearestTime(times, targetSec, earliestSec, latestSec):
+    """
+    The entry of the sorted times array closest to targetSec within [earliestSec, latestSec],
+    or None. Two binary searches, so it costs the same for any track length.
+    """
+    lower = int(np.searchsorted(times, earliestSec, side="left"))
+    upper = int(np.searchsorted(times, latestSec, side="right"))
+    if lower >= upper:
+        return None
+    index = int(np.searchsorted(times, targetSec, side="left"))
+    candidates = [times[candidate] for candidate in (index - 1, index) if lower <= candidate < upper]
+    if not candidates:
+        # targetSec lies outside the window: the closest entry is at the window's edge.
+        candidates = [times[lower], times[upper - 1]]
+    return float(min(candidates, key=lambda candidate: abs(candidate - targetSec)))
+
+def EncodeBeatGrid(beatGrid):
+    return {name: EncodeTimes(beatGrid[name]) for name in ("beats", "downbeats", "phrases")}
+
+def DecodeBeatGrid(record):
+    return {name: DecodeTimes(record[name]) for name in ("beats", "downbeats", "phrases")}
@@ -1,11 +1,23 @@
 from Core.FileHandling import currentSongFile, GetCurrentSongAndPosition, GetSongData, songsListFile, SubSetFromKey
 from Core.FileHandling import DeleteFile, GetDirectory, SaveDirectory, ListFilesInFolderRecursively, ListOfSongsPlayed
 from Core.FileHandling import SaveToJson, songBeatsFile
-from Core.PatternGeneration import FirstGenerativePattern, Pattern
+from Core.PatternGeneration import Pattern, PlaylistEngine
 from Core.UI import SelecDirectory
-from Core.AudioProcessing import ConvertM4AtoMp3, CalculateBeats
+from Core.AudioProcessing import ConvertM4AFilesToMp3, GetSongsWithoutFeatures
+from Core.LibraryScanner import libraryScanner
+from Core.LibraryIngest import IngestBeats, IngestCancelled, featureUpgrader
+from extractTrackMetaData import index_track_metadata
 import os
 
+# Runs concatenated into one playlist (songs already in an earlier run keep their place).
+PLAYLIST_RUN_PATTERNS = (
+    Pattern.PATTERN_ASCENDING,
+    Pattern.PATTERN_DESCENDING,
+    Pattern.PATTERN_ASCENDING,
+    Pattern.PATTERN_DESCENDING,
+    Pattern.PATTERN_ASCENDING,
+)
+
 def GetPreviousSessionSongs(jsonFile=currentSongFile):
     # currentSongPath, resumePosition = GetCurrentSongAndPosition(currentSongFile)
     # listOfSongsGeneratedInPreviousCycle = GetSongData(songsListFile)
@@ -20,8 +32,23 @@ def GetPreviousSessionSongs(jsonFile=currentSongFile):
         raise ValueError("currentSongPath not found")
     return subsetList
 
+def _reportProgress(progressCallback, phase, done=0, total=0):
+    if progressCallback is not None:
+        progressCallback(phase, done, total)
+
+def _checkCancelled(cancelEvent):
+    if cancelEvent is not None and cancelEvent.is_set():
+        raise IngestCancelled()
+
 #TODO pack FirstGenerativePattern in one function -> better set time in hours 
-def CreateNewListOfSongs():
+def CreateNewListOfSongs(progressCallback=None, cancelEvent=None):
+    """
+    Scan the library, analyze new songs and generate a new playlist.
+    progressCallback(phase, done, total) is called as the build advances; phases are
+    "scanning", "converting", "analyzing", "indexing" and "generating". Setting cancelEvent
+    aborts the build between steps with IngestCancelled.
+    """
+    _reportProgress(progressCallback, "scanning")
     DeleteFile(songsListFile)
 
     folderPath = GetDirectory()
@@ -33,38 +60,53 @@ def CreateNewListOfSongs():
         raise ValueError("Do not use ttinker to ask for directory because it is being in the main")
         folderPath = SelecDirectory()
         SaveDirectory(folderPath)
-    ConvertM4AtoMp3(folderPath)
-    songPaths = ListFilesInFolderRecursively(folderPath)
+    scanResult = libraryScanner.Scan(folderPath)
+    _checkCancelled(cancelEvent)
+    _reportProgress(progressCallback, "converting", 0, len(scanResult.m4aFilesWithoutMp3))
+    convertedSongs = ConvertM4AFilesToMp3(scanResult.m4aFilesWithoutMp3)
+    _checkCancelled(cancelEvent)
+    songPaths = scanResult.mp3Files + convertedSongs
     songData = GetSongData()
     songsPlayed = ListOfSongsPlayed()
 
     # For song list in the give directory tha end with .mp3 and are not in songData calculate Beats
-    for song in songPaths:
-        if not song.endswith(".mp3"):# TODO check if song name in .m4a is in .mp3 if not convert it 
-            continue 
-        if song not in songData:
-            floatBeats = CalculateBeats(song)
-            beats = round(floatBeats[0])
-            songData[song] = beats
+    # TODO check if song name in .m4a is in .mp3 if not convert it
+    newSongs = [song for song in songPaths if song.endswith(".mp3") and song not in songData]
+    # Known songs the scanner saw added or rewritten need a current feature record now; the
+    # rest of the library is upgraded to a new FEATURES_VERSION by featureUpgrader, off the build.
+    touchedSongs = set(scanResult.added) | set(scanResult.changed)
+    newSongs += GetSongsWithoutFeatures(
+        [song for song in songPaths if song in touchedSongs and song.endswith(".mp3") and song in songData]
+    )
+    _reportProgress(progressCallback, "analyzing", 0, len(newSongs))
+    IngestBeats(
+        newSongs,
+        songData,
+        progressCallback=lambda done, total, _: _reportProgress(progressCallback, "analyzing", done, total),
+        cancelEvent=cancelEvent,
+    )
+    _reportProgress(progressCallback, "indexing", 0, len(songPaths))
+    index_track_metadata(songPaths)
+    _checkCancelled(cancelEvent)
+    _reportProgress(progressCallback, "generating")
 
     SaveToJson(songData, filename=songBeatsFile) # update list to json
 
+    songsPlayed = set(songsPlayed)
     songDataClean = {}
     for song,beat in songData.items():
         if song not in songsPlayed:
             songDataClean[song]=beat
 
-    sortedSongsDict = FirstGenerativePattern(songDataClean)
-    sortedSongsDict2 = FirstGenerativePattern(songDataClean,Pattern.PATTERN_DESCENDING)
-    sortedSongsDict3 = FirstGenerativePattern(songDataClean,Pattern.PATTERN_ASCENDING)
-    sortedSongsDict4= FirstGenerativePattern(songDataClean,Pattern.PATTERN_DESCENDING)
-    sortedSongsDict5= FirstGenerativePattern(songDataClean,Pattern.PATTERN_ASCENDING)
-
-    sortedSongsDict.update(sortedSongsDict2)
-    sortedSongsDict.update(sortedSongsDict3)
-    sortedSongsDict.update(sortedSongsDict4)
-    sortedSongsDict.update(sortedSongsDict5)
+    # One engine for all five runs: the library is sorted once, not once per run.
+    playlistEngine = PlaylistEngine(songDataClean, GetSongData(songsListFile))
+    sortedSongsDict = {}
+    for pattern in PLAYLIST_RUN_PATTERNS:
+        sortedSongsDict.update(playlistEngine.Generate(pattern))
     SaveToJson(sortedSongsDict,songsListFile)
     sortedSongs = list(sortedSongsDict.keys())
 
+    analyzedSongs = set(newSongs)
+    featureUpgrader.Start([song for song in songPaths if song.endswith(".mp3") and song not in analyzedSongs])
+
     return sortedSongs
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import json
+import tempfile
 
 from Core.Utilities import SubSetFromKey
 
@@ -9,6 +10,16 @@ songsPlayedFile = os.path.join(scriptDir, '../ConfigurationFiles', 'songsPlayed.
 directoryFile = os.path.join(scriptDir, '../ConfigurationFiles', 'directory.json')
 currentSongFile = os.path.join(scriptDir, '../ConfigurationFiles', 'currentSong.json')
 songsListFile = os.path.join(scriptDir, '../ConfigurationFiles', 'songsList.json')
+analysisStoreFile = os.path.join(scriptDir, '../ConfigurationFiles', 'analysisStore.sqlite3')
+libraryManifestFile = os.path.join(scriptDir, '../ConfigurationFiles', 'libraryManifest.json')
+playerStateFile = os.path.join(scriptDir, '../ConfigurationFiles', 'playerState.sqlite3')
+transcodeCacheDirectory = os.path.join(scriptDir, '../ConfigurationFiles', 'transcodeCache')
+hlsCacheDirectory = os.path.join(scriptDir, '../ConfigurationFiles', 'hlsCache')
+peaksCacheDirectory = os.path.join(scriptDir, '../ConfigurationFiles', 'peaks')
+# Lock files and unix sockets of the live mixes; short, since socket paths are limited to about 100 bytes.
+mixRelayDirectory = os.path.join(tempfile.gettempdir(), 'aidjMixRelay')
+# Per-process metric values, merged by whichever worker is scraped.
+metricsDirectory = os.path.join(tempfile.gettempdir(), 'aidjMetrics')
 
 # List Files in folder recursively    
 def ListFilesInFolderRecursively(folderPath):
@@ -48,8 +59,29 @@ def SaveToJson(songData, filename):
         print(f"An error occurred: {e}")
         raise
     
-    with open(filename, "w") as file:
-        json.dump(data, file, indent=4,ensure_ascii=False)
+    WriteJsonAtomically(data, filename, indent=4)
+
+# Write json to a temporary file next to filename and move it into place, so a crash
+# mid-write leaves the previous version instead of a truncated file.
+def WriteJsonAtomically(data, filename, indent=None):
+    directory = os.path.dirname(os.path.abspath(filename))
+    fileDescriptor, tempFilename = tempfile.mkstemp(prefix=f".{os.path.basename(filename)}.", suffix=".tmp", dir=directory)
+    try:
+        try:
+            os.chmod(tempFilename, os.stat(filename).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tempFilename, 0o644)  # mkstemp creates 0600
+        with os.fdopen(fileDescriptor, "w") as file:
+            json.dump(data, file, indent=indent, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tempFilename, filename)
+    except BaseException:
+        try:
+            os.remove(tempFilename)
+        except FileNotFoundError:
+            pass
+        raise
 
 # Delete and Create json file with current song and position
 def DeleteAndCreate(songPath, position, filename=currentSongFile):
@@ -0,0 +1,204 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Core.AudioProcessing import AnalyzeTrackFeatures, StoreTrackFeatures, GetDefaultAnalysisStore, GetSongsWithoutFeatures
+from Core.AnalysisStore import StatSongFile
+from Core.FileHandling import SaveToJson, songBeatsFile, analysisStoreFile
+from Core.Metrics import ObserveAnalysisStages
+from Logging.MainLogger import mainLogger
+
+# 0 or unset means one worker per CPU.
+INGEST_WORKERS = int(os.getenv("AIDJ_INGEST_WORKERS", "0"))
+CHECKPOINT_EVERY_TRACKS = 25
+CHECKPOINT_EVERY_SECONDS = 30.0
+# Background re-analysis of records from an older FEATURES_VERSION stays small, so it never
+# competes with a playlist build for every CPU.
+FEATURE_UPGRADE_WORKERS = int(os.getenv("AIDJ_FEATURE_UPGRADE_WORKERS", "1"))
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+class IngestCancelled(Exception):
+    pass
+
+def GetIngestWorkerCount(workers=None):
+    workers = workers if workers is not None else INGEST_WORKERS
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+    return workers
+
+def _calculateBeatsWorker(songPath):
+    # Runs in a pool process: never raise, the parent decides what to do with failures.
+    try:
+        # Stat first: the record is keyed by the file version that was actually analyzed.
+        normalizedPath, fileSize, modifiedTime = StatSongFile(songPath)
+        # Stage timings travel back with the result: metrics recorded in a pool process would be lost.
+        stageSeconds = {}
+        record, beatGrid = AnalyzeTrackFeatures(normalizedPath, fileSize, modifiedTime, stageSeconds=stageSeconds)
+        return songPath, round(record["bpm"]), (normalizedPath, fileSize, modifiedTime, record, beatGrid), stageSeconds, None
+    except Exception as e:
+        return songPath, None, None, None, repr(e)
+
+def IngestBeats(songPaths, songData, workers=None, checkpointFile=songBeatsFile, progressCallback=None, cancelEvent=None, store=None):
+    """
+    Run the analysis pass (AnalyzeTrackFeatures) on every song in songPaths across a process pool.
+
+    Results are written into songData ({songPath: bpm}) and checkpointed to checkpointFile
+    every CHECKPOINT_EVERY_TRACKS tracks or CHECKPOINT_EVERY_SECONDS seconds, so a crash only
+    loses the work since the last checkpoint. Feature records and beat grids go to the analysis
+    store at the same checkpoints. Songs that fail to analyze are logged and skipped.
+
+    progressCallback(analyzed, total, songPath) is called in the parent after each track.
+    Setting cancelEvent stops scheduling new tracks, checkpoints what finished and raises
+    IngestCancelled; tracks already running in the pool are allowed to finish.
+
+    Returns:
+    {
+      "analyzed": int,
+      "failed": int,
+      "elapsedSec": float,
+      "tracksPerSecond": float,
+      "workers": int
+    }
+    """
+    songPaths = list(songPaths)
+    store = store or GetDefaultAnalysisStore()
+    workers = min(GetIngestWorkerCount(workers), max(len(songPaths), 1))
+    startTime = time.perf_counter()
+    analyzed = 0
+    failed = 0
+    pendingCheckpoint = {}
+    pendingFeatures = []
+    lastCheckpointTime = startTime
+
+    def checkpoint():
+        SaveToJson(pendingCheckpoint, filename=checkpointFile)
+        StoreTrackFeatures(store, pendingFeatures)
+        pendingCheckpoint.clear()
+        pendingFeatures.clear()
+
+    def handleResult(songPath, bpm, features, stageSeconds, error):
+        nonlocal analyzed, failed, lastCheckpointTime
+        if error is not None:
+            failed += 1
+            mainLogger.warning("IngestBeats failed to analyze %s: %s", songPath, error)
+        else:
+            analyzed += 1
+            ObserveAnalysisStages(stageSeconds)
+            songData[songPath] = bpm
+            pendingCheckpoint[songPath] = bpm
+            pendingFeatures.append(features)
+
+        now = time.perf_counter()
+        if len(pendingCheckpoint) >= CHECKPOINT_EVERY_TRACKS or (pendingCheckpoint and now - lastCheckpointTime >= CHECKPOINT_EVERY_SECONDS):
+            checkpoint()
+            lastCheckpointTime = now
+
+        if progressCallback is not None:
+            progressCallback(analyzed + failed, len(songPaths), songPath)
+
+    try:
+        if workers == 1:
+            for songPath in songPaths:
+                if cancelEvent is not None and cancelEvent.is_set():
+                    raise IngestCancelled()
+                handleResult(*_calculateBeatsWorker(songPath))
+        else:
+            # spawn: the API process has running threads, forking it is not safe.
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [executor.submit(_calculateBeatsWorker, songPath) for songPath in songPaths]
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    handleResult(*future.result())
+                    if cancelEvent is not None and cancelEvent.is_set():
+                        for pendingFuture in futures:
+                            pendingFuture.cancel()
+                        raise IngestCancelled()
+    finally:
+        if pendingCheckpoint:
+            checkpoint()
+
+    elapsedSec = time.perf_counter() - startTime
+    tracksPerSecond = (analyzed + failed) / elapsedSec if elapsedSec > 0 else 0.0
+    if songPaths:
+        mainLogger.info(
+            "IngestBeats analyzed %d tracks (%d failed) in %.1fs with %d workers: %.2f tracks/s",
+            analyzed, failed, elapsedSec, workers, tracksPerSecond,
+            durationMs=round(1000 * elapsedSec, 3), tracksPerSecond=round(tracksPerSecond, 3),
+        )
+
+    return {
+        "analyzed": analyzed,
+        "failed": failed,
+        "elapsedSec": elapsedSec,
+        "tracksPerSecond": tracksPerSecond,
+        "workers": workers,
+    }
+
+
+class FeatureUpgrader:
+    """
+    Re-analyzes, in the background, known songs whose feature record is missing or from an
+    older FEATURES_VERSION, so playlist builds only analyze what the scanner reports as new.
+
+    Start(songPaths) returns at once. Each path is checked once per process; one upgrade runs
+    at a time across the uvicorn workers (a flock next to the analysis store), the others skip.
+    """
+
+    def __init__(self, lockFile=f"{analysisStoreFile}.upgrade.lock", workers=FEATURE_UPGRADE_WORKERS):
+        self.lockFile = lockFile
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._checkedPaths = set()
+        self._thread = None
+        self._stopEvent = threading.Event()
+
+    def Start(self, songPaths):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            uncheckedPaths = [songPath for songPath in songPaths if songPath not in self._checkedPaths]
+            if not uncheckedPaths:
+                return False
+            self._thread = threading.Thread(target=self._Run, args=(uncheckedPaths,), name="FeatureUpgrade", daemon=True)
+            self._thread.start()
+            return True
+
+    def Stop(self):
+        self._stopEvent.set()
+
+    def Join(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _Run(self, songPaths):
+        lockDirectory = os.path.dirname(self.lockFile)
+        if lockDirectory:
+            os.makedirs(lockDirectory, exist_ok=True)
+        try:
+            with open(self.lockFile, "a") as lockFile:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        return  # Another worker is upgrading; this one checks again next time.
+                staleSongs = GetSongsWithoutFeatures(songPaths)
+                if staleSongs:
+                    mainLogger.info("Upgrading the feature records of %d songs in the background", len(staleSongs))
+                    IngestBeats(staleSongs, {}, workers=self.workers, cancelEvent=self._stopEvent)
+                with self._lock:
+                    self._checkedPaths.update(songPaths)
+        except IngestCancelled:
+            pass
+        except Exception as e:
+            mainLogger.error("Background feature upgrade failed: %s", e)
+
+featureUpgrader = FeatureUpgrader()
@@ -0,0 +1,235 @@
+import os
+import json
+import threading
+
+from Core.FileHandling import libraryManifestFile
+from Logging.MainLogger import mainLogger
+
+try:
+    from inotify_simple import INotify, flags as inotifyFlags
+except ImportError:  # optional, only needed for watch mode on Linux
+    INotify = None
+    inotifyFlags = None
+
+MANIFEST_VERSION = 1
+SCANNED_EXTENSIONS = (".mp3", ".m4a")
+LIBRARY_WATCH_ENABLED = os.getenv("AIDJ_LIBRARY_WATCH", "0") == "1"
+
+class ScanResult:
+    def __init__(self, files, added, removed, changed, rescannedDirectories):
+        self.files = files  # {path: {"size", "mtime", "inode"}}
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.rescannedDirectories = rescannedDirectories
+
+    @property
+    def mp3Files(self):
+        return sorted(path for path in self.files if path.lower().endswith(".mp3"))
+
+    @property
+    def m4aFilesWithoutMp3(self):
+        return sorted(
+            path for path in self.files
+            if path.lower().endswith(".m4a") and path[:-4] + ".mp3" not in self.files
+        )
+
+    @property
+    def hasChanges(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+class LibraryScanner:
+    """
+    Incremental scanner for the music folder.
+
+    A persisted manifest keeps every directory's mtime and listing plus (size, mtime, inode)
+    of every audio file. Directories whose mtime did not change are not listed again, only
+    their subdirectories are visited. Adding, removing or renaming a file changes the mtime
+    of its directory; in-place rewrites do not, those are picked up by watch mode.
+
+    In watch mode (inotify, optional) a scan with no events since the previous one returns
+    the previous result without touching the disk.
+    """
+
+    def __init__(self, manifestFile=libraryManifestFile):
+        self.manifestFile = manifestFile
+        self._lock = threading.Lock()
+        self._manifest = self._LoadManifest()
+        self._lastResult = None
+        self._lastRoot = None
+        self._watcher = None
+
+    def _LoadManifest(self):
+        try:
+            with open(self.manifestFile, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            if isinstance(manifest, dict) and manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+        except (FileNotFoundError, ValueError):
+            pass
+        return {"version": MANIFEST_VERSION, "root": None, "directories": {}, "files": {}}
+
+    def _SaveManifest(self):
+        manifestDirectory = os.path.dirname(self.manifestFile)
+        if manifestDirectory:
+            os.makedirs(manifestDirectory, exist_ok=True)
+        tempManifestFile = f"{self.manifestFile}.{os.getpid()}.tmp"
+        with open(tempManifestFile, "w", encoding="utf-8") as file:
+            json.dump(self._manifest, file, ensure_ascii=False)
+        os.replace(tempManifestFile, self.manifestFile)
+
+    def Scan(self, folderPath):
+        folderPath = os.path.abspath(folderPath)
+        with self._lock:
+            if self._watcher is not None and self._lastRoot == folderPath:
+                dirtyDirectories = self._watcher.TakeDirtyDirectories()
+                if not dirtyDirectories and self._lastResult is not None:
+                    return ScanResult(self._lastResult.files, [], [], [], [])
+            else:
+                dirtyDirectories = set()
+
+            if self._manifest.get("root") != folderPath:
+                self._manifest = {"version": MANIFEST_VERSION, "root": folderPath, "directories": {}, "files": {}}
+
+            result = self._ScanTree(folderPath, dirtyDirectories)
+            if result.hasChanges or result.rescannedDirectories:
+                self._SaveManifest()
+
+            self._lastResult = result
+            self._lastRoot = folderPath
+            if self._watcher is not None:
+                self._watcher.EnsureWatched(result.rescannedDirectories)
+            elif LIBRARY_WATCH_ENABLED:
+                self.StartWatching(folderPath)
+            return result
+
+    def _ScanTree(self, folderPath, dirtyDirectories):
+        previousDirectories = self._manifest["directories"]
+        previousFiles = self._manifest["files"]
+        directories = {}
+        files = {}
+        rescannedDirectories = []
+        stack = [folderPath]
+
+        while stack:
+            directoryPath = stack.pop()
+            try:
+                directoryMtime = os.stat(directoryPath).st_mtime_ns
+            except OSError:
+                continue
+
+            previous = previousDirectories.get(directoryPath)
+            if previous is not None and previous["mtime"] == directoryMtime and directoryPath not in dirtyDirectories:
+                directories[directoryPath] = previous
+                for name in previous["files"]:
+                    filePath = os.path.join(directoryPath, name)
+                    if filePath in previousFiles:
+                        files[filePath] = previousFiles[filePath]
+                stack.extend(os.path.join(directoryPath, name) for name in previous["subdirectories"])
+                continue
+
+            rescannedDirectories.append(directoryPath)
+            fileNames = []
+            subdirectoryNames = []
+            try:
+                with os.scandir(directoryPath) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectoryNames.append(entry.name)
+                        elif entry.name.lower().endswith(SCANNED_EXTENSIONS) and entry.is_file():
+                            entryStats = entry.stat()
+                            fileNames.append(entry.name)
+                            files[entry.path] = {
+                                "size": entryStats.st_size,
+                                "mtime": entryStats.st_mtime,
+                                "inode": entryStats.st_ino,
+                            }
+            except OSError as e:
+                mainLogger.warning("LibraryScanner could not list %s: %s", directoryPath, e)
+                continue
+
+            directories[directoryPath] = {
+                "mtime": directoryMtime,
+                "files": fileNames,
+                "subdirectories": subdirectoryNames,
+            }
+            stack.extend(os.path.join(directoryPath, name) for name in subdirectoryNames)
+
+        added = [path for path in files if path not in previousFiles]
+        removed = [path for path in previousFiles if path not in files]
+        changed = [path for path, record in files.items() if path in previousFiles and previousFiles[path] != record]
+
+        self._manifest["directories"] = directories
+        self._manifest["files"] = files
+        return ScanResult(files, added, removed, changed, rescannedDirectories)
+
+    def StartWatching(self, folderPath):
+        if INotify is None:
+            mainLogger.warning("Library watch mode requested but inotify_simple is not installed")
+            return False
+        self._watcher = _LibraryWatcher(folderPath, list(self._manifest["directories"].keys()))
+        self._watcher.start()
+        return True
+
+
+class _LibraryWatcher(threading.Thread):
+    """
+    inotify watch on every library directory; collects directories that changed.
+    """
+
+    def __init__(self, folderPath, directories):
+        super().__init__(daemon=True, name="LibraryWatcher")
+        self.folderPath = folderPath
+        self._inotify = INotify()
+        self._watchMask = (
+            inotifyFlags.CREATE | inotifyFlags.DELETE | inotifyFlags.MOVED_FROM | inotifyFlags.MOVED_TO
+            | inotifyFlags.CLOSE_WRITE | inotifyFlags.DELETE_SELF | inotifyFlags.MOVED_SELF
+        )
+        self._directoriesByWatch = {}
+        self._watchedDirectories = set()
+        self._unwatchedDirectories = set()
+        self._dirtyDirectories = set()
+        self._dirtyLock = threading.Lock()
+        for directoryPath in directories:
+            self._AddWatch(directoryPath)
+
+    def _AddWatch(self, directoryPath):
+        if directoryPath in self._watchedDirectories:
+            return
+        try:
+            watchDescriptor = self._inotify.add_watch(directoryPath, self._watchMask)
+            self._directoriesByWatch[watchDescriptor] = directoryPath
+            self._watchedDirectories.add(directoryPath)
+        except OSError as e:
+            # Typically fs.inotify.max_user_watches; these directories always get the mtime check.
+            mainLogger.warning("LibraryWatcher cannot watch %s: %s", directoryPath, e)
+            with self._dirtyLock:
+                self._unwatchedDirectories.add(directoryPath)
+
+    def EnsureWatched(self, directories):
+        for directoryPath in directories:
+            self._AddWatch(directoryPath)
+
+    def TakeDirtyDirectories(self):
+        with self._dirtyLock:
+            dirtyDirectories = self._dirtyDirectories | self._unwatchedDirectories
+            self._dirtyDirectories = set()
+            return dirtyDirectories
+
+    def run(self):
+        while True:
+            for event in self._inotify.read(timeout=1000):
+                directoryPath = self._directoriesByWatch.get(event.wd)
+                if directoryPath is None:
+                    continue
+                with self._dirtyLock:
+                    self._dirtyDirectories.add(directoryPath)
+                if event.mask & inotifyFlags.ISDIR and event.mask & (inotifyFlags.CREATE | inotifyFlags.MOVED_TO):
+                    newDirectoryPath = os.path.join(directoryPath, event.name)
+                    self._AddWatch(newDirectoryPath)
+                    with self._dirtyLock:
+                        self._dirtyDirectories.add(newDirectoryPath)
+
+
+libraryScanner = LibraryScanner()
@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+
+def FileValidator(filePath):
+    """
+    Return (normalizedPath, (size, mtime)) used to revalidate cached entries of a file.
+    """
+    normalizedPath = os.path.abspath(filePath)
+    fileStats = os.stat(normalizedPath)
+    return normalizedPath, (int(fileStats.st_size), float(fileStats.st_mtime))
+
+
+class LruCache:
+    """
+    Bounded in-process LRU cache, limited both by entry count and by total bytes.
+
+    Every entry carries a validator (typically the file's (size, mtime)); a lookup with
+    a different validator is a miss and drops the stale entry. Thread safe.
+    """
+
+    def __init__(self, maxEntries=512, maxBytes=64 * 1024 * 1024):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()  # key -> (validator, value, sizeBytes)
+        self._totalBytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def Get(self, key, validator):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            cachedValidator, value, _ = entry
+            if cachedValidator != validator:
+                self._Remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def Contains(self, key, validator):
+        # Does not count as a lookup and does not refresh the entry's position.
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] == validator
+
+    def Put(self, key, validator, value, sizeBytes=0):
+        with self._lock:
+            if key in self._entries:
+                self._Remove(key)
+            # An entry that alone exceeds the byte budget is not worth evicting everything for.
+            if sizeBytes > self.maxBytes:
+                return
+
+            self._entries[key] = (validator, value, sizeBytes)
+            self._totalBytes += sizeBytes
+
+            while len(self._entries) > self.maxEntries or self._totalBytes > self.maxBytes:
+                oldestKey = next(iter(self._entries))
+                self._Remove(oldestKey)
+                self.evictions += 1
+
+    def Invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._Remove(key)
+                self.invalidations += 1
+
+    def Clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._totalBytes = 0
+
+    def Stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hitRatio": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._totalBytes,
+                "maxEntries": self.maxEntries,
+                "maxBytes": self.maxBytes,
+            }
+
+    def _Remove(self, key):
+        _, _, sizeBytes = self._entries.pop(key)
+        self._totalBytes -= sizeBytes
@@ -0,0 +1,556 @@
+import os
+import json
+import glob
+import math
+import time
+import atexit
+import bisect
+import socket
+import tempfile
+import threading
+
+from Core.FileHandling import metricsDirectory
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Metrics rendered in the Prometheus text format (0.0.4).
+# Recording is a dict update under a per-metric lock; nothing is formatted until a scrape.
+# Once sharing is started (main.py does it in every uvicorn worker), a scrape on any worker
+# asks the other workers for their values over unix sockets in METRICS_DIR and merges them,
+# so /metrics always reports the whole worker group without a per-process label, much like
+# the multiprocess mode of prometheus_client. Between scrapes nothing runs: each worker's
+# thread sits in accept().
+METRICS_ENABLED = os.getenv("AIDJ_METRICS_ENABLED", "1") != "0"
+METRICS_DIR = os.getenv("AIDJ_METRICS_DIR", metricsDirectory)
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+REQUEST_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ANALYSIS_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# How long a scrape waits for another worker's answer before using the values it last wrote.
+METRICS_PEER_TIMEOUT_SECONDS = 2.0
+
+# How the values of the worker processes combine into one series:
+#   sum      every process that ever ran, stopped ones included (counters, histograms),
+#            so totals never go down when a worker restarts
+#   livesum  running processes only (gauges of per-process things: streams, cache entries)
+#   max      running processes only, the largest value (gauges of shared things, read by every worker)
+MULTIPROCESS_MODES = ("sum", "livesum", "max")
+
+def _EscapeLabelValue(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _FormatLabels(labelNames, labelValues, extra=()):
+    pairs = list(zip(labelNames, labelValues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_EscapeLabelValue(value)}"' for name, value in pairs) + "}"
+
+def _FormatValue(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+class _Metric:
+    metricType = "untyped"
+    multiprocessMode = "livesum"
+
+    def __init__(self, name, documentation, labelNames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelNames = tuple(labelNames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _Header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metricType}"]
+
+    def Samples(self):
+        """{labelValues: value} of this process, as written to the shared store."""
+        with self._lock:
+            return dict(self._values)
+
+    def Render(self, samples):
+        lines = self._Header()
+        for labelValues, value in samples.items():
+            lines.append(f"{self.name}{_FormatLabels(self.labelNames, labelValues)} {_FormatValue(value)}")
+        return lines
+
+class Counter(_Metric):
+    metricType = "counter"
+    multiprocessMode = "sum"
+
+    def Inc(self, amount=1.0, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+class Gauge(_Metric):
+    metricType = "gauge"
+
+    def __init__(self, name, documentation, labelNames=(), multiprocessMode="livesum"):
+        super().__init__(name, documentation, labelNames)
+        self.multiprocessMode = multiprocessMode
+
+    def Set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def Inc(self, amount=1.0, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def Dec(self, amount=1.0, labels=()):
+        self.Inc(-amount, labels)
+
+class Histogram(_Metric):
+    metricType = "histogram"
+    multiprocessMode = "sum"
+
+    def __init__(self, name, documentation, labelNames=(), buckets=REQUEST_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelNames)
+        self.buckets = tuple(sorted(buckets))
+
+    def Observe(self, value, labels=()):
+        # Non-cumulative bucket counts; the cumulative form is only built when rendering.
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def Time(self, labels=()):
+        return _HistogramTimer(self, labels)
+
+    def Samples(self):
+        with self._lock:
+            return {labelValues: [list(counts), total] for labelValues, (counts, total) in self._values.items()}
+
+    def Render(self, samples):
+        lines = self._Header()
+        for labelValues, (counts, total) in samples.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bucketLabels = _FormatLabels(self.labelNames, labelValues, (("le", _FormatValue(bound)),))
+                lines.append(f"{self.name}_bucket{bucketLabels} {cumulative}")
+            labelText = _FormatLabels(self.labelNames, labelValues)
+            lines.append(f"{self.name}_sum{labelText} {_FormatValue(total)}")
+            lines.append(f"{self.name}_count{labelText} {cumulative}")
+        return lines
+
+class _HistogramTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.histogram.Observe(time.perf_counter() - self.startTime, self.labels)
+        return False
+
+class CallbackMetric(_Metric):
+    """
+    Metric whose samples are computed by collect() at scrape time, for values other
+    components already keep (cache statistics, listener counts): free until some worker is scraped.
+    collect() returns [(labelValues, value)].
+    """
+
+    def __init__(self, name, documentation, labelNames, collect, metricType="gauge", multiprocessMode=None):
+        super().__init__(name, documentation, labelNames)
+        self.metricType = metricType
+        self.multiprocessMode = multiprocessMode or ("sum" if metricType == "counter" else "livesum")
+        self.collect = collect
+
+    def Samples(self):
+        return {tuple(labelValues): value for labelValues, value in self.collect()}
+
+class DerivedMetric(_Metric):
+    """
+    Gauge computed from the merged samples of other metrics, after the workers' values are
+    combined (a hit ratio cannot be summed). compute(merged) gets {name: {labelValues: value}}
+    and returns [(labelValues, value)]. Never written to the shared store.
+    """
+
+    def __init__(self, name, documentation, labelNames, compute):
+        super().__init__(name, documentation, labelNames)
+        self.metricType = "gauge"
+        self.compute = compute
+
+    def Samples(self):
+        return None
+
+def _MergeSamples(mode, processSamples):
+    """processSamples: [(samples, live)] of one metric. Histogram values are [counts, total]."""
+    merged = {}
+    for samples, live in processSamples:
+        if mode != "sum" and not live:
+            continue
+        for labelValues, value in samples.items():
+            current = merged.get(labelValues)
+            if current is None:
+                merged[labelValues] = [list(value[0]), value[1]] if isinstance(value, list) else value
+            elif isinstance(value, list):
+                current[0] = [a + b for a, b in zip(current[0], value[0])]
+                current[1] += value[1]
+            elif mode == "max":
+                merged[labelValues] = max(current, value)
+            else:
+                merged[labelValues] = current + value
+    return merged
+
+def _EncodeSnapshot(snapshot):
+    return {name: {"mode": mode, "samples": [[list(labelValues), value] for labelValues, value in samples.items()]}
+            for name, (mode, samples) in snapshot.items()}
+
+def _DecodeSnapshot(data):
+    return {name: (entry["mode"], {tuple(labelValues): value for labelValues, value in entry["samples"]})
+            for name, entry in data.items()}
+
+def _WriteJson(data, filename):
+    # Replaced atomically so readers never see half a file; no fsync, it is only kept for archiving.
+    fileDescriptor, tempFilename = tempfile.mkstemp(prefix=f".{os.path.basename(filename)}.", suffix=".tmp",
+                                                    dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(fileDescriptor, "w") as file:
+            json.dump(data, file)
+        os.replace(tempFilename, filename)
+    except BaseException:
+        try:
+            os.remove(tempFilename)
+        except FileNotFoundError:
+            pass
+        raise
+
+def _ReadJson(filename):
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _ArchivedPart(snapshot):
+    # Only "sum" values (counters, histograms) outlive the process; gauges go with it.
+    return {name: entry for name, entry in snapshot.items() if entry[0] == "sum"}
+
+class _SharedMetricsStore:
+    """
+    Per process in directory: process-<id>.lock, held for the process's lifetime (a lock that
+    can be taken belongs to a stopped process); process-<id>.sock, answering each connection
+    with the process's current snapshot; process-<id>.json, its "sum" values as of its last
+    answer or exit. A scrape folds the files of stopped processes into archived.json, so totals
+    never go below what an earlier scrape reported.
+    """
+
+    def __init__(self, directory, processId, snapshot):
+        self.directory = directory
+        self.processId = str(processId)
+        self._snapshot = snapshot
+        os.makedirs(directory, exist_ok=True)
+        self.snapshotPath = self._Path(self.processId, ".json")
+        self.archivePath = os.path.join(directory, "archived.json")
+        self._processLock = open(self._Path(self.processId, ".lock"), "a")
+        if fcntl is not None:
+            fcntl.flock(self._processLock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._lastWritten = None
+        self._writeLock = threading.Lock()
+        self._server = None
+        if hasattr(socket, "AF_UNIX"):
+            socketPath = self._Path(self.processId, ".sock")
+            try:
+                os.remove(socketPath)
+            except FileNotFoundError:
+                pass
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(socketPath)
+            self._server.listen()
+            threading.Thread(target=self._Serve, name="MetricsPeer", daemon=True).start()
+
+    def _Path(self, processId, suffix):
+        return os.path.join(self.directory, f"process-{processId}{suffix}")
+
+    def Write(self, snapshot):
+        archived = _ArchivedPart(snapshot)
+        with self._writeLock:
+            if archived == self._lastWritten:
+                return
+            _WriteJson(_EncodeSnapshot(archived), self.snapshotPath)
+            self._lastWritten = archived
+
+    def _Serve(self):
+        server = self._server
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return  # Closed by Close().
+            try:
+                with connection:
+                    snapshot = self._snapshot()
+                    # What this answer reports is what stays counted if the process dies before the next one.
+                    self.Write(snapshot)
+                    connection.sendall(json.dumps(_EncodeSnapshot(snapshot)).encode("utf-8"))
+            except OSError:
+                pass  # The scraping worker gave up waiting.
+
+    def _Ask(self, processId):
+        """The snapshot of a running process, or None when it does not answer in time."""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.settimeout(METRICS_PEER_TIMEOUT_SECONDS)
+                connection.connect(self._Path(processId, ".sock"))
+                parts = []
+                while True:
+                    part = connection.recv(65536)
+                    if not part:
+                        break
+                    parts.append(part)
+            return _DecodeSnapshot(json.loads(b"".join(parts)))
+        except (OSError, ValueError):
+            return None
+
+    def _IsStopped(self, processId):
+        if fcntl is None:
+            return False
+        try:
+            with open(self._Path(processId, ".lock"), "a") as lockFile:
+                fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+        except BlockingIOError:
+            return False
+
+    def Collect(self, ownSnapshot):
+        """[(snapshot, live)] of every process, this one from memory, stopped ones as one archive."""
+        self.Write(ownSnapshot)
+        with open(os.path.join(self.directory, "metrics.lock"), "a") as directoryLock:
+            # Serializes archiving, so a stopped process is never counted into the archive twice.
+            if fcntl is not None:
+                fcntl.flock(directoryLock, fcntl.LOCK_EX)
+            archive = _DecodeSnapshot(_ReadJson(self.archivePath) or {})
+            processSnapshots = [(ownSnapshot, True)]
+            stopped = []
+            for lockPath in glob.glob(os.path.join(self.directory, "process-*.lock")):
+                processId = os.path.basename(lockPath)[len("process-"):-len(".lock")]
+                if processId == self.processId:
+                    continue
+                if self._IsStopped(processId):
+                    stopped.append(processId)
+                    continue
+                snapshot = self._Ask(processId)
+                if snapshot is None:
+                    # Busy or just starting: its recorded values as of its last answer.
+                    snapshot = _DecodeSnapshot(_ReadJson(self._Path(processId, ".json")) or {})
+                processSnapshots.append((snapshot, True))
+
+            if stopped:
+                for processId in stopped:
+                    for name, (mode, samples) in _DecodeSnapshot(_ReadJson(self._Path(processId, ".json")) or {}).items():
+                        if mode == "sum":
+                            archive[name] = (mode, _MergeSamples(mode, [(archive.get(name, (mode, {}))[1], True), (samples, True)]))
+                _WriteJson(_EncodeSnapshot(archive), self.archivePath)
+                for processId in stopped:
+                    for suffix in (".json", ".sock", ".lock"):
+                        try:
+                            os.remove(self._Path(processId, suffix))
+                        except FileNotFoundError:
+                            pass
+        return processSnapshots + [(archive, False)]
+
+    def Close(self):
+        if self._server is not None:
+            # shutdown() wakes the accept() of the serving thread; close() alone does not on Linux.
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+            self._server = None
+            try:
+                os.remove(self._Path(self.processId, ".sock"))
+            except FileNotFoundError:
+                pass
+        self._processLock.close()
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._store = None
+
+    def Register(self, metric):
+        if metric.multiprocessMode not in MULTIPROCESS_MODES:
+            raise ValueError(f"Unknown multiprocess mode {metric.multiprocessMode} of {metric.name}")
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def Counter(self, name, documentation, labelNames=()):
+        return self.Register(Counter(name, documentation, labelNames))
+
+    def Gauge(self, name, documentation, labelNames=(), multiprocessMode="livesum"):
+        return self.Register(Gauge(name, documentation, labelNames, multiprocessMode))
+
+    def Histogram(self, name, documentation, labelNames=(), buckets=REQUEST_LATENCY_BUCKETS):
+        return self.Register(Histogram(name, documentation, labelNames, buckets))
+
+    def Callback(self, name, documentation, labelNames, collect, metricType="gauge", multiprocessMode=None):
+        return self.Register(CallbackMetric(name, documentation, labelNames, collect, metricType, multiprocessMode))
+
+    def Derived(self, name, documentation, labelNames, compute):
+        return self.Register(DerivedMetric(name, documentation, labelNames, compute))
+
+    def StartSharing(self, directory=METRICS_DIR, processId=None):
+        """
+        Answer the scrapes of the other workers and include theirs in Render(). Nothing is
+        collected or written until some worker is scraped, then once more at exit.
+        """
+        if self._store is not None:
+            return
+        # The start time keeps ids unique when a restarted container reuses a pid.
+        processId = f"{os.getpid()}-{time.time_ns()}" if processId is None else processId
+        self._store = _SharedMetricsStore(directory, processId, lambda: self._Snapshot()[0])
+        atexit.register(self._Flush)
+
+    def StopSharing(self):
+        # The values written here stay, and are archived by the next scrape of another worker.
+        if self._store is not None:
+            self._Flush()
+            self._store.Close()
+            self._store = None
+
+    def _Flush(self):
+        store = self._store
+        if store is not None:
+            store.Write(self._Snapshot()[0])
+
+    def _Snapshot(self):
+        """({name: (mode, samples)} of this process, {name: error} of collectors that failed)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot, errors = {}, {}
+        for metric in metrics:
+            try:
+                samples = metric.Samples()
+            except Exception as e:
+                # One broken collector must not take the whole scrape down.
+                errors[metric.name] = e
+                continue
+            if samples is not None:
+                snapshot[metric.name] = (metric.multiprocessMode, samples)
+        return snapshot, errors
+
+    def Render(self):
+        snapshot, errors = self._Snapshot()
+        store = self._store
+        processSnapshots = store.Collect(snapshot) if store is not None else [(snapshot, True)]
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        merged = {}
+        for metric in metrics:
+            if not isinstance(metric, DerivedMetric):
+                merged[metric.name] = _MergeSamples(
+                    metric.multiprocessMode,
+                    [(processSnapshot[metric.name][1], live) for processSnapshot, live in processSnapshots
+                     if metric.name in processSnapshot],
+                )
+
+        lines = []
+        for metric in metrics:
+            if metric.name in errors:
+                lines.append(f"# {metric.name} failed to collect: {errors[metric.name]!r}")
+                continue
+            try:
+                if isinstance(metric, DerivedMetric):
+                    samples = {tuple(labelValues): value for labelValues, value in metric.compute(merged)}
+                else:
+                    samples = merged[metric.name]
+                lines.extend(metric.Render(samples))
+            except Exception as e:
+                lines.append(f"# {metric.name} failed to collect: {e!r}")
+        return "\n".join(lines) + "\n"
+
+metricsRegistry = MetricsRegistry()
+
+# Analysis pass (Core.AudioProcessing.AnalyzeTrackFeatures), one observation per stage per track.
+analysisStageSeconds = metricsRegistry.Histogram(
+    "aidj_analysis_stage_seconds",
+    "Duration of each stage of the per-track analysis pass (decode, silence, peaks, beats, loudness, key).",
+    ("stage",),
+    ANALYSIS_LATENCY_BUCKETS,
+)
+analysisLookupSeconds = metricsRegistry.Histogram(
+    "aidj_analysis_lookup_seconds",
+    "Transition analysis lookups by the tier that answered them (memory, store, analyzed).",
+    ("tier",),
+    REQUEST_LATENCY_BUCKETS,
+)
+
+class StageTimer:
+    """
+    Collects {stage: seconds} of one run; the dict can cross a process boundary and be
+    observed where the metrics are scraped (see ObserveAnalysisStages).
+    """
+
+    def __init__(self, stageSeconds=None):
+        self.stageSeconds = {} if stageSeconds is None else stageSeconds
+
+    def Stage(self, name):
+        return _StageContext(self.stageSeconds, name)
+
+class _StageContext:
+    def __init__(self, stageSeconds, name):
+        self.stageSeconds = stageSeconds
+        self.name = name
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stageSeconds[self.name] = self.stageSeconds.get(self.name, 0.0) + time.perf_counter() - self.startTime
+        return False
+
+def ObserveAnalysisStages(stageSeconds):
+    for stage, seconds in stageSeconds.items():
+        analysisStageSeconds.Observe(seconds, (stage,))
+
+def RegisterCacheMetrics(caches, registry=None):
+    """
+    Scrape-time metrics over {cacheName: cache}, for any cache whose Stats() reports
+    hits, misses, entries and bytes (LruCache and the caches built on it).
+    """
+    registry = registry or metricsRegistry
+
+    def collect(field):
+        return lambda: [((cacheName,), cache.Stats()[field]) for cacheName, cache in caches.items()]
+
+    def collectLookups():
+        samples = []
+        for cacheName, cache in caches.items():
+            stats = cache.Stats()
+            samples.append(((cacheName, "hit"), stats["hits"]))
+            samples.append(((cacheName, "miss"), stats["misses"]))
+        return samples
+
+    def computeHitRatio(merged):
+        # From the lookups of all workers together; per-process ratios cannot be combined.
+        lookups = merged.get("aidj_cache_lookups_total", {})
+        samples = []
+        for cacheName in caches:
+            hits = lookups.get((cacheName, "hit"), 0.0)
+            total = hits + lookups.get((cacheName, "miss"), 0.0)
+            samples.append(((cacheName,), hits / total if total else 0.0))
+        return samples
+
+    registry.Callback("aidj_cache_lookups_total", "In-memory cache lookups by result.", ("cache", "result"), collectLookups, "counter")
+    registry.Derived("aidj_cache_hit_ratio", "Hits over lookups of all workers since they started.", ("cache",), computeHitRatio)
+    registry.Callback("aidj_cache_entries", "Entries held by the in-memory cache.", ("cache",), collect("entries"))
+    registry.Callback("aidj_cache_bytes", "Approximate bytes held by the in-memory cache.", ("cache",), collect("bytes"))
@@ -1,6 +1,8 @@
 import os
 import random
 
+import numpy as np
+
 from Core.FileHandling import GetSongData,SaveToJson, songsListFile
 
 from enum import Enum
@@ -23,90 +25,104 @@ def GeneratePattern(songData):
     sortedSongs = list(sortedSongPathBeat.keys())
     return sortedSongs
 
-#TODO FirstGenerativePattern does not respect 2.5-7 BPM transition. Need debugging
+MIN_BPM_STEP = 2.5
+MAX_BPM_STEP = 7.0
+# Generation stops once the current BPM is within this margin of the highest BPM.
+STOP_BPM_MARGIN = 5.0
+NUMBER_OF_INITIAL_CANDIDATES = 10
+# Random probes into a BPM window before falling back to listing its unused songs.
+RANDOM_PROBES_PER_STEP = 8
+
+class PlaylistEngine:
+    """
+    BPM-ordered playlist generation over a whole library.
+
+    The library is sorted once into a NumPy BPM array. Each step finds its BPM window
+    with two binary searches and tracks the songs already picked in a boolean bitmap,
+    so a step costs O(log n) and building the engine O(n log n), instead of the
+    O(n) dict scans per step of the old FirstGenerativePattern.
+    """
+
+    def __init__(self, songData, excludedSongs=()):
+        excludedSongs = set(excludedSongs)
+        songs = [(song, float(bpm)) for song, bpm in songData.items() if song not in excludedSongs]
+        songs.sort(key=lambda item: item[1])
+        self.songs = [song for song, _ in songs]
+        self.values = [songData[song] for song in self.songs]
+        self.bpms = np.fromiter((bpm for _, bpm in songs), dtype=np.float64, count=len(songs))
+
+    def __len__(self):
+        return len(self.songs)
+
+    def _PickUnused(self, lower, upper, used, rng):
+        """
+        Random unused index in [lower, upper), or None.
+        """
+        if lower >= upper:
+            return None
+        for _ in range(RANDOM_PROBES_PER_STEP):
+            index = rng.randrange(lower, upper)
+            if not used[index]:
+                return index
+        # Mostly used window: list what is left.
+        unused = np.flatnonzero(~used[lower:upper])
+        if not len(unused):
+            return None
+        return lower + int(unused[rng.randrange(len(unused))])
+
+    def Generate(self, pattern=Pattern.PATTERN_ASCENDING, rng=None):
+        """
+        One playlist run, same rules as FirstGenerativePattern: start at a random song among
+        the NUMBER_OF_INITIAL_CANDIDATES slowest, then repeatedly pick a random unused song
+        between 2.5 and 7 BPM faster (both exclusive). Descending is the same run reversed.
+        Returns {song: bpm} in play order.
+        """
+        rng = rng or random
+        if not self.songs:
+            return {}
+
+        used = np.zeros(len(self.songs), dtype=bool)
+        limitBPM = self.bpms[-1]
+        index = rng.randrange(min(NUMBER_OF_INITIAL_CANDIDATES, len(self.songs)))
+        order = [index]
+        used[index] = True
+        while True:
+            currentBPM = self.bpms[index]
+            if currentBPM + STOP_BPM_MARGIN > limitBPM:
+                break
+            lower = int(np.searchsorted(self.bpms, currentBPM + MIN_BPM_STEP, side="right"))
+            upper = int(np.searchsorted(self.bpms, currentBPM + MAX_BPM_STEP, side="left"))
+            index = self._PickUnused(lower, upper, used, rng)
+            if index is None:
+                break
+            order.append(index)
+            used[index] = True
+
+        if pattern == Pattern.PATTERN_DESCENDING:
+            order.reverse()
+        elif pattern != Pattern.PATTERN_ASCENDING:
+            return None
+        return {self.songs[index]: self.values[index] for index in order}
+
 def FirstGenerativePattern(songData, pattern=Pattern.PATTERN_ASCENDING):
-    
     """
     Generates a playlist from a dictionary of songs with their BPM (Beats Per Minute).
 
-    The function sorts the input songs by BPM, then creates a playlist starting from a random 
-    song among the ten with the lowest BPM. It gradually adds songs to the playlist, ensuring 
-    each subsequent song has a BPM slightly higher (between 2.5 to 7 BPM more) than the last. 
-    The process stops when it reaches the song with the highest BPM in the input or when no 
-    suitable songs are left to maintain the BPM range progression.
+    Songs already in songsList.json are left out. The playlist starts from a random song
+    among the ten with the lowest BPM and each next song is between 2.5 and 7 BPM faster
+    than the last, until the highest BPM is reached or no unused song fits the window.
+    See PlaylistEngine; callers generating several runs from one library should build the
+    engine once instead.
 
     Parameters:
     - songData (dict): A dictionary where keys are song names and values are their BPM.
 
     Returns:
-    - list: A list of song names representing the generated playlist.
-
-    Note:
-    - The function assumes songData contains more than 10 songs; behavior is undefined otherwise.
-    - Uses random selection, so output can vary in different calls.
-    - Includes TODOs for future improvements: checking size of songData and modifying sortedSongsBeat subspan.
+    - dict: {song: bpm} in play order, reversed for PATTERN_DESCENDING.
 
     Example:
     songData = {"Song A": 120, "Song B": 110, ...}
     playlist = FirstGenerativePattern(songData)
     print("Generated Playlist:", playlist)
     """
-    sortedSongsBeat = dict(sorted(songData.items(), key=lambda item: item[1], reverse=False ))
-
-    filteredSongsBeat = None
-    
-    songsToBePlayed = GetSongData(songsListFile)
-    if bool(songsToBePlayed) == True:
-        filteredSongsBeat = {key: value for key, value in sortedSongsBeat.items() if key not in songsToBePlayed}
-    else:
-        filteredSongsBeat = sortedSongsBeat
-    
-
-    _, limitBPM = list(filteredSongsBeat.items())[-1]
-
-
-    #TODO check if dict has more than 10 times
-    numberOfInitiallyItems = 10
-    firstTenTimes = list (filteredSongsBeat.items()) [:numberOfInitiallyItems]
-    randomItem = random.choice(firstTenTimes) 
-    initialSongToBePlayed = {randomItem[0]:randomItem[1]}
-
-    
-    generalDictOfSongsToBePlayed=initialSongToBePlayed
-    keepAdding = True
-    while keepAdding:
-        _, currentBPM = list(generalDictOfSongsToBePlayed.items())[-1]
-        lowerLimitBPM = 2.5 + currentBPM
-        uppperLimitBPM = 7 + currentBPM
-
-        if currentBPM+5>limitBPM:
-            break
-
-        # TODO subspan sortedSongsBeat
-        possiblyNextSongs = {key: value for key, value in filteredSongsBeat.items() if lowerLimitBPM < value < uppperLimitBPM}
-
-        if bool(possiblyNextSongs) == False:
-            break
-
-        for songToBePlayed in generalDictOfSongsToBePlayed.keys():
-            if songToBePlayed in possiblyNextSongs:
-                possiblyNextSongs.pop(songToBePlayed)
-
-        nextSong = random.choice(list(possiblyNextSongs.items()))
-
-        generalDictOfSongsToBePlayed[nextSong[0]] = nextSong[1]
-
-    # for key, value in generalDictOfSongsToBePlayed.items():
-    #     print(f"song: {key}, bpm: {value}")
-
-    itsSongsToBePlayed = None
-    if pattern==Pattern.PATTERN_ASCENDING:
-        itsSongsToBePlayed = generalDictOfSongsToBePlayed
-    elif pattern==Pattern.PATTERN_DESCENDING:
-        itsSongsToBePlayed = dict(reversed(generalDictOfSongsToBePlayed.items()))
-
-    return itsSongsToBePlayed
-
-
-
-
+    return PlaylistEngine(songData, GetSongData(songsListFile)).Generate(pattern)
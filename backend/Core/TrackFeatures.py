@@ -0,0 +1,139 @@
+import numpy as np
+from scipy.signal import sosfilt
+
+# ITU-R BS.1770-4 integrated loudness: K-weighting (a high shelf, then a high pass),
+# 400 ms blocks every 100 ms, an absolute gate at -70 LUFS and a relative gate 10 LU
+# below the absolute-gated loudness. Every channel is weighted 1.0 (mono and stereo music).
+LOUDNESS_BLOCK_SECONDS = 0.4
+LOUDNESS_STEP_SECONDS = 0.1
+LOUDNESS_ABSOLUTE_GATE_LUFS = -70.0
+LOUDNESS_RELATIVE_GATE_LU = -10.0
+LOUDNESS_OFFSET = -0.691
+K_SHELF_FREQUENCY = 1500.0
+K_SHELF_GAIN_DB = 4.0
+K_SHELF_Q = 1.0 / np.sqrt(2.0)
+K_HIGH_PASS_FREQUENCY = 38.0
+K_HIGH_PASS_Q = 0.5
+# The track is filtered and squared this many seconds at a time, so the extra memory is a few
+# MB per ingest worker instead of several float64 copies of the whole track.
+LOUDNESS_CHUNK_SECONDS = 10.0
+
+# Krumhansl-Kessler key profiles, tonic first.
+MAJOR_KEY_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_KEY_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+PITCH_CLASS_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+
+def _KWeightingFilters(sampleRate):
+    # Both biquads are derived for the actual sample rate, so no resampling to 48 kHz is needed.
+    amplitude = 10.0 ** (K_SHELF_GAIN_DB / 40.0)
+    omega = 2.0 * np.pi * K_SHELF_FREQUENCY / sampleRate
+    alpha = np.sin(omega) / (2.0 * K_SHELF_Q)
+    cosine = np.cos(omega)
+    root = 2.0 * np.sqrt(amplitude) * alpha
+    shelf = (
+        [amplitude * ((amplitude + 1) + (amplitude - 1) * cosine + root),
+         -2.0 * amplitude * ((amplitude - 1) + (amplitude + 1) * cosine),
+         amplitude * ((amplitude + 1) + (amplitude - 1) * cosine - root)],
+        [(amplitude + 1) - (amplitude - 1) * cosine + root,
+         2.0 * ((amplitude - 1) - (amplitude + 1) * cosine),
+         (amplitude + 1) - (amplitude - 1) * cosine - root],
+    )
+
+    omega = 2.0 * np.pi * K_HIGH_PASS_FREQUENCY / sampleRate
+    alpha = np.sin(omega) / (2.0 * K_HIGH_PASS_Q)
+    cosine = np.cos(omega)
+    highPass = (
+        [(1 + cosine) / 2.0, -(1 + cosine), (1 + cosine) / 2.0],
+        [1 + alpha, -2.0 * cosine, 1 - alpha],
+    )
+    return shelf, highPass
+
+def _KWeightingSections(sampleRate):
+    # Shelf and high pass as normalized second-order sections, in float32 like the decoded samples.
+    sections = []
+    for numerator, denominator in _KWeightingFilters(sampleRate):
+        sections.append(np.concatenate([numerator, denominator]) / denominator[0])
+    return np.array(sections, dtype=np.float32)
+
+def _BlockPower(samples, sampleRate, blockFrames, stepFrames):
+    """
+    Mean square of every 400 ms block, summed over channels, of the K-weighted samples. The
+    filters run chunk by chunk with their state carried over, and only the running sum of
+    squares at block edges is kept, so memory stays bounded by the chunk, not the track.
+    """
+    frameCount, channelCount = samples.shape
+    blockStarts = np.arange(0, frameCount - blockFrames + 1, stepFrames)
+    # prefix[i] is the sum of squares of frames [0, i); only these i are ever needed.
+    edges = np.union1d(blockStarts, blockStarts + blockFrames)
+    prefix = np.zeros(len(edges))
+
+    sections = _KWeightingSections(sampleRate)
+    filterState = np.zeros((len(sections), 2, channelCount), dtype=np.float32)
+    chunkFrames = max(int(LOUDNESS_CHUNK_SECONDS * sampleRate), 1)
+    runningSum = 0.0
+    edgeIndex = np.searchsorted(edges, 1)  # Edges at frame 0 keep prefix 0.
+    for chunkStart in range(0, frameCount, chunkFrames):
+        chunk = np.asarray(samples[chunkStart:chunkStart + chunkFrames], dtype=np.float32)
+        weighted, filterState = sosfilt(sections, chunk, axis=0, zi=filterState)
+        # Squares are summed over channels per frame, then accumulated in float64.
+        chunkSums = np.cumsum(np.einsum("ij,ij->i", weighted, weighted), dtype=np.float64)
+        chunkEnd = chunkStart + len(chunk)
+        edgeEnd = np.searchsorted(edges, chunkEnd, side="right")
+        prefix[edgeIndex:edgeEnd] = runningSum + chunkSums[edges[edgeIndex:edgeEnd] - chunkStart - 1]
+        edgeIndex = edgeEnd
+        runningSum += chunkSums[-1]
+
+    startPrefix = prefix[np.searchsorted(edges, blockStarts)]
+    endPrefix = prefix[np.searchsorted(edges, blockStarts + blockFrames)]
+    return (endPrefix - startPrefix) / blockFrames
+
+def ComputeIntegratedLoudness(samples, sampleRate):
+    """
+    Integrated loudness in LUFS of float samples shaped (frames, channels) in [-1, 1].
+    Returns None when the track is shorter than one block or entirely below the absolute gate.
+    """
+    blockFrames = int(round(LOUDNESS_BLOCK_SECONDS * sampleRate))
+    stepFrames = int(round(LOUDNESS_STEP_SECONDS * sampleRate))
+    if len(samples) < blockFrames:
+        return None
+
+    blockPower = _BlockPower(samples, sampleRate, blockFrames, stepFrames)
+    with np.errstate(divide="ignore"):
+        blockLoudness = LOUDNESS_OFFSET + 10.0 * np.log10(blockPower)
+    gated = blockPower[blockLoudness > LOUDNESS_ABSOLUTE_GATE_LUFS]
+    if not len(gated):
+        return None
+    relativeGate = LOUDNESS_OFFSET + 10.0 * np.log10(gated.mean()) + LOUDNESS_RELATIVE_GATE_LU
+    gated = blockPower[blockLoudness > max(relativeGate, LOUDNESS_ABSOLUTE_GATE_LUFS)]
+    return float(LOUDNESS_OFFSET + 10.0 * np.log10(gated.mean()))
+
+def CamelotCode(tonic, mode):
+    """
+    Camelot wheel position of a key, e.g. (0, "major") -> "8B", (9, "minor") -> "8A".
+    """
+    relativeMajor = tonic if mode == "major" else (tonic + 3) % 12
+    return f"{(7 * relativeMajor + 7) % 12 + 1}{'B' if mode == 'major' else 'A'}"
+
+def EstimateKey(chroma):
+    """
+    Key of a track from its mean 12-bin chroma (C first), by correlation with the
+    rotated major and minor profiles. Returns {"key", "camelot", "keyConfidence"},
+    keyConfidence being the winning correlation, or None for a flat chroma.
+    """
+    chroma = np.asarray(chroma, dtype=np.float64)
+    if not np.any(chroma) or np.allclose(chroma, chroma[0]):
+        return None
+
+    best = None
+    for mode, profile in (("major", MAJOR_KEY_PROFILE), ("minor", MINOR_KEY_PROFILE)):
+        for tonic in range(12):
+            correlation = float(np.corrcoef(chroma, np.roll(profile, tonic))[0, 1])
+            if best is None or correlation > best[0]:
+                best = (correlation, tonic, mode)
+
+    correlation, tonic, mode = best
+    return {
+        "key": f"{PITCH_CLASS_NAMES[tonic]} {mode}",
+        "camelot": CamelotCode(tonic, mode),
+        "keyConfidence": correlation,
+    }
@@ -0,0 +1,117 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Core.AudioProcessing import PlanTransition
+from Core.MemoryCache import LruCache, FileValidator
+from Logging.MainLogger import mainLogger
+
+PREFETCH_LOOK_AHEAD = int(os.getenv("AIDJ_PREFETCH_LOOK_AHEAD", "2"))
+PREFETCH_WORKERS = int(os.getenv("AIDJ_PREFETCH_WORKERS", "1"))
+# Shared by every session: a few entries per active session, a few hundred bytes each.
+PREFETCHED_TRANSITIONS_LIMIT = int(os.getenv("AIDJ_PREFETCHED_TRANSITIONS_LIMIT", "4096"))
+PREFETCHED_TRANSITION_BYTES = 256
+
+class TransitionPrefetcher:
+    """
+    Analyzes upcoming playlist transitions in the background.
+
+    Schedule() queues (current, current+1), (current+1, current+2), ... up to lookAhead pairs
+    for one listening session. Replacing a session's playlist starts a new generation for that
+    session: its queued work is cancelled and its running work is discarded instead of stored,
+    other sessions are not affected. Prefetched transitions depend only on the two files, so
+    they are shared by all sessions and revalidated against both files' (size, mtime) before
+    being served.
+    """
+
+    def __init__(self, lookAhead=PREFETCH_LOOK_AHEAD, workers=PREFETCH_WORKERS):
+        self.lookAhead = lookAhead
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="TransitionPrefetch")
+        self._transitions = LruCache(PREFETCHED_TRANSITIONS_LIMIT, PREFETCHED_TRANSITIONS_LIMIT * PREFETCHED_TRANSITION_BYTES)
+        # Reentrant: cancelling a future runs its done-callback while Schedule holds the lock.
+        self._lock = threading.RLock()
+        self._nextGeneration = 0
+        # Only sessions with pending work have an entry, so idle sessions cost nothing here.
+        self._sessionGenerations = {}  # sessionId -> generation
+        self._pending = {}  # (sessionId, currentPath, nextPath) -> Future
+
+    def Schedule(self, playlistPaths, currentIndex, playlistReplaced=False, sessionId=None):
+        with self._lock:
+            if playlistReplaced:
+                self._sessionGenerations.pop(sessionId, None)
+                for pendingKey, future in list(self._pending.items()):
+                    if pendingKey[0] == sessionId:
+                        del self._pending[pendingKey]
+                        future.cancel()
+
+            if len(playlistPaths) < 2 or currentIndex < 0:
+                return
+
+            generation = self._sessionGenerations.get(sessionId)
+            for offset in range(self.lookAhead):
+                currentPath = playlistPaths[(currentIndex + offset) % len(playlistPaths)]
+                nextPath = playlistPaths[(currentIndex + offset + 1) % len(playlistPaths)]
+                pendingKey = (sessionId, currentPath, nextPath)
+                if pendingKey in self._pending or self._IsPrefetched(currentPath, nextPath):
+                    continue
+                if generation is None:
+                    self._nextGeneration += 1
+                    generation = self._sessionGenerations[sessionId] = self._nextGeneration
+                future = self._executor.submit(self._Prefetch, sessionId, generation, currentPath, nextPath)
+                self._pending[pendingKey] = future
+                future.add_done_callback(lambda _, pendingKey=pendingKey, future=future: self._Finished(pendingKey, future))
+
+    def _Finished(self, pendingKey, future):
+        with self._lock:
+            if self._pending.get(pendingKey) is future:
+                del self._pending[pendingKey]
+            sessionId = pendingKey[0]
+            if not any(key[0] == sessionId for key in self._pending):
+                self._sessionGenerations.pop(sessionId, None)
+
+    def _IsCurrent(self, sessionId, generation):
+        with self._lock:
+            return self._sessionGenerations.get(sessionId) == generation
+
+    def _Prefetch(self, sessionId, generation, currentPath, nextPath):
+        if not self._IsCurrent(sessionId, generation):
+            return
+        try:
+            validator = self._PairValidator(currentPath, nextPath)
+            transition = PlanTransition(currentPath, nextPath)
+        except Exception as e:
+            mainLogger.warning("TransitionPrefetcher could not analyze %s -> %s: %s", currentPath, nextPath, e)
+            return
+        if not self._IsCurrent(sessionId, generation):
+            return
+        self._transitions.Put((currentPath, nextPath), validator, transition, PREFETCHED_TRANSITION_BYTES)
+
+    def _PairValidator(self, currentPath, nextPath):
+        return FileValidator(currentPath)[1], FileValidator(nextPath)[1]
+
+    def _IsPrefetched(self, currentPath, nextPath):
+        try:
+            return self._transitions.Contains((currentPath, nextPath), self._PairValidator(currentPath, nextPath))
+        except OSError:
+            return False
+
+    def GetTransition(self, currentPath, nextPath):
+        """
+        Return the prefetched PlanTransition result for this pair, or None.
+        """
+        try:
+            validator = self._PairValidator(currentPath, nextPath)
+        except OSError:
+            return None
+        transition = self._transitions.Get((currentPath, nextPath), validator)
+        return dict(transition) if transition is not None else None
+
+    def Stats(self):
+        stats = self._transitions.Stats()
+        with self._lock:
+            stats["pending"] = len(self._pending)
+            stats["sessionsWithPendingWork"] = len(self._sessionGenerations)
+        return stats
+
+
+transitionPrefetcher = TransitionPrefetcher()
@@ -0,0 +1,106 @@
+import os
+import struct
+import hashlib
+import threading
+
+import numpy as np
+
+from Core.FileHandling import peaksCacheDirectory
+
+PEAKS_DIRECTORY = os.getenv("AIDJ_PEAKS_DIR", peaksCacheDirectory)
+PEAKS_BASE_SAMPLES_PER_PEAK = 256
+PEAKS_MAX_LEVELS = 10
+# Coarser levels are not built once a level has this few peaks.
+PEAKS_MIN_PEAK_COUNT = 512
+
+# Peaks file layout, all little endian:
+#   header  magic "AIPK", version u16, levelCount u16, sampleRate u32, sourceSize u64, sourceMtime f64
+#   levels  levelCount x (samplesPerPeak u32, peakCount u32, dataOffset u32)
+#   data    per level, peakCount x (min i8, max i8) of the channel-merged signal
+# Level 0 has PEAKS_BASE_SAMPLES_PER_PEAK samples per peak, every next level twice as many.
+PEAKS_MAGIC = b"AIPK"
+PEAKS_VERSION = 1
+PEAKS_HEADER = struct.Struct("<4sHHIQd")
+PEAKS_LEVEL = struct.Struct("<III")
+PEAKS_FILE_EXTENSION = ".peaks"
+
+def ComputePeakPyramid(samples, maxAmplitude):
+    """
+    Min/max pyramid of a (frames, channels) sample array.
+    Returns [(samplesPerPeak, int8 array shaped (peaks, 2))], finest level first.
+    """
+    if len(samples) == 0:
+        return [(PEAKS_BASE_SAMPLES_PER_PEAK, np.zeros((0, 2), dtype=np.int8))]
+
+    frameMin = samples.min(axis=1)
+    frameMax = samples.max(axis=1)
+    padding = (-len(frameMin)) % PEAKS_BASE_SAMPLES_PER_PEAK
+    if padding:
+        frameMin = np.concatenate([frameMin, np.repeat(frameMin[-1:], padding)])
+        frameMax = np.concatenate([frameMax, np.repeat(frameMax[-1:], padding)])
+    levelMin = frameMin.reshape(-1, PEAKS_BASE_SAMPLES_PER_PEAK).min(axis=1)
+    levelMax = frameMax.reshape(-1, PEAKS_BASE_SAMPLES_PER_PEAK).max(axis=1)
+
+    scale = 127.0 / maxAmplitude if maxAmplitude else 0.0
+    levels = []
+    samplesPerPeak = PEAKS_BASE_SAMPLES_PER_PEAK
+    while True:
+        peaks = np.empty((len(levelMin), 2), dtype=np.int8)
+        peaks[:, 0] = np.clip(np.floor(levelMin * scale), -128, 127)
+        peaks[:, 1] = np.clip(np.ceil(levelMax * scale), -128, 127)
+        levels.append((samplesPerPeak, peaks))
+        if len(levelMin) <= PEAKS_MIN_PEAK_COUNT or len(levels) >= PEAKS_MAX_LEVELS:
+            return levels
+
+        # Each coarser level folds pairs of the previous one; an odd last peak stands alone.
+        if len(levelMin) % 2:
+            levelMin = np.append(levelMin, levelMin[-1])
+            levelMax = np.append(levelMax, levelMax[-1])
+        levelMin = levelMin.reshape(-1, 2).min(axis=1)
+        levelMax = levelMax.reshape(-1, 2).max(axis=1)
+        samplesPerPeak *= 2
+
+def EncodePeaks(levels, frameRate, sourceSize, sourceMtime):
+    offset = PEAKS_HEADER.size + PEAKS_LEVEL.size * len(levels)
+    header = [PEAKS_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, len(levels), int(frameRate), int(sourceSize), float(sourceMtime))]
+    data = []
+    for samplesPerPeak, peaks in levels:
+        header.append(PEAKS_LEVEL.pack(samplesPerPeak, len(peaks), offset))
+        data.append(peaks.tobytes())
+        offset += peaks.nbytes
+    return b"".join(header + data)
+
+def GetPeaksPath(normalizedPath):
+    # One file per track: a changed track overwrites its old peaks instead of leaving them behind.
+    key = hashlib.sha1(normalizedPath.encode("utf-8")).hexdigest()
+    return os.path.join(PEAKS_DIRECTORY, key + PEAKS_FILE_EXTENSION)
+
+def GetFreshPeaksPath(normalizedPath, sourceSize, sourceMtime):
+    """
+    Path of the peaks file of a track if it was computed for this (size, mtime), else None.
+    """
+    peaksPath = GetPeaksPath(normalizedPath)
+    try:
+        with open(peaksPath, "rb") as peaksFile:
+            header = peaksFile.read(PEAKS_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < PEAKS_HEADER.size:
+        return None
+    magic, version, _, _, storedSize, storedMtime = PEAKS_HEADER.unpack(header)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION or storedSize != sourceSize or storedMtime != sourceMtime:
+        return None
+    return peaksPath
+
+def SavePeaks(normalizedPath, sourceSize, sourceMtime, samples, frameRate, maxAmplitude):
+    """
+    Compute and write the peaks file of an already decoded track. Returns its path.
+    """
+    data = EncodePeaks(ComputePeakPyramid(samples, maxAmplitude), frameRate, sourceSize, sourceMtime)
+    peaksPath = GetPeaksPath(normalizedPath)
+    os.makedirs(PEAKS_DIRECTORY, exist_ok=True)
+    temporaryPath = f"{peaksPath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporaryPath, "wb") as peaksFile:
+        peaksFile.write(data)
+    os.replace(temporaryPath, peaksPath)
+    return peaksPath
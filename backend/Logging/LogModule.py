@@ -20,10 +20,17 @@ class ColoredFormatter(logging.Formatter):
         logging.CRITICAL: red,
     }
     
+    def __init__(self, fmt=None, datefmt="%Y-%m-%d %H:%M:%S"):
+        fmt = fmt or self.custom_format
+        super().__init__(fmt, datefmt)
+        # One formatter per level, built once instead of on every record.
+        self.formatters = {
+            level: logging.Formatter(color + fmt + self.reset, datefmt) for level, color in self.COLORS.items()
+        }
+
     def format(self, record):
-        log_fmt = self.COLORS.get(record.levelno) + self.custom_format + self.reset
-        formatter = logging.Formatter(log_fmt, "%Y-%m-%d %H:%M:%S")
-        return formatter.format(record)
+        formatter = self.formatters.get(record.levelno)
+        return formatter.format(record) if formatter is not None else super().format(record)
     
 def SetupLogging(logFileName = "AIDJ.log"):
 
@@ -1,10 +1,70 @@
-from multiprocessing import log_to_stderr
-from multiprocessing_logging import install_mp_handler
 from Logging.LogModule import ColoredFormatter
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from contextlib import contextmanager
+from multiprocessing import util as multiprocessingUtil
+import os
+import json
+import time
+import queue
+import atexit
 import logging
+import datetime
+import threading
+
+LOG_LEVEL = os.getenv("AIDJ_LOG_LEVEL", "INFO").upper()
+# "text", or "json" for one JSON object per line on the console and in the log file.
+LOG_FORMAT = os.getenv("AIDJ_LOG_FORMAT", "text").lower()
+LOG_MESSAGE_FORMAT = "%(asctime)s - %(levelname)s - AIDJ %(message)s%(fieldsText)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Enqueues records untouched. The stock prepare() renders the message in the calling
+    thread; this queue never leaves the process, so that work is left to the listener.
+    Arguments are therefore rendered later: log values, not objects that change afterwards.
+    """
+
+    def prepare(self, record):
+        return record
+
+class _FieldsTextFilter(logging.Filter):
+    # Runs in the listener thread: renders the record's fields as " key=value" pairs for text output.
+    def filter(self, record):
+        fields = getattr(record, "fields", None)
+        record.fieldsText = "".join(f" {name}={value}" for name, value in fields.items()) if fields else ""
+        return True
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, message, process and thread, the record's
+    fields, uptimeMs (since the logger was set up) and queueMs (time spent waiting for the listener).
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+            "uptimeMs": round(record.relativeCreated, 3),
+            "queueMs": round(1000 * (time.time() - record.created), 3),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
 
 class SingletonLogger:
+    """
+    The "AIDJ" logger. Callers only put records on an in-process queue; a QueueListener
+    thread formats them and writes the console and the rotating log file, so slow writes
+    never hold up a request or an analysis loop.
+
+    Messages are formatted lazily, logging style: mainLogger.info("Analyzed %s in %.1fs", path, seconds)
+    costs a level check when the level is disabled. Keyword arguments become fields of the
+    record (key=value in text output, keys in JSON lines), e.g. durationMs=12.5.
+    """
     _instance = None
 
     def __new__(cls, logFileName="AIDJ.log"):
@@ -12,30 +72,77 @@ class SingletonLogger:
             cls._instance = super(SingletonLogger, cls).__new__(cls)
             cls._instance.SetupLogger(logFileName)
         return cls._instance
-    
+
     def SetupLogger(self, logFileName):
-        #log_to_stderr()  # Activate for mutliprocess logging
-        self.logger = logging.getLogger("AIDJ")
-        self.logger.setLevel(logging.INFO)
+        if LOG_FORMAT == "json":
+            consoleFormatter = fileFormatter = JsonLinesFormatter()
+        else:
+            consoleFormatter = ColoredFormatter(LOG_MESSAGE_FORMAT, LOG_DATE_FORMAT)
+            fileFormatter = logging.Formatter(LOG_MESSAGE_FORMAT, LOG_DATE_FORMAT)
+
         consoleHandler = logging.StreamHandler()
-        consoleHandler.setFormatter(ColoredFormatter())
-        self.logger.addHandler(consoleHandler)
+        consoleHandler.setFormatter(consoleFormatter)
         fileHandler = TimedRotatingFileHandler(logFileName, when="midnight", interval=1, backupCount=7)
-        fileFormatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S")
         fileHandler.setFormatter(fileFormatter)
-        self.logger.addHandler(fileHandler)   
-        #install_mp_handler(self.logger)  # Activate for multiprocess logging
+        for handler in (consoleHandler, fileHandler):
+            handler.addFilter(_FieldsTextFilter())
+
+        # Every process (uvicorn and ingest workers alike) runs its own listener thread.
+        logQueue = queue.SimpleQueue()
+        self.listener = QueueListener(logQueue, consoleHandler, fileHandler, respect_handler_level=True)
+        self.listener.start()
+        self._listenerLock = threading.Lock()
+        # atexit does not run in multiprocessing children; Finalize does, so their last records are written too.
+        atexit.register(self.StopListener)
+        multiprocessingUtil.Finalize(self, self.StopListener, exitpriority=0)
+
+        self.logger = logging.getLogger("AIDJ")
+        self.logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        self.logger.addHandler(_DeferredQueueHandler(logQueue))
+
+    def StopListener(self):
+        # Drains the queue; safe to call more than once.
+        with self._listenerLock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+
+    def _log(self, level, message, args, fields, excInfo=False):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, *args, exc_info=excInfo, extra={"fields": fields} if fields else None)
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def debug(self, message, *args, **fields):
+        self._log(logging.DEBUG, message, args, fields)
+
+    def error(self, message, *args, **fields):
+        self._log(logging.ERROR, message, args, fields)
 
-    def debug(self, message):
-        self.logger.debug("AIDJ " + message)
+    def exception(self, message, *args, **fields):
+        self._log(logging.ERROR, message, args, fields, excInfo=True)
 
-    def error(self, message):
-        self.logger.error("AIDJ " + message)
+    def info(self, message, *args, **fields):
+        self._log(logging.INFO, message, args, fields)
 
-    def info(self, message):
-        self.logger.info("AIDJ " + message)
+    def warning(self, message, *args, **fields):
+        self._log(logging.WARNING, message, args, fields)
 
-    def warning(self,message):
-        self.logger.warning("AIDJ "+ message)
+    @contextmanager
+    def timed(self, message, *args, level=logging.DEBUG, **fields):
+        """
+        Log message once the block is done, with a durationMs field; nothing is timed when
+        the level is disabled. Usage: with mainLogger.timed("Segmented %s", path): ...
+        """
+        if not self.logger.isEnabledFor(level):
+            yield
+            return
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            fields["durationMs"] = round(1000 * (time.perf_counter() - startTime), 3)
+            self._log(level, message, args, fields)
 
-mainLogger = SingletonLogger()  # This will always return the same logger instance
\ No newline at end of file
+mainLogger = SingletonLogger()  # This will always return the same logger instance
@@ -1,18 +1,44 @@
+import os
+import hashlib
 from typing import Optional
 from pathlib import Path
 
+from Core.MemoryCache import LruCache, FileValidator
+from Core.AudioProcessing import GetDefaultAnalysisStore
+
 try:
     from mutagen._file import File as MutagenFile
 except ImportError:  # pragma: no cover - runtime dependency may be missing locally
     MutagenFile = None
 
+METADATA_MEMORY_CACHE_ENTRIES = int(os.getenv("AIDJ_METADATA_MEMORY_CACHE_ENTRIES", "4096"))
+METADATA_MEMORY_CACHE_BYTES = int(os.getenv("AIDJ_METADATA_MEMORY_CACHE_BYTES", str(4 * 1024 * 1024)))
+METADATA_MEMORY_ENTRY_BYTES = 512
+COVER_MEMORY_CACHE_ENTRIES = int(os.getenv("AIDJ_COVER_MEMORY_CACHE_ENTRIES", "128"))
+COVER_MEMORY_CACHE_BYTES = int(os.getenv("AIDJ_COVER_MEMORY_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# Index records (no cover bytes), revalidated against the file's (size, mtime).
+metadata_memory_cache = LruCache(METADATA_MEMORY_CACHE_ENTRIES, METADATA_MEMORY_CACHE_BYTES)
+# Cover bytes keyed by content hash; a hash never changes meaning, so the validator is constant.
+cover_memory_cache = LruCache(COVER_MEMORY_CACHE_ENTRIES, COVER_MEMORY_CACHE_BYTES)
+
+TITLE_TAG_KEYS = ("TIT2", "\xa9nam", "title", "TITLE")
+ARTIST_TAG_KEYS = ("TPE1", "\xa9ART", "artist", "ARTIST")
+
 def _read_text_tag(tags, key: str) -> Optional[str]:
     if not tags:
         return None
-    value = tags.get(key)
+    try:
+        value = tags.get(key)
+    except (KeyError, ValueError):
+        return None
     if not value:
         return None
+    # ID3 frames keep their values in .text
+    value = getattr(value, "text", value)
     if isinstance(value, list):
+        if not value:
+            return None
         item = value[0]
     else:
         item = value
@@ -20,6 +46,13 @@ def _read_text_tag(tags, key: str) -> Optional[str]:
         return item.decode("utf-8", errors="ignore").strip() or None
     return str(item).strip() or None
 
+def _read_first_text_tag(tags, keys) -> Optional[str]:
+    for key in keys:
+        value = _read_text_tag(tags, key)
+        if value:
+            return value
+    return None
+
 def _detect_image_mime(image_bytes: bytes) -> str:
     if image_bytes.startswith(b"\xff\xd8\xff"):
         return "image/jpeg"
@@ -30,6 +63,10 @@ def _detect_image_mime(image_bytes: bytes) -> str:
     return "application/octet-stream"
 
 def _extract_track_metadata(track_file: Path) -> dict:
+    """
+    Read title, artist and cover art with a single mutagen open.
+    Returns {"title", "artist", "cover_data", "cover_mime"}.
+    """
     metadata = {
         "title": track_file.stem,
         "artist": "Unknown Artist",
@@ -40,24 +77,17 @@ def _extract_track_metadata(track_file: Path) -> dict:
         print("Mutagen is none")
         return metadata
 
-    try:
-        easy_audio = MutagenFile(track_file, easy=True)
-        if easy_audio and getattr(easy_audio, "tags", None):
-            metadata["title"] = _read_text_tag(easy_audio.tags, "title") or metadata["title"]
-            metadata["artist"] = _read_text_tag(easy_audio.tags, "artist") or metadata["artist"]
-    except Exception:
-        pass
-
     try:
         full_audio = MutagenFile(track_file)
         tags = getattr(full_audio, "tags", None)
-        if not tags:
-            return metadata
+
+        metadata["title"] = _read_first_text_tag(tags, TITLE_TAG_KEYS) or metadata["title"]
+        metadata["artist"] = _read_first_text_tag(tags, ARTIST_TAG_KEYS) or metadata["artist"]
 
         cover_bytes = None
         cover_mime = None
 
-        if hasattr(tags, "getall"):
+        if tags is not None and hasattr(tags, "getall"):
             apic_frames = tags.getall("APIC")
             if apic_frames:
                 frame = apic_frames[0]
@@ -70,10 +100,105 @@ def _extract_track_metadata(track_file: Path) -> dict:
                 cover_item = covr_items[0]
                 cover_bytes = bytes(cover_item)
 
+        if cover_bytes is None and getattr(full_audio, "pictures", None):
+            picture = full_audio.pictures[0]
+            cover_bytes = picture.data
+            cover_mime = picture.mime
+
         if cover_bytes:
             metadata["cover_data"] = cover_bytes
             metadata["cover_mime"] = cover_mime or _detect_image_mime(cover_bytes)
     except Exception:
         pass
 
-    return metadata
\ No newline at end of file
+    return metadata
+
+def _index_entry_from_extraction(extracted: dict) -> dict:
+    cover_data = extracted.get("cover_data")
+    return {
+        "title": extracted["title"],
+        "artist": extracted["artist"],
+        "coverHash": hashlib.sha1(cover_data).hexdigest() if cover_data else None,
+        "coverMime": extracted.get("cover_mime") if cover_data else None,
+    }
+
+def _to_track_metadata(entry: dict) -> dict:
+    return {
+        "title": entry["title"],
+        "artist": entry["artist"],
+        "cover_hash": entry.get("coverHash"),
+        "cover_mime": entry.get("coverMime"),
+    }
+
+def get_track_metadata(track_file: Path) -> dict:
+    """
+    Index lookup for a track: memory tier, then the persistent index, and only when both
+    are missing or stale (size/mtime changed) a mutagen extraction that refreshes the index.
+    Returns {"title", "artist", "cover_hash", "cover_mime"}; cover bytes come from get_cover.
+    """
+    try:
+        cache_key, validator = FileValidator(track_file)
+    except OSError:
+        return _to_track_metadata(_index_entry_from_extraction(_extract_track_metadata(track_file)))
+
+    cached = metadata_memory_cache.Get(cache_key, validator)
+    if cached is not None:
+        return dict(cached)
+
+    store = GetDefaultAnalysisStore()
+    size, mtime = validator
+    entry = store.GetTrackMetadata(cache_key, size, mtime)
+    if entry is None:
+        extracted = _extract_track_metadata(track_file)
+        entry = _index_entry_from_extraction(extracted)
+        store.UpsertTrackMetadata(cache_key, size, mtime, entry, extracted.get("cover_data"))
+        if entry["coverHash"]:
+            cover_memory_cache.Put(entry["coverHash"], None, (extracted["cover_data"], entry["coverMime"]), len(extracted["cover_data"]))
+
+    metadata = _to_track_metadata(entry)
+    metadata_memory_cache.Put(cache_key, validator, metadata, METADATA_MEMORY_ENTRY_BYTES)
+    return dict(metadata)
+
+def get_cover(cover_hash: Optional[str]) -> Optional[tuple[bytes, str]]:
+    """
+    Return (cover_bytes, cover_mime) for a cover hash from the index, or None.
+    """
+    if not cover_hash:
+        return None
+    cached = cover_memory_cache.Get(cover_hash, None)
+    if cached is not None:
+        return cached
+
+    cover = GetDefaultAnalysisStore().GetCover(cover_hash)
+    if cover is None:
+        return None
+    cover_data, cover_mime = cover
+    cover = (cover_data, cover_mime or _detect_image_mime(cover_data))
+    cover_memory_cache.Put(cover_hash, None, cover, len(cover_data))
+    return cover
+
+def index_track_metadata(track_paths) -> int:
+    """
+    Fill the metadata index for a library during ingest. Only tracks that are missing
+    or stale in the index are opened. Returns the number of tracks (re)indexed.
+    """
+    store = GetDefaultAnalysisStore()
+    stats_by_path = {}
+    for track_path in track_paths:
+        try:
+            normalized_path, validator = FileValidator(track_path)
+        except OSError:
+            continue
+        stats_by_path[normalized_path] = validator
+
+    indexed = store.GetManyTrackMetadata(
+        (path, size, mtime) for path, (size, mtime) in stats_by_path.items()
+    )
+    reindexed = 0
+    for path, (size, mtime) in stats_by_path.items():
+        if path in indexed:
+            continue
+        extracted = _extract_track_metadata(Path(path))
+        store.UpsertTrackMetadata(path, size, mtime, _index_entry_from_extraction(extracted), extracted.get("cover_data"))
+        reindexed += 1
+    return reindexed
@@ -0,0 +1,169 @@
+from pathlib import Path
+from typing import Optional
+from fastapi import HTTPException
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+from Core.FileHandling import hlsCacheDirectory
+from transcodeAudio import FFMPEG_BINARY, TRANSCODE_TIMEOUT_SECONDS, MIN_BITRATE_KBPS, MAX_BITRATE_KBPS
+from transcodeAudio import build_once, touch_cache_entry, raise_for_build_error, require_ffmpeg
+from Logging.MainLogger import mainLogger
+
+HLS_CACHE_DIR = os.getenv("AIDJ_HLS_CACHE_DIR", hlsCacheDirectory)
+HLS_CACHE_MAX_BYTES = int(os.getenv("AIDJ_HLS_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+HLS_SEGMENT_SECONDS = int(os.getenv("AIDJ_HLS_SEGMENT_SECONDS", "6"))
+HLS_DEFAULT_BITRATE_KBPS = 128
+
+HLS_PLAYLIST_NAME = "index.m3u8"
+HLS_PLAYLIST_MEDIA_TYPE = "application/vnd.apple.mpegurl"
+HLS_SEGMENT_MEDIA_TYPE = "video/mp2t"
+HLS_SEGMENT_EXTENSION = ".ts"
+# Segment URLs never change meaning, so clients and CDNs may keep them forever.
+HLS_SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+HLS_SEGMENT_URL_PREFIX = "/api/hls/segments"
+
+RENDITION_KEY_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+SEGMENT_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def _rendition_key(track_file: Path, bitrate_kbps: int) -> str:
+    # Keyed like the transcode cache: an edited source gets new URLs, the old ones age out.
+    file_stat = track_file.stat()
+    key_source = f"{track_file.resolve()}|{file_stat.st_size}|{file_stat.st_mtime_ns}|hls|{HLS_SEGMENT_SECONDS}|{bitrate_kbps}"
+    return hashlib.sha1(key_source.encode("utf-8")).hexdigest()
+
+def _segment_ffmpeg(track_file: Path, output_directory: Path, bitrate_kbps: int) -> None:
+    command = [
+        FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(track_file),
+        "-map", "0:a:0", "-vn",
+        "-c:a", "aac", "-b:a", f"{bitrate_kbps}k",
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_type", "mpegts",
+        "-hls_segment_filename", str(output_directory / "segment_%05d.ts"),
+        str(output_directory / HLS_PLAYLIST_NAME),
+    ]
+    completed = subprocess.run(command, capture_output=True, timeout=TRANSCODE_TIMEOUT_SECONDS)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.decode("utf-8", errors="replace").strip() or f"ffmpeg exited with {completed.returncode}")
+
+def _content_address_segments(work_directory: Path, rendition_key: str) -> str:
+    """
+    Rename every segment ffmpeg wrote to the SHA-256 of its bytes and return the playlist
+    rewritten to point at those names.
+    """
+    playlist_lines = []
+    with open(work_directory / HLS_PLAYLIST_NAME, "r", encoding="utf-8") as playlist_file:
+        for line in playlist_file:
+            line = line.rstrip("\n")
+            if line and not line.startswith("#"):
+                segment_file = work_directory / line
+                with open(segment_file, "rb") as segment:
+                    segment_hash = hashlib.file_digest(segment, "sha256").hexdigest()
+                os.replace(segment_file, work_directory / f"{segment_hash}{HLS_SEGMENT_EXTENSION}")
+                line = f"{HLS_SEGMENT_URL_PREFIX}/{rendition_key}/{segment_hash}{HLS_SEGMENT_EXTENSION}"
+            playlist_lines.append(line)
+    return "\n".join(playlist_lines) + "\n"
+
+def _build_hls(track_file: Path, rendition_key: str, bitrate_kbps: int) -> None:
+    rendition_directory = Path(HLS_CACHE_DIR) / rendition_key
+    work_directory = Path(HLS_CACHE_DIR) / f"{rendition_key}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(work_directory, ignore_errors=True)
+    os.makedirs(work_directory)
+    try:
+        with mainLogger.timed("Segmenting %s for HLS at %sk", track_file, bitrate_kbps, level=logging.INFO):
+            _segment_ffmpeg(track_file, work_directory, bitrate_kbps)
+        playlist = _content_address_segments(work_directory, rendition_key)
+        with open(work_directory / HLS_PLAYLIST_NAME, "w", encoding="utf-8") as playlist_file:
+            playlist_file.write(playlist)
+        # A directory left by an interrupted build has no marker; replace it whole.
+        shutil.rmtree(rendition_directory, ignore_errors=True)
+        os.replace(work_directory, rendition_directory)
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+    # The marker is what build_once checks, so it is written only once the directory is complete.
+    _marker_path(rendition_key).touch()
+    evict_hls_cache(keep_key=rendition_key)
+
+def _marker_path(rendition_key: str) -> Path:
+    return Path(HLS_CACHE_DIR) / f"{rendition_key}.ready"
+
+def get_hls_playlist(track_file: Path, bitrate_kbps: Optional[int] = None) -> Path:
+    """
+    Return the path of the cached m3u8 of track_file, segmenting it first on a miss.
+    Segment URIs in it are absolute and content addressed.
+    """
+    require_ffmpeg()
+    bitrate_kbps = bitrate_kbps or HLS_DEFAULT_BITRATE_KBPS
+    if not MIN_BITRATE_KBPS <= bitrate_kbps <= MAX_BITRATE_KBPS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Bitrate must be between {MIN_BITRATE_KBPS} and {MAX_BITRATE_KBPS} kbps",
+        )
+
+    rendition_key = _rendition_key(track_file, bitrate_kbps)
+    playlist_path = Path(HLS_CACHE_DIR) / rendition_key / HLS_PLAYLIST_NAME
+    if touch_cache_entry(_marker_path(rendition_key)) and playlist_path.exists():
+        return playlist_path
+
+    try:
+        build_once(_marker_path(rendition_key), lambda: _build_hls(track_file, rendition_key, bitrate_kbps))
+    except Exception as e:
+        raise_for_build_error(e, f"Segmenting {track_file} for HLS")
+    return playlist_path
+
+def get_hls_segment(rendition_key: str, segment_name: str) -> Path:
+    segment_hash, extension = os.path.splitext(segment_name)
+    if not RENDITION_KEY_PATTERN.match(rendition_key) or not SEGMENT_HASH_PATTERN.match(segment_hash) \
+            or extension != HLS_SEGMENT_EXTENSION:
+        raise HTTPException(status_code=404, detail="HLS segment not found")
+    segment_path = Path(HLS_CACHE_DIR) / rendition_key / segment_name
+    if not segment_path.is_file():
+        raise HTTPException(status_code=404, detail="HLS segment not found")
+    return segment_path
+
+def evict_hls_cache(max_bytes: int = HLS_CACHE_MAX_BYTES, keep_key: Optional[str] = None) -> int:
+    """
+    Delete whole renditions (playlist and segments), least recently used first, until the
+    cache fits in max_bytes. keep_key is never deleted. Returns the number of renditions deleted.
+    """
+    renditions = []
+    total_bytes = 0
+    try:
+        with os.scandir(HLS_CACHE_DIR) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(".ready"):
+                    continue
+                rendition_key = entry.name[:-len(".ready")]
+                try:
+                    last_used = entry.stat().st_atime
+                    with os.scandir(os.path.join(HLS_CACHE_DIR, rendition_key)) as files:
+                        size = sum(file.stat().st_size for file in files if file.is_file())
+                except FileNotFoundError:
+                    continue
+                total_bytes += size
+                if rendition_key != keep_key:
+                    renditions.append((last_used, size, rendition_key))
+    except FileNotFoundError:
+        return 0
+
+    deleted = 0
+    renditions.sort()
+    for _, size, rendition_key in renditions:
+        if total_bytes <= max_bytes:
+            break
+        # Marker first: a concurrent reader then rebuilds instead of serving a half-deleted rendition.
+        try:
+            os.remove(_marker_path(rendition_key))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(os.path.join(HLS_CACHE_DIR, rendition_key), ignore_errors=True)
+        total_bytes -= size
+        deleted += 1
+    return deleted
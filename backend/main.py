@@ -1,17 +1,28 @@
 #from djmixer.Core.PlaySongs import PlaySongsAlt
-from datetime import datetime, timezone
 from pathlib import Path
 import mimetypes
+import secrets
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.responses import Response, StreamingResponse
-from extractTrackMetaData import _extract_track_metadata
-from streamAudio import validate_audio_file,resolve_track_path, parse_byte_range
+from extractTrackMetaData import get_track_metadata, get_cover, metadata_memory_cache, cover_memory_cache
+from streamAudio import validate_audio_file,resolve_track_path, parse_byte_ranges
+from streamAudio import file_validators, is_not_modified, if_range_allows_partial, AUDIO_CACHE_CONTROL, COVER_CACHE_CONTROL
+from streamAudio import FileRangeResponse, multipart_byteranges_response
+from transcodeAudio import negotiate_rendition, get_rendition, rendition_media_type
+from mixStream import mix_streams, MIX_MEDIA_TYPE
+from hlsAudio import get_hls_playlist, get_hls_segment, HLS_PLAYLIST_MEDIA_TYPE, HLS_SEGMENT_MEDIA_TYPE, HLS_SEGMENT_CACHE_CONTROL
 
 from Core.CreateListOfSongs import CreateNewListOfSongs
-from Core.AudioProcessing import AnalyzeSongForTransitionWithCache, CalculateTransition
+from Core.LibraryIngest import IngestCancelled
+from playlistJobs import PlaylistJobManager
+from playerState import create_player_state_backend, is_valid_session_id, DEFAULT_SESSION_ID, PlaylistTooLong, PLAYER_STATE_BACKEND
+from Core.AudioProcessing import PlanTransition, GetPeaksFile, analysisMemoryCache
+from Core.TransitionPrefetch import transitionPrefetcher
+from Core.Metrics import metricsRegistry, RegisterCacheMetrics, METRICS_ENABLED, METRICS_CONTENT_TYPE
+from requestMetrics import RequestMetricsMiddleware
 import os 
 
 app = FastAPI()
@@ -33,6 +44,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if METRICS_ENABLED:
+    # Outermost, so the latency includes CORS handling and preflights are counted too.
+    app.add_middleware(RequestMetricsMiddleware)
 
 @app.get("/")
 async def root():
@@ -43,94 +57,196 @@ async def root():
 async def healthz():
     return {"ok": True}
 
-PLAYLIST: list[dict] = []
-CURRENT_TRACK_INDEX: int = -1
-CURRENT_TRACK: Optional[dict]=None
+@app.get("/api/cache/stats")
+def cache_stats():
+    return {
+        "analysis": analysisMemoryCache.Stats(),
+        "metadata": metadata_memory_cache.Stats(),
+        "covers": cover_memory_cache.Stats(),
+        "prefetchedTransitions": transitionPrefetcher.Stats(),
+        "sessions": player_state.stats(),
+        "mixStreams": mix_streams.stats(),
+    }
+
+# Playlist and cursor of every session live in the state backend, so every uvicorn worker
+# sees the same players. Track analysis, metadata and covers stay shared across sessions.
+player_state = create_player_state_backend()
+
+# Everything below is read from the components' own counters when /metrics is scraped.
+RegisterCacheMetrics({
+    "analysis": analysisMemoryCache,
+    "metadata": metadata_memory_cache,
+    "covers": cover_memory_cache,
+    "prefetchedTransitions": transitionPrefetcher,
+})
+metricsRegistry.Callback(
+    "aidj_transition_prefetch_pending", "Transitions queued for background analysis.", (),
+    lambda: [((), transitionPrefetcher.Stats()["pending"])],
+)
+metricsRegistry.Callback(
+    "aidj_mix_streams", "Live mixes being rendered.", (),
+    lambda: [((), mix_streams.stats()["mixes"])],
+)
+metricsRegistry.Callback(
+    "aidj_mix_listeners", "Listeners attached to the live mixes.", (),
+    lambda: [((), mix_streams.stats()["listeners"])],
+)
+metricsRegistry.Callback(
+    "aidj_player_sessions", "Player sessions in the state backend.", (),
+    lambda: [((), player_state.stats()["sessions"])],
+    # Workers read the same sqlite backend, so its count is not summed; local backends are per worker.
+    multiprocessMode="livesum" if PLAYER_STATE_BACKEND == "local" else "max",
+)
+if METRICS_ENABLED:
+    # Every worker shares its values, so a scrape of any one of them reports the whole group.
+    metricsRegistry.StartSharing()
+
+@app.get("/metrics")
+def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metricsRegistry.Render(), media_type=METRICS_CONTENT_TYPE)
+
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "aidj_session"
+# <audio> and <img> elements cannot send headers, so their URLs carry the session as a query parameter.
+SESSION_QUERY_PARAM = "session"
+SESSION_COOKIE_MAX_AGE = 30 * 24 * 60 * 60
+
+def get_session_id(request: Request) -> str:
+    session_id = (
+        request.headers.get(SESSION_HEADER)
+        or request.query_params.get(SESSION_QUERY_PARAM)
+        or request.cookies.get(SESSION_COOKIE)
+        or DEFAULT_SESSION_ID
+    )
+    if not is_valid_session_id(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session id")
+    return session_id
+
+def _with_session(url: str, session_id: str) -> str:
+    if session_id == DEFAULT_SESSION_ID:
+        return url
+    return f"{url}?{SESSION_QUERY_PARAM}={session_id}"
 
-def _set_current_track(index: int) ->None:
-    global CURRENT_TRACK
-    entry = PLAYLIST[index]
+def _current_track(state: Optional[dict]) -> Optional[dict]:
+    if state is None or state["index"] < 0:
+        return None
+    playlist = state["playlist"]
+    entry = playlist[state["index"]]
     track_file = Path(entry["absolute_path"])
-    metadata = _extract_track_metadata(track_file)
-    CURRENT_TRACK={
+    metadata = get_track_metadata(track_file)
+    return {
         "path": entry["path"],
         "absolute_path": entry["absolute_path"],
         "title": metadata["title"],
         "artist": metadata["artist"],
-        "cover_data": metadata["cover_data"],
+        "cover_hash": metadata["cover_hash"],
         "cover_mime": metadata["cover_mime"],
-        "startedAt": datetime.now(timezone.utc).isoformat(),
-        "index": index,
-        "playlistLength": len(PLAYLIST),
+        "startedAt": state["startedAt"],
+        "index": state["index"],
+        "playlistLength": len(playlist),
     }
 
-def _stream_url_for_index(index: int) -> str:
-    return f"/api/audio/playlist/{index}"
+def _playlist_or_404(session_id: str) -> list[dict]:
+    state = player_state.get_state(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Playlist is empty")
+    return state["playlist"]
+
+def _schedule_prefetch(state: dict, session_id: str, playlist_replaced: bool = False) -> None:
+    playlist_paths = [entry["absolute_path"] for entry in state["playlist"]]
+    transitionPrefetcher.Schedule(playlist_paths, state["index"], playlistReplaced=playlist_replaced, sessionId=session_id)
+
+def _stream_url_for_index(index: int, session_id: str = DEFAULT_SESSION_ID) -> str:
+    return _with_session(f"/api/audio/playlist/{index}", session_id)
 
-def _cover_url_for_index(index: int, has_cover: bool) -> Optional[str]:
+def _cover_url_for_index(index: int, has_cover: bool, session_id: str = DEFAULT_SESSION_ID) -> Optional[str]:
     if not has_cover:
         return None
-    return f"/api/audio/playlist/{index}/cover"
+    return _with_session(f"/api/audio/playlist/{index}/cover", session_id)
 
-def CreateResponse():
+def CreateResponse(current_track: dict, session_id: str = DEFAULT_SESSION_ID):
     return {
         "ok": True,
+        "sessionId": session_id,
         "currentTrack": {
-            "path": CURRENT_TRACK["path"],
-            "title": CURRENT_TRACK["title"],
-            "artist": CURRENT_TRACK["artist"],
-            "coverUrl": _cover_url_for_index(CURRENT_TRACK["index"], bool(CURRENT_TRACK["cover_data"])),
-            "index": CURRENT_TRACK["index"],
-            "playlistLength": CURRENT_TRACK["playlistLength"],
+            "path": current_track["path"],
+            "title": current_track["title"],
+            "artist": current_track["artist"],
+            "coverUrl": _cover_url_for_index(current_track["index"], bool(current_track["cover_hash"]), session_id),
+            "index": current_track["index"],
+            "playlistLength": current_track["playlistLength"],
         },
-        "streamUrl": _stream_url_for_index(CURRENT_TRACK["index"]),
-        "startedAt": CURRENT_TRACK["startedAt"],
+        "streamUrl": _stream_url_for_index(current_track["index"], session_id),
+        "startedAt": current_track["startedAt"],
     }
 
-def _stream_audio_file(track_file: Path, request: Request):
-    file_size = track_file.stat().st_size
+def _cover_response(cover_data: bytes, cover_mime: Optional[str], cover_hash: str, request: Request):
+    headers = {"ETag": f'"{cover_hash}"', "Cache-Control": COVER_CACHE_CONTROL}
+    if is_not_modified(request.headers, headers["ETag"], None):
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        content=cover_data,
+        media_type=cover_mime or "application/octet-stream",
+        headers=headers,
+    )
+
+def _stream_audio_file(track_file: Path, request: Request, delivery_format: Optional[str] = None,
+                       bitrate: Optional[int] = None):
     content_type = mimetypes.guess_type(track_file.name)[0] or "application/octet-stream"
+    rendition = negotiate_rendition(delivery_format, bitrate, request.headers.get("accept"), content_type)
+    if rendition is not None:
+        # Renditions are ordinary cached files, so ranges and validators below apply unchanged.
+        track_file = get_rendition(track_file, *rendition)
+        content_type = rendition_media_type(rendition[0])
+
+    return _stream_file(track_file, request, content_type, AUDIO_CACHE_CONTROL, vary="Accept")
+
+def _stream_file(file_path: Path, request: Request, content_type: str, cache_control: str, vary: Optional[str] = None):
+    file_stat = file_path.stat()
+    file_size = file_stat.st_size
     range_header = request.headers.get("range")
+    etag, last_modified = file_validators(file_stat)
 
     start = 0
     end = file_size - 1
     status_code = 200 # whole file, all bytes are stream
-    headers = {"Accept-Ranges": "bytes"}
-
-    if range_header:
-        start, end = parse_byte_range(range_header, file_size)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": cache_control,
+    }
+    if vary:
+        headers["Vary"] = vary
+
+    # Conditional requests are evaluated before Range (RFC 7232 section 6).
+    if is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    if range_header and if_range_allows_partial(request.headers, etag, last_modified):
+        ranges = parse_byte_ranges(range_header, file_size)
+        if len(ranges) > 1:
+            return multipart_byteranges_response(file_path, ranges, file_size, content_type, headers)
+        start, end = ranges[0]
         status_code = 206 # return only that part of the file
         headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
 
     content_length = end - start + 1
     headers["Content-Length"] = str(content_length)
 
-    def file_iterator():
-        chunk_size = 1024 * 1024
-        with track_file.open("rb") as f:
-            f.seek(start)
-            remaining = content_length
-            while remaining > 0:
-                read_size = min(chunk_size, remaining)
-                chunk = f.read(read_size)
-                if not chunk:
-                    break
-                remaining -= len(chunk)
-                yield chunk
-
-    return StreamingResponse(
-        file_iterator(),
+    return FileRangeResponse(
+        file_path,
+        start,
+        content_length,
         status_code=status_code,
         media_type=content_type,
         headers=headers,
     )
 
-@app.post("/api/play")
-def play():
-    global CURRENT_TRACK,PLAYLIST, CURRENT_TRACK_INDEX
- 
-    #requested_paths = payload.paths if payload.paths else ([payload.path] if payload.path else [])
-    requested_paths = CreateNewListOfSongs()
+def _apply_playlist(requested_paths: list[str], session_id: str = DEFAULT_SESSION_ID) -> dict:
     if not requested_paths:
         raise HTTPException(status_code=400, detail="path or paths is required")
 
@@ -145,141 +261,246 @@ def play():
             "absolute_path": str(track_file),
         })
 
-    PLAYLIST = entries
-    CURRENT_TRACK_INDEX = 0
-    _set_current_track(CURRENT_TRACK_INDEX)
+    # Playlist and cursor are replaced in one transaction, readers never see a mixed pair.
+    try:
+        state = player_state.set_playlist(entries, session_id)
+    except PlaylistTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    _schedule_prefetch(state, session_id, playlist_replaced=True)
+    return state
+
+playlist_jobs = PlaylistJobManager(
+    lambda progress_callback, cancel_event: CreateNewListOfSongs(progress_callback, cancel_event),
+    _apply_playlist,
+)
 
-    return CreateResponse()
+def _job_or_404(job_id: str) -> dict:
+    job = playlist_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Playlist build job not found: {job_id}")
+    return job
 
-@app.post("/api/play/next")
-def play_next():
-    global CURRENT_TRACK_INDEX
+@app.post("/api/sessions", status_code=201)
+def create_session(response: Response):
+    session_id = secrets.token_urlsafe(16)
+    response.set_cookie(SESSION_COOKIE, session_id, max_age=SESSION_COOKIE_MAX_AGE, httponly=True, samesite="lax")
+    return {"sessionId": session_id}
 
-    if not PLAYLIST:
-        raise HTTPException(status_code=404, detail="Playlist is empty")
+@app.post("/api/play")
+def play(session_id: str = Depends(get_session_id)):
+    #requested_paths = payload.paths if payload.paths else ([payload.path] if payload.path else [])
+    # Built as a job and waited for, so it queues behind any build running on any worker.
+    try:
+        playlist_jobs.run(session_id)
+    except IngestCancelled:
+        raise HTTPException(status_code=409, detail="Playlist build was cancelled")
+    state = player_state.get_state(session_id)
 
-    CURRENT_TRACK_INDEX = (CURRENT_TRACK_INDEX + 1) % len(PLAYLIST)
-    _set_current_track(CURRENT_TRACK_INDEX)
+    return CreateResponse(_current_track(state), session_id)
 
-    return CreateResponse()
+@app.post("/api/play/jobs", status_code=202)
+def start_playlist_build(session_id: str = Depends(get_session_id)):
+    job = playlist_jobs.start(session_id)
+    return {
+        **job,
+        "statusUrl": f"/api/play/jobs/{job['jobId']}",
+        "eventsUrl": f"/api/play/jobs/{job['jobId']}/events",
+    }
 
-@app.post("/api/play/previous")
-def play_previous():
-    global CURRENT_TRACK_INDEX
+@app.get("/api/play/jobs/{job_id}")
+def playlist_build_status(job_id: str):
+    return _job_or_404(job_id)
 
-    if not PLAYLIST:
+@app.get("/api/play/jobs/{job_id}/events")
+def playlist_build_events(job_id: str):
+    _job_or_404(job_id)
+    return StreamingResponse(
+        playlist_jobs.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.delete("/api/play/jobs/{job_id}")
+def cancel_playlist_build(job_id: str):
+    job = playlist_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Playlist build job not found: {job_id}")
+    return job
+
+def _move_cursor(step: int, session_id: str):
+    # The move is atomic in the state backend: concurrent requests on any worker each advance once.
+    state = player_state.move(step, session_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="Playlist is empty")
+    _schedule_prefetch(state, session_id)
 
-    CURRENT_TRACK_INDEX = (CURRENT_TRACK_INDEX - 1 + len(PLAYLIST)) % len(PLAYLIST)
-    _set_current_track(CURRENT_TRACK_INDEX)
+    return CreateResponse(_current_track(state), session_id)
 
-    return CreateResponse()
+@app.post("/api/play/next")
+def play_next(session_id: str = Depends(get_session_id)):
+    return _move_cursor(1, session_id)
 
-@app.get("/api/audio/current")
-def stream_current_audio(request: Request):
-    global CURRENT_TRACK
+@app.post("/api/play/previous")
+def play_previous(session_id: str = Depends(get_session_id)):
+    return _move_cursor(-1, session_id)
 
-    if CURRENT_TRACK is None:
+@app.get("/api/audio/current")
+def stream_current_audio(request: Request, format: Optional[str] = None, bitrate: Optional[int] = None,
+                         session_id: str = Depends(get_session_id)):
+    state = player_state.get_state(session_id)
+    if state is None or state["index"] < 0:
         raise HTTPException(status_code=404, detail="No current track selected")
 
-    track_file = Path(CURRENT_TRACK["absolute_path"])
+    track_file = Path(state["playlist"][state["index"]]["absolute_path"])
     if not track_file.exists() or not track_file.is_file():
-        CURRENT_TRACK = None
+        player_state.clear_current(session_id)
         raise HTTPException(status_code=410, detail="Current track no longer exists")
 
-    return _stream_audio_file(track_file, request)
+    return _stream_audio_file(track_file, request, format, bitrate)
 
-@app.get("/api/audio/playlist/{index}")
-def stream_playlist_audio(index: int, request: Request):
-    if not PLAYLIST:
-        raise HTTPException(status_code=404, detail="Playlist is empty")
-    if index < 0 or index >= len(PLAYLIST):
+def _playlist_track_file(index: int, session_id: str) -> Path:
+    playlist = _playlist_or_404(session_id)
+    if index < 0 or index >= len(playlist):
         raise HTTPException(status_code=404, detail=f"Track index out of range: {index}")
 
-    track_file = Path(PLAYLIST[index]["absolute_path"])
+    track_file = Path(playlist[index]["absolute_path"])
     if not track_file.exists() or not track_file.is_file():
         raise HTTPException(status_code=410, detail=f"Track no longer exists at index {index}")
+    return track_file
 
-    return _stream_audio_file(track_file, request)
+@app.get("/api/audio/playlist/{index}")
+def stream_playlist_audio(index: int, request: Request, format: Optional[str] = None, bitrate: Optional[int] = None,
+                          session_id: str = Depends(get_session_id)):
+    track_file = _playlist_track_file(index, session_id)
+    return _stream_audio_file(track_file, request, format, bitrate)
+
+@app.get("/api/audio/playlist/{index}/hls.m3u8")
+def playlist_track_hls(index: int, request: Request, bitrate: Optional[int] = None,
+                       session_id: str = Depends(get_session_id)):
+    # The playlist URL is index based like the stream URL, so it is revalidated; the segments
+    # it lists are content addressed and cached forever.
+    track_file = _playlist_track_file(index, session_id)
+    playlist_path = get_hls_playlist(track_file, bitrate)
+    return _stream_file(playlist_path, request, HLS_PLAYLIST_MEDIA_TYPE, AUDIO_CACHE_CONTROL)
+
+PEAKS_MEDIA_TYPE = "application/octet-stream"
+
+@app.get("/api/audio/playlist/{index}/peaks")
+def playlist_track_peaks(index: int, request: Request, session_id: str = Depends(get_session_id)):
+    # Binary min/max pyramid, layout documented in Core/WaveformPeaks.py. Clients can read the
+    # header and level table first and then range-request only the zoom level they draw.
+    track_file = _playlist_track_file(index, session_id)
+    try:
+        peaks_path = Path(GetPeaksFile(str(track_file)))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    return _stream_file(peaks_path, request, PEAKS_MEDIA_TYPE, AUDIO_CACHE_CONTROL)
+
+@app.get("/api/hls/segments/{rendition_key}/{segment_name}")
+def hls_segment(rendition_key: str, segment_name: str, request: Request):
+    segment_path = get_hls_segment(rendition_key, segment_name)
+    return _stream_file(segment_path, request, HLS_SEGMENT_MEDIA_TYPE, HLS_SEGMENT_CACHE_CONTROL)
 
 
 @app.get("/api/audio/current/cover")
-def current_track_cover():
-    if CURRENT_TRACK is None:
+def current_track_cover(request: Request, session_id: str = Depends(get_session_id)):
+    current_track = _current_track(player_state.get_state(session_id))
+    if current_track is None:
         raise HTTPException(status_code=404, detail="No current track selected")
 
-    cover_data = CURRENT_TRACK.get("cover_data")
-    if not cover_data:
+    cover = get_cover(current_track.get("cover_hash"))
+    if cover is None:
         raise HTTPException(status_code=404, detail="No cover art available for current track")
 
-    return Response(
-        content=cover_data,
-        media_type=CURRENT_TRACK.get("cover_mime") or "application/octet-stream",
-    )
+    cover_data, cover_mime = cover
+    return _cover_response(cover_data, cover_mime, current_track["cover_hash"], request)
 
 @app.get("/api/audio/playlist/{index}/cover")
-def playlist_track_cover(index: int):
-    if not PLAYLIST:
-        raise HTTPException(status_code=404, detail="Playlist is empty")
-    if index < 0 or index >= len(PLAYLIST):
-        raise HTTPException(status_code=404, detail=f"Track index out of range: {index}")
-
-    track_file = Path(PLAYLIST[index]["absolute_path"])
-    if not track_file.exists() or not track_file.is_file():
-        raise HTTPException(status_code=410, detail=f"Track no longer exists at index {index}")
-
-    metadata = _extract_track_metadata(track_file)
-    cover_data = metadata.get("cover_data")
-    if not cover_data:
+def playlist_track_cover(index: int, request: Request, session_id: str = Depends(get_session_id)):
+    track_file = _playlist_track_file(index, session_id)
+    metadata = get_track_metadata(track_file)
+    cover = get_cover(metadata.get("cover_hash"))
+    if cover is None:
         raise HTTPException(status_code=404, detail=f"No cover art available for index {index}")
 
-    return Response(
-        content=cover_data,
-        media_type=metadata.get("cover_mime") or "application/octet-stream",
-    )
+    cover_data, cover_mime = cover
+    return _cover_response(cover_data, cover_mime, metadata["cover_hash"], request)
 
 @app.get("/api/player/status")
-def player_status():
-    if CURRENT_TRACK is None:
+def player_status(session_id: str = Depends(get_session_id)):
+    current_track = _current_track(player_state.get_state(session_id))
+    if current_track is None:
         return {"state": "idle", "currentTrack": None}
 
     return {
         "state": "playing",
         "currentTrack": {
-            "path": CURRENT_TRACK["path"],
-            "title": CURRENT_TRACK["title"],
-            "artist": CURRENT_TRACK["artist"],
-            "coverUrl": _cover_url_for_index(CURRENT_TRACK["index"], bool(CURRENT_TRACK.get("cover_data"))),
+            "path": current_track["path"],
+            "title": current_track["title"],
+            "artist": current_track["artist"],
+            "coverUrl": _cover_url_for_index(current_track["index"], bool(current_track.get("cover_hash")), session_id),
         },
-        "startedAt": CURRENT_TRACK["startedAt"],
+        "startedAt": current_track["startedAt"],
     }
 
 
+def _transition_between(current_song_path: str, next_song_path: str) -> tuple[dict, str]:
+    transition = transitionPrefetcher.GetTransition(current_song_path, next_song_path)
+    if transition is not None:
+        return transition, "prefetched"
+    transition = PlanTransition(current_song_path, next_song_path)
+    return transition, "analysis_cache_hit" if transition["cacheHit"] else "analysis_cache_miss"
+
+@app.get("/api/mix/stream")
+def mix_stream(session_id: str = Depends(get_session_id)):
+    # One render per session: every listener of the session shares its encoder output.
+    if player_state.get_state(session_id) is None:
+        raise HTTPException(status_code=404, detail="Playlist is empty")
+    mix = mix_streams.get_or_start(
+        session_id,
+        lambda: player_state.get_state(session_id),
+        lambda current_song_path, next_song_path: _transition_between(current_song_path, next_song_path)[0],
+    )
+    return StreamingResponse(
+        mix.listen(),
+        media_type=MIX_MEDIA_TYPE,
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/mix/status")
+def mix_status(session_id: str = Depends(get_session_id)):
+    mix = mix_streams.get(session_id)
+    if mix is None:
+        return {"mixId": session_id, "running": False, "listeners": 0}
+    return mix.status()
+
 @app.get("/api/player/overlap")
-def player_overlap():
-    if not PLAYLIST or CURRENT_TRACK_INDEX < 0:
+def player_overlap(session_id: str = Depends(get_session_id)):
+    state = player_state.get_state(session_id)
+    if state is None or state["index"] < 0:
         raise HTTPException(status_code=404, detail="Playlist is empty")
 
-    if len(PLAYLIST) < 2:
+    playlist = state["playlist"]
+    current_index = state["index"]
+    if len(playlist) < 2:
         return {
             "overlapSeconds": 5.0,
             "nextSongStartTimeSec": 0.0,
             "currentSongDurationSec": 0.0,
-            "currentTrackIndex": CURRENT_TRACK_INDEX,
-            "nextTrackIndex": CURRENT_TRACK_INDEX,
+            "currentTrackIndex": current_index,
+            "nextTrackIndex": current_index,
             "source": "default_single_track",
         }
 
-    current_index = CURRENT_TRACK_INDEX
-    next_index = (CURRENT_TRACK_INDEX + 1) % len(PLAYLIST)
-    current_song_path = PLAYLIST[current_index]["absolute_path"]
-    next_song_path = PLAYLIST[next_index]["absolute_path"]
+    next_index = (current_index + 1) % len(playlist)
+    current_song_path = playlist[current_index]["absolute_path"]
+    next_song_path = playlist[next_index]["absolute_path"]
 
     try:
-        next_song_start_time_sec = float(CalculateTransition(current_song_path, next_song_path))
-        current_song_analysis = AnalyzeSongForTransitionWithCache(current_song_path)
-        current_song_duration_sec = float(current_song_analysis["durationSec"])
-        overlap_seconds = max(0.0, current_song_duration_sec - next_song_start_time_sec)
+        transition, source = _transition_between(current_song_path, next_song_path)
+        next_song_start_time_sec = float(transition["nextSongStartTimeSec"])
+        current_song_duration_sec = float(transition["currentSongDurationSec"])
+        overlap_seconds = float(transition["overlapSeconds"])
     except Exception:
         overlap_seconds = 5.0
         next_song_start_time_sec = 0.0
@@ -299,5 +520,6 @@ def player_overlap():
         "currentSongDurationSec": current_song_duration_sec,
         "currentTrackIndex": current_index,
         "nextTrackIndex": next_index,
-        "source": "audio_processing",
+        "phraseAligned": bool(transition.get("phraseAligned", False)),
+        "source": source,
     }
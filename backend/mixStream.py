@@ -0,0 +1,570 @@
+from collections import deque
+from typing import Callable, Optional, Union
+import asyncio
+import hashlib
+import os
+import socket
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from Core.FileHandling import mixRelayDirectory
+from transcodeAudio import FFMPEG_BINARY, require_ffmpeg
+from Logging.MainLogger import mainLogger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+MIX_SAMPLE_RATE = 44100
+MIX_CHANNELS = 2
+MIX_BYTES_PER_FRAME = 2 * MIX_CHANNELS  # s16le
+MIX_BITRATE_KBPS = int(os.getenv("AIDJ_MIX_BITRATE_KBPS", "192"))
+MIX_MEDIA_TYPE = "audio/mpeg"
+MIX_BLOCK_SECONDS = 0.5
+# The renderer stays at most this far ahead of real time, so a playlist change is heard soon.
+MIX_RENDER_AHEAD_SECONDS = float(os.getenv("AIDJ_MIX_RENDER_AHEAD_SECONDS", "10"))
+# Encoded audio kept for listeners that join or briefly stall.
+MIX_BUFFER_SECONDS = float(os.getenv("AIDJ_MIX_BUFFER_SECONDS", "60"))
+# New listeners start this far behind the live edge, so their player buffer fills at once.
+MIX_JOIN_PREROLL_SECONDS = 3.0
+# A mix without listeners stops rendering after this long.
+MIX_IDLE_SECONDS = float(os.getenv("AIDJ_MIX_IDLE_SECONDS", "30"))
+MIX_POLL_SECONDS = 0.1
+MIX_READ_CHUNK_BYTES = 16 * 1024
+MIX_MAX_SEND_BYTES = 256 * 1024
+MIX_RELAY_DIR = os.getenv("AIDJ_MIX_RELAY_DIR", mixRelayDirectory)
+# How long a relaying worker keeps trying to reach the rendering worker's socket.
+MIX_RELAY_CONNECT_SECONDS = 5.0
+# How long a new listener waits for this worker's stopping mix to hand over its render ownership.
+MIX_HANDOFF_SECONDS = 5.0
+MIX_RELAY_ACCEPT_TIMEOUT_SECONDS = 0.5
+
+class _TrackDecoder:
+    """Decodes one track to interleaved s16le PCM at the mix format, block by block."""
+
+    def __init__(self, track_path: str):
+        self.track_path = track_path
+        self.frames_read = 0
+        self._process = subprocess.Popen(
+            [
+                FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error",
+                "-i", track_path, "-map", "0:a:0", "-vn",
+                "-f", "s16le", "-ac", str(MIX_CHANNELS), "-ar", str(MIX_SAMPLE_RATE), "pipe:1",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def read_frames(self, frame_count: int) -> np.ndarray:
+        """Return up to frame_count frames shaped (frames, channels); fewer only at the end of the track."""
+        wanted = frame_count * MIX_BYTES_PER_FRAME
+        data = bytearray()
+        while len(data) < wanted:
+            block = self._process.stdout.read(wanted - len(data))
+            if not block:
+                break
+            data.extend(block)
+        usable = len(data) - len(data) % MIX_BYTES_PER_FRAME
+        self.frames_read += usable // MIX_BYTES_PER_FRAME
+        return np.frombuffer(bytes(data[:usable]), dtype=np.int16).reshape(-1, MIX_CHANNELS)
+
+    def close(self) -> None:
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.stdout.close()
+        self._process.wait()
+
+def crossfade_frames(outgoing: np.ndarray, incoming: np.ndarray) -> np.ndarray:
+    """Equal-power crossfade of two equally long (frames, channels) int16 blocks."""
+    frame_count = len(outgoing)
+    if frame_count == 0:
+        return outgoing
+    position = np.linspace(0.0, 1.0, frame_count, dtype=np.float32)[:, None]
+    mixed = outgoing.astype(np.float32) * np.cos(position * np.pi / 2) \
+        + incoming.astype(np.float32) * np.sin(position * np.pi / 2)
+    return np.clip(mixed, -32768, 32767).astype(np.int16)
+
+def _pad_frames(frames: np.ndarray, frame_count: int) -> np.ndarray:
+    if len(frames) >= frame_count:
+        return frames
+    return np.concatenate([frames, np.zeros((frame_count - len(frames), MIX_CHANNELS), dtype=np.int16)])
+
+
+class _MixOwnership:
+    """
+    Which uvicorn worker renders a mix: the one holding the flock on the mix's lock file. The
+    owner serves the encoded bytes on a unix socket next to it; the other workers relay from
+    there instead of starting a second render. A crashed owner's flock is released by the kernel.
+    """
+
+    def __init__(self, mix_id: str):
+        name = hashlib.sha1(mix_id.encode("utf-8")).hexdigest()[:16]
+        self.lock_path = os.path.join(MIX_RELAY_DIR, f"{name}.lock")
+        self.socket_path = os.path.join(MIX_RELAY_DIR, f"{name}.sock")
+        self._lock_file = None
+        self._server: Optional[socket.socket] = None
+
+    def acquire(self) -> bool:
+        os.makedirs(MIX_RELAY_DIR, exist_ok=True)
+        self._lock_file = open(self.lock_path, "a")
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def listen(self) -> socket.socket:
+        # A socket file left by a crashed owner would make bind fail; only the lock holder gets here.
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        self._server.listen()
+        self._server.settimeout(MIX_RELAY_ACCEPT_TIMEOUT_SECONDS)
+        return self._server
+
+    def release(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+        if self._lock_file is not None:
+            # Closing the file drops the flock.
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class MixStream:
+    """
+    One continuously rendered mix of a session's playlist, shared by all of its listeners.
+
+    A render thread decodes the tracks in playlist order, applies the planned transition
+    between each pair (the next track starts at nextSongStartTimeSec of the current one and
+    both are crossfaded over the overlap) and feeds the PCM to one ffmpeg MP3 encoder at
+    real-time pace. The encoded bytes go into a bounded buffer that every listener reads from,
+    so each transition is rendered and encoded once however many listeners there are.
+
+    state_provider() returns the session's player state snapshot (or None);
+    transition_provider(current_path, next_path) returns a PlanTransition-like dict.
+    With an ownership, listeners of other workers are served through its relay socket.
+    """
+
+    def __init__(self, mix_id: str, state_provider: Callable[[], Optional[dict]],
+                 transition_provider: Callable[[str, str], dict], bitrate_kbps: int = MIX_BITRATE_KBPS,
+                 ownership: Optional[_MixOwnership] = None):
+        self.mix_id = mix_id
+        self._ownership = ownership
+        self.bitrate_kbps = bitrate_kbps
+        self.bytes_per_second = bitrate_kbps * 1000 // 8
+        self._state_provider = state_provider
+        self._transition_provider = transition_provider
+        self._lock = threading.Lock()
+        self._chunks: deque[tuple[int, bytes]] = deque()  # (stream offset, data)
+        self._buffer_start = 0
+        self._buffer_end = 0
+        self._listeners = 0
+        # Listeners of other workers, reading through the relay socket; included in _listeners.
+        self._relayed_listeners = 0
+        self._idle_since = time.monotonic()
+        self._started_at: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._finished = threading.Event()
+        self._encoder: Optional[subprocess.Popen] = None
+        self._frames_written = 0
+        self.now_playing: Optional[dict] = None
+        self.transitions_rendered = 0
+
+    # Rendering
+
+    def start(self) -> None:
+        require_ffmpeg()
+        self._encoder = subprocess.Popen(
+            [
+                FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error",
+                "-f", "s16le", "-ac", str(MIX_CHANNELS), "-ar", str(MIX_SAMPLE_RATE), "-i", "pipe:0",
+                "-c:a", "libmp3lame", "-b:a", f"{self.bitrate_kbps}k", "-f", "mp3", "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._started_at = time.monotonic()
+        threading.Thread(target=self._render, name=f"MixRender-{self.mix_id}", daemon=True).start()
+        threading.Thread(target=self._pump, name=f"MixPump-{self.mix_id}", daemon=True).start()
+        self._start_relay_server()
+
+    def _start_relay_server(self) -> None:
+        if self._ownership is not None:
+            server = self._ownership.listen()
+            threading.Thread(target=self._serve_relays, args=(server,), name=f"MixRelay-{self.mix_id}", daemon=True).start()
+
+    def _should_stop(self) -> bool:
+        if self._stop_event.is_set():
+            return True
+        with self._lock:
+            idle = self._listeners == 0 and time.monotonic() - self._idle_since >= MIX_IDLE_SECONDS
+        if idle:
+            self._stop_event.set()
+        return idle
+
+    def _write_pcm(self, frames: np.ndarray) -> bool:
+        # Pace on the audio clock: never more than MIX_RENDER_AHEAD_SECONDS ahead of real time.
+        while self._frames_written / MIX_SAMPLE_RATE - (time.monotonic() - self._started_at) > MIX_RENDER_AHEAD_SECONDS:
+            if self._should_stop():
+                return False
+            time.sleep(MIX_BLOCK_SECONDS)
+        if self._should_stop():
+            return False
+        try:
+            self._encoder.stdin.write(frames.tobytes())
+        except (BrokenPipeError, ValueError):
+            return False
+        self._frames_written += len(frames)
+        return True
+
+    def _write_from(self, decoder: _TrackDecoder, frame_count: Optional[int]) -> bool:
+        """Write frame_count frames of decoder (all remaining when None). False when the mix stopped."""
+        block_frames = int(MIX_BLOCK_SECONDS * MIX_SAMPLE_RATE)
+        remaining = frame_count
+        while remaining is None or remaining > 0:
+            wanted = block_frames if remaining is None else min(block_frames, remaining)
+            frames = decoder.read_frames(wanted)
+            if len(frames) == 0:
+                return True
+            if not self._write_pcm(frames):
+                return False
+            if remaining is not None:
+                remaining -= len(frames)
+        return True
+
+    def _plan(self, current_path: str, next_path: str) -> Optional[tuple[int, int]]:
+        """(frames of the current track before the next starts, overlap frames), or None when unknown."""
+        try:
+            transition = self._transition_provider(current_path, next_path)
+        except Exception as e:
+            mainLogger.warning("Mix %s plays %s out without a crossfade: %s", self.mix_id, current_path, e)
+            return None
+        start_frames = int(float(transition["nextSongStartTimeSec"]) * MIX_SAMPLE_RATE)
+        overlap_frames = int(float(transition["overlapSeconds"]) * MIX_SAMPLE_RATE)
+        return start_frames, overlap_frames
+
+    def _next_track(self, playlist_paths: list[str], index: int) -> tuple[list[str], int]:
+        # A replaced playlist takes over at the next transition, from its first track.
+        state = self._state_provider()
+        if state is None:
+            return [], -1
+        latest_paths = [entry["absolute_path"] for entry in state["playlist"]]
+        if latest_paths != playlist_paths:
+            return latest_paths, 0
+        return playlist_paths, (index + 1) % len(playlist_paths)
+
+    def _render(self) -> None:
+        current: Optional[_TrackDecoder] = None
+        try:
+            state = self._state_provider()
+            if state is None:
+                return
+            playlist_paths = [entry["absolute_path"] for entry in state["playlist"]]
+            index = max(state["index"], 0)
+            current = _TrackDecoder(playlist_paths[index])
+            self.now_playing = {"index": index, "path": playlist_paths[index]}
+
+            while not self._should_stop():
+                playlist_paths, next_index = self._next_track(playlist_paths, index)
+                if next_index < 0:
+                    return
+                next_path = playlist_paths[next_index]
+                # Planned when the current track starts, a whole track ahead of the transition.
+                plan = self._plan(current.track_path, next_path)
+                start_frames, overlap_frames = plan if plan is not None else (None, 0)
+
+                # The incoming track's first overlap_frames already went into the previous crossfade.
+                if start_frames is not None:
+                    start_frames = max(0, start_frames - current.frames_read)
+                if not self._write_from(current, start_frames):
+                    return
+
+                incoming = _TrackDecoder(next_path)
+                if overlap_frames > 0:
+                    outgoing = _pad_frames(current.read_frames(overlap_frames), overlap_frames)
+                    incoming_frames = _pad_frames(incoming.read_frames(overlap_frames), overlap_frames)
+                    if not self._write_pcm(crossfade_frames(outgoing, incoming_frames)):
+                        incoming.close()
+                        return
+                    self.transitions_rendered += 1
+                current.close()
+                current = incoming
+                index = next_index
+                self.now_playing = {"index": index, "path": next_path}
+        except Exception as e:
+            mainLogger.error("Mix %s stopped rendering: %s", self.mix_id, e)
+        finally:
+            if current is not None:
+                current.close()
+            self._stop_event.set()
+            try:
+                self._encoder.stdin.close()
+            except OSError:
+                pass
+
+    def _append_encoded(self, data: bytes) -> None:
+        maximum_buffered = int(MIX_BUFFER_SECONDS * self.bytes_per_second)
+        with self._lock:
+            self._chunks.append((self._buffer_end, data))
+            self._buffer_end += len(data)
+            while self._chunks and self._buffer_end - self._chunks[0][0] - len(self._chunks[0][1]) >= maximum_buffered:
+                self._chunks.popleft()
+            self._buffer_start = self._chunks[0][0] if self._chunks else self._buffer_end
+
+    def _pump(self) -> None:
+        try:
+            while True:
+                data = self._encoder.stdout.read1(MIX_READ_CHUNK_BYTES)
+                if not data:
+                    break
+                self._append_encoded(data)
+        finally:
+            self._encoder.stdout.close()
+            self._encoder.wait()
+            self._finish()
+
+    def _finish(self) -> None:
+        # Ownership goes first, so a worker waiting on finished can take it over at once.
+        if self._ownership is not None:
+            self._ownership.release()
+        self._finished.set()
+
+    # Listening
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop_event.is_set()
+
+    def wait_finished(self, timeout: float) -> bool:
+        return self._finished.wait(timeout)
+
+    def _attach_listener(self, relayed: bool = False) -> None:
+        with self._lock:
+            self._listeners += 1
+            self._relayed_listeners += relayed
+
+    def _detach_listener(self, relayed: bool = False) -> None:
+        with self._lock:
+            self._listeners -= 1
+            self._relayed_listeners -= relayed
+            if self._listeners == 0:
+                self._idle_since = time.monotonic()
+
+    def _join_offset(self) -> int:
+        # CBR: byte offsets map linearly to time, so every listener joins at the same moment.
+        live_offset = int((time.monotonic() - self._started_at - MIX_JOIN_PREROLL_SECONDS) * self.bytes_per_second)
+        with self._lock:
+            return min(max(live_offset, self._buffer_start), self._buffer_end)
+
+    def _read_from(self, position: int) -> tuple[bytes, int]:
+        with self._lock:
+            # A listener that fell out of the buffer skips ahead instead of holding memory.
+            position = max(position, self._buffer_start)
+            parts = []
+            size = 0
+            for offset, data in self._chunks:
+                if offset + len(data) <= position:
+                    continue
+                part = data[position - offset:] if offset < position else data
+                parts.append(part)
+                size += len(part)
+                position += len(part)
+                if size >= MIX_MAX_SEND_BYTES:
+                    break
+            return b"".join(parts), position
+
+    async def listen(self):
+        """Encoded mix bytes for one listener, from the live edge on, until the mix ends."""
+        self._attach_listener()
+        try:
+            position = self._join_offset()
+            while True:
+                data, position = self._read_from(position)
+                if data:
+                    yield data
+                    continue
+                if self.finished:
+                    return
+                await asyncio.sleep(MIX_POLL_SECONDS)
+        finally:
+            self._detach_listener()
+
+    def _serve_relays(self, server: socket.socket) -> None:
+        while not self.finished:
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._relay, args=(connection,), name=f"MixRelay-{self.mix_id}", daemon=True).start()
+
+    def _relay(self, connection: socket.socket) -> None:
+        # One connection per listener of another worker: it keeps the mix from going idle.
+        connection.settimeout(None)
+        self._attach_listener(relayed=True)
+        try:
+            position = self._join_offset()
+            while True:
+                data, position = self._read_from(position)
+                if data:
+                    connection.sendall(data)
+                    continue
+                if self.finished:
+                    return
+                time.sleep(MIX_POLL_SECONDS)
+        except OSError:
+            pass  # The relaying worker's listener went away.
+        finally:
+            self._detach_listener(relayed=True)
+            connection.close()
+
+    def status(self) -> dict:
+        with self._lock:
+            listeners = self._listeners - self._relayed_listeners
+            relayed_listeners = self._relayed_listeners
+            buffered_bytes = self._buffer_end - self._buffer_start
+        return {
+            "mixId": self.mix_id,
+            "running": not self.finished,
+            "listeners": listeners,
+            "relayedListeners": relayed_listeners,
+            "nowPlaying": self.now_playing,
+            "transitionsRendered": self.transitions_rendered,
+            "renderedSeconds": self._frames_written / MIX_SAMPLE_RATE,
+            "bufferedSeconds": buffered_bytes / self.bytes_per_second,
+            "bitrateKbps": self.bitrate_kbps,
+            "relayed": False,
+        }
+
+
+class MixRelay:
+    """A mix rendered by another worker: its listeners here read the owner's relay socket."""
+
+    def __init__(self, mix_id: str, socket_path: str):
+        self.mix_id = mix_id
+        self.socket_path = socket_path
+        self._lock = threading.Lock()
+        self._listeners = 0
+
+    @property
+    def idle(self) -> bool:
+        with self._lock:
+            return self._listeners == 0
+
+    async def listen(self):
+        """The owner's encoded bytes for one listener, until the owner's mix ends."""
+        # The owner may still be binding its socket right after taking the lock.
+        deadline = time.monotonic() + MIX_RELAY_CONNECT_SECONDS
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path)
+                break
+            except OSError as e:
+                if time.monotonic() >= deadline:
+                    mainLogger.warning("Mix %s could not reach its rendering worker: %s", self.mix_id, e)
+                    return
+                await asyncio.sleep(MIX_POLL_SECONDS)
+
+        with self._lock:
+            self._listeners += 1
+        try:
+            while True:
+                data = await reader.read(MIX_MAX_SEND_BYTES)
+                if not data:
+                    return
+                yield data
+        finally:
+            with self._lock:
+                self._listeners -= 1
+            writer.close()
+
+    def status(self) -> dict:
+        with self._lock:
+            listeners = self._listeners
+        return {"mixId": self.mix_id, "running": True, "listeners": listeners, "relayed": True}
+
+
+class MixStreamManager:
+    """
+    Keeps one running mix per mix id (the listening session) across all uvicorn workers: the
+    worker that wins the mix's _MixOwnership renders it, the others hold a MixRelay to it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mixes: dict[str, Union[MixStream, MixRelay]] = {}
+
+    def _prune(self) -> None:
+        for done_id in [key for key, mix in self._mixes.items()
+                        if (mix.finished if isinstance(mix, MixStream) else mix.idle)]:
+            del self._mixes[done_id]
+
+    def get_or_start(self, mix_id: str, state_provider: Callable[[], Optional[dict]],
+                     transition_provider: Callable[[str, str], dict]) -> Union[MixStream, MixRelay]:
+        with self._lock:
+            self._prune()
+            mix = self._mixes.get(mix_id)
+            if isinstance(mix, MixStream) and not mix.stopping:
+                return mix
+        # This worker's mix is winding down and still holds the ownership: let it hand over.
+        if isinstance(mix, MixStream):
+            mix.wait_finished(MIX_HANDOFF_SECONDS)
+
+        with self._lock:
+            mix = self._mixes.get(mix_id)
+            if isinstance(mix, MixStream) and not mix.stopping:
+                return mix
+            # Ownership is tried on every new listener, so relays take over once the owner stops.
+            ownership = _MixOwnership(mix_id)
+            if ownership.acquire():
+                mix = MixStream(mix_id, state_provider, transition_provider, ownership=ownership)
+                try:
+                    mix.start()
+                except BaseException:
+                    ownership.release()
+                    raise
+            elif isinstance(mix, MixRelay):
+                return mix
+            else:
+                mix = MixRelay(mix_id, ownership.socket_path)
+            self._mixes[mix_id] = mix
+            return mix
+
+    def get(self, mix_id: str) -> Optional[Union[MixStream, MixRelay]]:
+        with self._lock:
+            return self._mixes.get(mix_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            mixes = list(self._mixes.values())
+        return {
+            "mixes": sum(1 for mix in mixes if isinstance(mix, MixStream)),
+            "relayed": sum(1 for mix in mixes if isinstance(mix, MixRelay)),
+            "listeners": sum(mix.status()["listeners"] for mix in mixes),
+        }
+
+
+mix_streams = MixStreamManager()
@@ -0,0 +1,384 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from Core.FileHandling import playerStateFile
+from Core.MemoryCache import LruCache
+
+PLAYER_STATE_BACKEND = os.getenv("AIDJ_PLAYER_STATE_BACKEND", "sqlite")
+# Point this at /dev/shm to keep the shared state in memory.
+PLAYER_STATE_PATH = os.getenv("AIDJ_PLAYER_STATE_PATH", playerStateFile)
+
+# Requests without a session id share this one, which is how the player behaved before sessions.
+DEFAULT_SESSION_ID = "default"
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+SESSION_IDLE_SECONDS = float(os.getenv("AIDJ_SESSION_IDLE_SECONDS", str(6 * 60 * 60)))
+MAX_SESSIONS = int(os.getenv("AIDJ_MAX_SESSIONS", "1000"))
+SESSION_MAX_PLAYLIST_TRACKS = int(os.getenv("AIDJ_SESSION_MAX_PLAYLIST_TRACKS", "10000"))
+# Reads only rewrite lastSeenAt once it is older than this, so most reads do not write.
+SESSION_TOUCH_SECONDS = 30.0
+SESSION_SWEEP_SECONDS = 60.0
+PLAYLIST_CACHE_BYTES = int(os.getenv("AIDJ_PLAYLIST_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+class PlaylistTooLong(ValueError):
+    pass
+
+def is_valid_session_id(session_id: str) -> bool:
+    return bool(SESSION_ID_PATTERN.match(session_id))
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _snapshot(playlist: list[dict], index: int, started_at: Optional[str], version: int) -> dict:
+    return {"playlist": playlist, "index": index, "startedAt": started_at, "version": version}
+
+def _check_playlist_length(entries: list[dict]) -> None:
+    if len(entries) > SESSION_MAX_PLAYLIST_TRACKS:
+        raise PlaylistTooLong(f"Playlist has {len(entries)} tracks, the limit is {SESSION_MAX_PLAYLIST_TRACKS}")
+
+
+class PlayerStateBackend(ABC):
+    """
+    Playlist and cursor of every listening session. Every method returns the resulting state
+    snapshot {"playlist", "index", "startedAt", "version"} of that session, or None when the
+    session has no playlist. Cursor moves are atomic: two concurrent next() calls advance by two.
+
+    Sessions idle for longer than SESSION_IDLE_SECONDS are evicted, and at most MAX_SESSIONS are
+    kept (least recently seen go first).
+    """
+
+    @abstractmethod
+    def get_state(self, session_id: str = DEFAULT_SESSION_ID) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def set_playlist(self, entries: list[dict], session_id: str = DEFAULT_SESSION_ID) -> dict:
+        ...
+
+    @abstractmethod
+    def move(self, step: int, session_id: str = DEFAULT_SESSION_ID) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def clear_current(self, session_id: str = DEFAULT_SESSION_ID) -> None:
+        ...
+
+    @abstractmethod
+    def evict_idle(self) -> int:
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class _LocalSession:
+    __slots__ = ("playlist", "index", "started_at", "version", "last_seen")
+
+    def __init__(self):
+        self.playlist: list[dict] = []
+        self.index = -1
+        self.started_at: Optional[str] = None
+        self.version = 0
+        self.last_seen = time.time()
+
+
+class LocalPlayerState(PlayerStateBackend):
+    """In-process state, for a single worker and for tests."""
+
+    def __init__(self, idle_seconds: float = SESSION_IDLE_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        # Least recently seen first.
+        self._sessions: "OrderedDict[str, _LocalSession]" = OrderedDict()
+        self._evicted = 0
+
+    def _session(self, session_id: str, create: bool = False) -> Optional[_LocalSession]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[session_id] = _LocalSession()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evicted += 1
+        session.last_seen = time.time()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    @staticmethod
+    def _current(session: Optional[_LocalSession]) -> Optional[dict]:
+        if session is None or not session.playlist:
+            return None
+        return _snapshot(session.playlist, session.index, session.started_at, session.version)
+
+    def get_state(self, session_id: str = DEFAULT_SESSION_ID) -> Optional[dict]:
+        with self._lock:
+            return self._current(self._session(session_id))
+
+    def set_playlist(self, entries: list[dict], session_id: str = DEFAULT_SESSION_ID) -> dict:
+        _check_playlist_length(entries)
+        with self._lock:
+            session = self._session(session_id, create=True)
+            session.playlist = list(entries)
+            session.index = 0
+            session.started_at = _now_iso()
+            session.version += 1
+            return self._current(session)
+
+    def move(self, step: int, session_id: str = DEFAULT_SESSION_ID) -> Optional[dict]:
+        with self._lock:
+            session = self._session(session_id)
+            if session is None or not session.playlist:
+                return None
+            session.index = _moved_index(session.index, step, len(session.playlist))
+            session.started_at = _now_iso()
+            session.version += 1
+            return self._current(session)
+
+    def clear_current(self, session_id: str = DEFAULT_SESSION_ID) -> None:
+        with self._lock:
+            session = self._session(session_id)
+            if session is not None:
+                session.index = -1
+                session.version += 1
+
+    def evict_idle(self) -> int:
+        cutoff = time.time() - self.idle_seconds
+        evicted = 0
+        with self._lock:
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if session.last_seen >= cutoff:
+                    break
+                del self._sessions[session_id]
+                evicted += 1
+            self._evicted += evicted
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "evicted": self._evicted}
+
+
+class SqlitePlayerState(PlayerStateBackend):
+    """
+    State shared by every uvicorn worker through one SQLite row per session (WAL mode).
+    Decoded playlists are kept in a bounded per-process LRU keyed by session and only decoded
+    again when the session's playlistVersion changed, so cursor reads and moves are a
+    single-row lookup in the common case.
+    """
+
+    def __init__(self, database_path: str = PLAYER_STATE_PATH, idle_seconds: float = SESSION_IDLE_SECONDS,
+                 max_sessions: int = MAX_SESSIONS):
+        self.database_path = database_path
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+        self._playlists = LruCache(max(max_sessions, 1), PLAYLIST_CACHE_BYTES)
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._evicted = 0
+        connection = self._connection()
+        # The single-row table of the pre-session layout.
+        connection.execute("DROP TABLE IF EXISTS playerState")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS playerSessions (
+                sessionId TEXT PRIMARY KEY,
+                playlist TEXT NOT NULL,
+                playlistLength INTEGER NOT NULL,
+                playlistVersion INTEGER NOT NULL,
+                currentIndex INTEGER NOT NULL,
+                startedAt TEXT,
+                version INTEGER NOT NULL,
+                lastSeenAt REAL NOT NULL
+            )
+            """
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS playerSessionsLastSeen ON playerSessions (lastSeenAt)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        database_directory = os.path.dirname(self.database_path)
+        if database_directory:
+            os.makedirs(database_directory, exist_ok=True)
+        connection = sqlite3.connect(self.database_path, timeout=30.0, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=30000")
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _playlist_for(self, session_id: str, playlist_version: int, playlist_json: Optional[str] = None) -> Optional[list[dict]]:
+        """
+        The decoded playlist of playlist_version: from the LRU, else decoded from playlist_json.
+        None when it is not cached and no JSON was given; callers then read the playlist in the
+        same statement or transaction as the cursor, never in a separate one, so a cursor can
+        never be paired with a newer, shorter playlist.
+        """
+        playlist = self._playlists.Get(session_id, playlist_version)
+        if playlist is not None or playlist_json is None:
+            return playlist
+        playlist = json.loads(playlist_json)
+        self._playlists.Put(session_id, playlist_version, playlist, len(playlist_json))
+        return playlist
+
+    def _to_snapshot(self, session_id: str, index: int, started_at: Optional[str], version: int,
+                     playlist_version: int, playlist_json: Optional[str] = None) -> Optional[dict]:
+        playlist = self._playlist_for(session_id, playlist_version, playlist_json)
+        if not playlist:
+            return None
+        return _snapshot(playlist, index, started_at, version)
+
+    def _maybe_sweep(self) -> None:
+        now = time.time()
+        if now - self._last_sweep < SESSION_SWEEP_SECONDS or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = now
+            self.evict_idle()
+        finally:
+            self._sweep_lock.release()
+
+    def get_state(self, session_id: str = DEFAULT_SESSION_ID) -> Optional[dict]:
+        self._maybe_sweep()
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT currentIndex, startedAt, version, playlistVersion, lastSeenAt FROM playerSessions WHERE sessionId = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        index, started_at, version, playlist_version, last_seen = row
+        now = time.time()
+        if now - last_seen >= SESSION_TOUCH_SECONDS:
+            connection.execute("UPDATE playerSessions SET lastSeenAt = ? WHERE sessionId = ?", (now, session_id))
+        playlist_json = None
+        if self._playlist_for(session_id, playlist_version) is None:
+            # Not cached: read the cursor again together with the playlist, one consistent row.
+            row = connection.execute(
+                "SELECT currentIndex, startedAt, version, playlistVersion, playlist FROM playerSessions WHERE sessionId = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            index, started_at, version, playlist_version, playlist_json = row
+        return self._to_snapshot(session_id, index, started_at, version, playlist_version, playlist_json)
+
+    def set_playlist(self, entries: list[dict], session_id: str = DEFAULT_SESSION_ID) -> dict:
+        _check_playlist_length(entries)
+        self._maybe_sweep()
+        playlist_json = json.dumps(entries, ensure_ascii=False)
+        started_at = _now_iso()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                """
+                INSERT INTO playerSessions
+                    (sessionId, playlist, playlistLength, playlistVersion, currentIndex, startedAt, version, lastSeenAt)
+                VALUES (?, ?, ?, ?, 0, ?, 1, ?)
+                ON CONFLICT (sessionId) DO UPDATE SET
+                    playlist = excluded.playlist, playlistLength = excluded.playlistLength,
+                    playlistVersion = excluded.playlistVersion, currentIndex = 0, startedAt = excluded.startedAt,
+                    version = version + 1, lastSeenAt = excluded.lastSeenAt
+                """,
+                # A clock-based playlistVersion stays unique when an evicted session id is reused.
+                (session_id, playlist_json, len(entries), time.time_ns(), started_at, time.time()),
+            )
+            version, playlist_version = connection.execute(
+                "SELECT version, playlistVersion FROM playerSessions WHERE sessionId = ?", (session_id,)
+            ).fetchone()
+            self._evict_over_limit(connection)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return self._to_snapshot(session_id, 0, started_at, version, playlist_version, playlist_json)
+
+    def move(self, step: int, session_id: str = DEFAULT_SESSION_ID) -> Optional[dict]:
+        started_at = _now_iso()
+        connection = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write cannot interleave.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT playlistLength, currentIndex, version, playlistVersion FROM playerSessions WHERE sessionId = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None or row[0] == 0:
+                connection.execute("COMMIT")
+                return None
+            length, index, version, playlist_version = row
+            index = _moved_index(index, step, length)
+            version += 1
+            connection.execute(
+                "UPDATE playerSessions SET currentIndex = ?, startedAt = ?, version = ?, lastSeenAt = ? WHERE sessionId = ?",
+                (index, started_at, version, time.time(), session_id),
+            )
+            playlist_json = None
+            if self._playlist_for(session_id, playlist_version) is None:
+                # Still inside the transaction, so this is the playlist the new cursor points into.
+                (playlist_json,) = connection.execute(
+                    "SELECT playlist FROM playerSessions WHERE sessionId = ?", (session_id,)
+                ).fetchone()
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return self._to_snapshot(session_id, index, started_at, version, playlist_version, playlist_json)
+
+    def clear_current(self, session_id: str = DEFAULT_SESSION_ID) -> None:
+        self._connection().execute(
+            "UPDATE playerSessions SET currentIndex = -1, version = version + 1 WHERE sessionId = ?", (session_id,)
+        )
+
+    def _evict_over_limit(self, connection: sqlite3.Connection) -> None:
+        cursor = connection.execute(
+            """
+            DELETE FROM playerSessions WHERE sessionId IN (
+                SELECT sessionId FROM playerSessions ORDER BY lastSeenAt DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_sessions,),
+        )
+        self._evicted += max(cursor.rowcount, 0)
+
+    def evict_idle(self) -> int:
+        cursor = self._connection().execute(
+            "DELETE FROM playerSessions WHERE lastSeenAt < ?", (time.time() - self.idle_seconds,)
+        )
+        evicted = max(cursor.rowcount, 0)
+        self._evicted += evicted
+        return evicted
+
+    def stats(self) -> dict:
+        (sessions,) = self._connection().execute("SELECT COUNT(*) FROM playerSessions").fetchone()
+        return {"sessions": sessions, "evicted": self._evicted, "cachedPlaylists": self._playlists.Stats()}
+
+
+def _moved_index(index: int, step: int, length: int) -> int:
+    # A cleared cursor (-1) restarts at the first track going forward, the last going back.
+    if index < 0:
+        return 0 if step > 0 else length - 1
+    return (index + step) % length
+
+
+def create_player_state_backend(kind: str = PLAYER_STATE_BACKEND) -> PlayerStateBackend:
+    if kind == "local":
+        return LocalPlayerState()
+    if kind == "sqlite":
+        return SqlitePlayerState()
+    raise ValueError(f"Unknown player state backend: {kind}")
@@ -0,0 +1,349 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker, the in-process executor already serializes builds.
+    fcntl = None
+
+from Core.LibraryIngest import IngestCancelled
+from playerState import PLAYER_STATE_PATH
+from Logging.MainLogger import mainLogger
+
+JOB_HISTORY_LIMIT = 20
+JOB_EVENTS_POLL_SECONDS = 0.5
+TERMINAL_JOB_STATES = ("succeeded", "failed", "cancelled")
+# Workers heartbeat the jobs they run and pick up cancellations from the table this often.
+JOB_HEARTBEAT_SECONDS = 1.0
+# A queued or running job whose worker stopped heartbeating for this long is reported as failed.
+JOB_STALE_SECONDS = 30.0
+JOB_LOCK_POLL_SECONDS = 0.5
+STALE_JOB_ERROR = "The worker running this build stopped"
+
+# Columns set_state() may write; playlist is stored as JSON.
+_JOB_STATE_COLUMNS = {
+    "phase": "phase",
+    "started_at": "startedAt",
+    "finished_at": "finishedAt",
+    "playlist": "playlist",
+    "error": "error",
+}
+
+
+class PlaylistJobStore:
+    """
+    Playlist build jobs in a SQLite table next to the player sessions, so every uvicorn worker
+    sees every job: status, events and cancellation work whichever worker a request lands on.
+    Readers get snapshots:
+    {
+      "jobId", "sessionId", "state", "phase", "done", "total", "tracksAnalyzed", "etaSeconds",
+      "createdAt", "startedAt", "finishedAt", "playlist", "error", "cancelRequested", "version"
+    }
+    """
+
+    def __init__(self, database_path: str = PLAYER_STATE_PATH, stale_seconds: float = JOB_STALE_SECONDS):
+        self.database_path = database_path
+        self.stale_seconds = stale_seconds
+        self._local = threading.local()
+        self._connection().execute(
+            """
+            CREATE TABLE IF NOT EXISTS playlistJobs (
+                jobId TEXT PRIMARY KEY,
+                sessionId TEXT NOT NULL,
+                state TEXT NOT NULL,
+                phase TEXT,
+                done INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                tracksAnalyzed INTEGER NOT NULL DEFAULT 0,
+                createdAt REAL NOT NULL,
+                startedAt REAL,
+                finishedAt REAL,
+                analyzingStartedAt REAL,
+                playlist TEXT,
+                error TEXT,
+                cancelRequested INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
+                heartbeatAt REAL NOT NULL
+            )
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        database_directory = os.path.dirname(self.database_path)
+        if database_directory:
+            os.makedirs(database_directory, exist_ok=True)
+        connection = sqlite3.connect(self.database_path, timeout=30.0, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=30000")
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    @property
+    def build_lock_path(self) -> str:
+        return f"{self.database_path}.build.lock"
+
+    def create(self, session_id: str) -> dict:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO playlistJobs (jobId, sessionId, state, createdAt, heartbeatAt) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, session_id, now, now),
+            )
+            # Finished jobs beyond the history limit go, oldest first; unfinished ones always stay.
+            connection.execute(
+                f"""
+                DELETE FROM playlistJobs WHERE jobId IN (
+                    SELECT jobId FROM playlistJobs WHERE state IN ({",".join("?" * len(TERMINAL_JOB_STATES))})
+                    ORDER BY createdAt DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (*TERMINAL_JOB_STATES, JOB_HISTORY_LIMIT),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        connection = self._connection()
+        row = connection.execute("SELECT * FROM playlistJobs WHERE jobId = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        if row["state"] not in TERMINAL_JOB_STATES and time.time() - row["heartbeatAt"] > self.stale_seconds:
+            # The heartbeat guard keeps this from racing a worker that just came back.
+            connection.execute(
+                "UPDATE playlistJobs SET state = 'failed', error = ?, finishedAt = ?, version = version + 1 "
+                "WHERE jobId = ? AND heartbeatAt = ?",
+                (STALE_JOB_ERROR, time.time(), job_id, row["heartbeatAt"]),
+            )
+            row = connection.execute("SELECT * FROM playlistJobs WHERE jobId = ?", (job_id,)).fetchone()
+        return _job_snapshot(row)
+
+    def update_progress(self, job_id: str, phase: str, done: int, total: int) -> None:
+        now = time.time()
+        # SET expressions see the row's old values, so "phase IS NOT ?" detects entering a phase.
+        self._connection().execute(
+            """
+            UPDATE playlistJobs SET
+                analyzingStartedAt = CASE WHEN ? = 'analyzing' AND phase IS NOT 'analyzing' THEN ? ELSE analyzingStartedAt END,
+                tracksAnalyzed = CASE WHEN ? = 'analyzing' THEN ? ELSE tracksAnalyzed END,
+                phase = ?, done = ?, total = ?, heartbeatAt = ?, version = version + 1
+            WHERE jobId = ?
+            """,
+            (phase, now, phase, done, phase, done, total, now, job_id),
+        )
+
+    def set_state(self, job_id: str, state: str, **fields) -> None:
+        assignments = ["state = ?", "heartbeatAt = ?", "version = version + 1"]
+        parameters = [state, time.time()]
+        for name, value in fields.items():
+            assignments.append(f"{_JOB_STATE_COLUMNS[name]} = ?")
+            parameters.append(json.dumps(value, ensure_ascii=False) if name == "playlist" else value)
+        self._connection().execute(
+            f"UPDATE playlistJobs SET {', '.join(assignments)} WHERE jobId = ?", (*parameters, job_id)
+        )
+
+    def request_cancel(self, job_id: str) -> Optional[dict]:
+        self._connection().execute(
+            f"UPDATE playlistJobs SET cancelRequested = 1, version = version + 1 "
+            f"WHERE jobId = ? AND cancelRequested = 0 AND state NOT IN ({','.join('?' * len(TERMINAL_JOB_STATES))})",
+            (job_id, *TERMINAL_JOB_STATES),
+        )
+        return self.get(job_id)
+
+    def heartbeat(self, job_ids: list[str]) -> set[str]:
+        """Mark job_ids alive; returns those of them whose cancellation was requested."""
+        if not job_ids:
+            return set()
+        placeholders = ",".join("?" * len(job_ids))
+        connection = self._connection()
+        connection.execute(f"UPDATE playlistJobs SET heartbeatAt = ? WHERE jobId IN ({placeholders})", (time.time(), *job_ids))
+        rows = connection.execute(
+            f"SELECT jobId FROM playlistJobs WHERE cancelRequested = 1 AND jobId IN ({placeholders})", job_ids
+        ).fetchall()
+        return {row["jobId"] for row in rows}
+
+
+def _job_snapshot(row: sqlite3.Row) -> dict:
+    eta_seconds = None
+    # Only the analysis phase is long enough for a rate-based estimate to mean anything.
+    if row["state"] == "running" and row["phase"] == "analyzing" and row["done"] and row["analyzingStartedAt"] is not None:
+        elapsed = time.time() - row["analyzingStartedAt"]
+        eta_seconds = max(0.0, elapsed / row["done"] * (row["total"] - row["done"]))
+    return {
+        "jobId": row["jobId"],
+        "sessionId": row["sessionId"],
+        "state": row["state"],
+        "phase": row["phase"],
+        "done": row["done"],
+        "total": row["total"],
+        "tracksAnalyzed": row["tracksAnalyzed"],
+        "etaSeconds": eta_seconds,
+        "createdAt": row["createdAt"],
+        "startedAt": row["startedAt"],
+        "finishedAt": row["finishedAt"],
+        "playlist": json.loads(row["playlist"]) if row["playlist"] is not None else None,
+        "error": row["error"],
+        "cancelRequested": bool(row["cancelRequested"]),
+        "version": row["version"],
+    }
+
+
+class _BuildLock:
+    """
+    Cross-worker lock around a build: at most one playlist build touches songBeats.json and
+    songsList.json at a time. Waiting gives up when cancel_event is set.
+    """
+
+    def __init__(self, lock_path: str, cancel_event: threading.Event):
+        self.lock_path = lock_path
+        self.cancel_event = cancel_event
+        self._lock_file = None
+
+    def acquire(self) -> bool:
+        self._lock_file = open(self.lock_path, "a")
+        if fcntl is None:
+            return True
+        while True:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if self.cancel_event.wait(JOB_LOCK_POLL_SECONDS):
+                    self.release()
+                    return False
+
+    def release(self) -> None:
+        if self._lock_file is not None:
+            # Closing the file drops the flock.
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class PlaylistJobManager:
+    """
+    Runs playlist builds on a background thread of the worker that received the request, one
+    at a time across all workers, so the event loop and the request threadpool stay free.
+    Job state lives in PlaylistJobStore. build_function(progress_callback, cancel_event) returns
+    the playlist paths; on_success(paths, session_id) publishes it to the session that started
+    the job. The session's previous playlist keeps playing until on_success runs.
+    """
+
+    def __init__(self, build_function: Callable, on_success: Callable[[list[str], str], None],
+                 store: Optional[PlaylistJobStore] = None):
+        self._build_function = build_function
+        self._on_success = on_success
+        self._store = store or PlaylistJobStore()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PlaylistBuild")
+        # Cancel events of the jobs this process runs and has not finished.
+        self._cancel_events: dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+
+    def _submit(self, session_id: str) -> tuple[dict, Future]:
+        snapshot = self._store.create(session_id)
+        cancel_event = threading.Event()
+        with self._lock:
+            self._cancel_events[snapshot["jobId"]] = cancel_event
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, name="PlaylistJobWatcher", daemon=True)
+                self._watcher.start()
+        future = self._executor.submit(self._run, snapshot["jobId"], session_id, cancel_event)
+        return snapshot, future
+
+    def start(self, session_id: str) -> dict:
+        snapshot, _ = self._submit(session_id)
+        return snapshot
+
+    def run(self, session_id: str) -> list[str]:
+        """
+        Build as a job and wait for it: the same queue and cross-worker lock as start(), so a
+        synchronous build never overlaps a background one. Raises what the build raised.
+        """
+        _, future = self._submit(session_id)
+        return future.result()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._store.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        snapshot = self._store.request_cancel(job_id)
+        with self._lock:
+            cancel_event = self._cancel_events.get(job_id)
+        # A job of another worker sees the request on its next heartbeat.
+        if cancel_event is not None:
+            cancel_event.set()
+        return snapshot
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                cancel_events = dict(self._cancel_events)
+            try:
+                for job_id in self._store.heartbeat(list(cancel_events)):
+                    cancel_events[job_id].set()
+            except sqlite3.Error as e:
+                mainLogger.warning("Playlist job heartbeat failed: %s", e)
+
+    def _run(self, job_id: str, session_id: str, cancel_event: threading.Event) -> list[str]:
+        build_lock = _BuildLock(self._store.build_lock_path, cancel_event)
+        try:
+            if cancel_event.is_set() or not build_lock.acquire():
+                raise IngestCancelled()
+            try:
+                if cancel_event.is_set():
+                    raise IngestCancelled()
+                self._store.set_state(job_id, "running", started_at=time.time())
+                playlist = self._build_function(
+                    lambda phase, done, total: self._store.update_progress(job_id, phase, done, total), cancel_event
+                )
+                self._on_success(playlist, session_id)
+            finally:
+                build_lock.release()
+        except IngestCancelled:
+            self._store.set_state(job_id, "cancelled", finished_at=time.time())
+            mainLogger.info("Playlist build %s cancelled", job_id)
+            raise
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e) or type(e).__name__
+            self._store.set_state(job_id, "failed", error=detail, finished_at=time.time())
+            mainLogger.error("Playlist build %s failed: %s", job_id, detail)
+            raise
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+
+        self._store.set_state(job_id, "succeeded", playlist=playlist, phase="done", finished_at=time.time())
+        return playlist
+
+    async def events(self, job_id: str):
+        """Server-sent events with a job snapshot whenever it changes, until the job ends."""
+        last_version = -1
+        while True:
+            snapshot = await asyncio.to_thread(self._store.get, job_id)
+            if snapshot is None:
+                return
+            if snapshot["version"] != last_version:
+                last_version = snapshot["version"]
+                yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+            if snapshot["state"] in TERMINAL_JOB_STATES:
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
@@ -0,0 +1,94 @@
+import time
+
+from Core.Metrics import metricsRegistry, REQUEST_LATENCY_BUCKETS
+from streamAudio import ZERO_COPY_SEND_EXTENSION
+
+UNMATCHED_ROUTE = "unmatched"
+# Responses with these content types count as streams while their body is being sent.
+STREAM_MEDIA_PREFIXES = (b"audio/", b"video/mp2t")
+
+request_duration = metricsRegistry.Histogram(
+    "aidj_http_request_duration_seconds",
+    "Time from request to the last body byte handed to the server, by route template.",
+    ("method", "route", "status"),
+    REQUEST_LATENCY_BUCKETS,
+)
+response_start = metricsRegistry.Histogram(
+    "aidj_http_response_start_seconds",
+    "Time from request to response headers, by route template. For streams this is the latency a player waits.",
+    ("method", "route", "status"),
+    REQUEST_LATENCY_BUCKETS,
+)
+bytes_sent = metricsRegistry.Counter(
+    "aidj_http_response_bytes_total",
+    "Response body bytes sent, including zero-copy sendfile bodies, by route template.",
+    ("route",),
+)
+active_streams = metricsRegistry.Gauge(
+    "aidj_active_streams",
+    "Audio and HLS segment responses currently sending their body, by media type.",
+    ("media_type",),
+)
+
+
+def _route_label(scope) -> str:
+    # FastAPI puts the matched route into the scope; its path is the template ("/tracks/{track_id}"),
+    # which keeps the label set bounded whatever ids clients request.
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+def _stream_media_type(headers):
+    for name, value in headers:
+        if name.lower() == b"content-type":
+            if value.startswith(STREAM_MEDIA_PREFIXES):
+                return value.split(b";", 1)[0].decode("latin-1")
+            return None
+    return None
+
+
+class RequestMetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, body bytes and open streams of every HTTP request.
+
+    It wraps send() rather than the response (unlike BaseHTTPMiddleware), so streaming bodies
+    are not buffered and the zero-copy send extension still reaches the server.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status = 500
+        stream_media_type = None
+        body_bytes = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, stream_media_type, body_bytes
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                status = message["status"]
+                response_start.Observe(time.perf_counter() - start_time, (scope["method"], _route_label(scope), str(status)))
+                stream_media_type = _stream_media_type(message.get("headers", ()))
+                if stream_media_type is not None:
+                    active_streams.Inc(labels=(stream_media_type,))
+            elif message_type == "http.response.body":
+                body_bytes += len(message.get("body", b""))
+            elif message_type == ZERO_COPY_SEND_EXTENSION:
+                body_bytes += message.get("count") or 0
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            route = _route_label(scope)
+            request_duration.Observe(time.perf_counter() - start_time, (scope["method"], route, str(status)))
+            if body_bytes:
+                bytes_sent.Inc(body_bytes, (route,))
+            if stream_media_type is not None:
+                active_streams.Dec(labels=(stream_media_type,))
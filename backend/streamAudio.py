@@ -1,7 +1,12 @@
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
 from typing import Optional
 from fastapi import HTTPException
+from starlette.responses import StreamingResponse
 import mimetypes
+import os
+import re
+import secrets
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 BACKEND_ROOT = Path(__file__).resolve().parent
@@ -12,6 +17,21 @@ ALLOWED_AUDIO_EXTENSIONS = {
 }
 ALLOWED_AUDIO_MIME_PREFIXES = ("audio/",)
 
+# Playlist URLs are index based and can point at another file after /api/play,
+# so clients may keep copies but must revalidate them (cheap 304s).
+AUDIO_CACHE_CONTROL = os.getenv("AIDJ_AUDIO_CACHE_CONTROL", "public, no-cache")
+COVER_CACHE_CONTROL = os.getenv("AIDJ_COVER_CACHE_CONTROL", "public, no-cache")
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+# ASGI extension through which the server copies file pages to the socket with sendfile.
+ZERO_COPY_SEND_EXTENSION = "http.response.zerocopysend"
+SENDFILE_AVAILABLE = hasattr(os, "sendfile")
+
+MAX_BYTE_RANGES = 16
+# Ranges closer than this are sent as one part; a part header costs about as much.
+RANGE_COALESCE_GAP = 80
+RANGE_SPEC_PATTERN = re.compile(r"^(\d*)-(\d*)$")
+
 def validate_audio_file(track_file: Path) -> None:
     # 1) Extension allowlist
     ext = track_file.suffix.lower()
@@ -37,6 +57,45 @@ def parse_byte_range(range_header: str, file_size: int) -> tuple[int, int]:
         raise HTTPException(status_code=416, detail="Invalid range unit")
 
     ranges = range_header.replace("bytes=", "", 1).split(",", 1)[0].strip()
+    return _parse_range_spec(ranges, file_size)
+
+def parse_byte_ranges(range_header: str, file_size: int, max_ranges: int = MAX_BYTE_RANGES) -> list[tuple[int, int]]:
+    """
+    Parse every range of a Range header (RFC 7233). Unsatisfiable ranges are dropped,
+    416 is raised only when none is left. Overlapping ranges and ranges separated by less
+    than RANGE_COALESCE_GAP bytes are merged, so the result is sorted and disjoint.
+    """
+    if not range_header.startswith("bytes="):
+        raise HTTPException(status_code=416, detail="Invalid range unit")
+
+    specs = [spec.strip() for spec in range_header.replace("bytes=", "", 1).split(",") if spec.strip()]
+    if not specs:
+        raise HTTPException(status_code=416, detail="Invalid range format")
+    if len(specs) > max_ranges:
+        raise HTTPException(status_code=416, detail=f"Too many ranges, at most {max_ranges} are allowed")
+
+    satisfiable = []
+    for spec in specs:
+        if spec == "-" or not RANGE_SPEC_PATTERN.match(spec):
+            raise HTTPException(status_code=416, detail="Invalid range format")
+        try:
+            satisfiable.append(_parse_range_spec(spec, file_size))
+        except HTTPException:
+            continue # syntax was checked above, so this range is only unsatisfiable
+    if not satisfiable:
+        raise HTTPException(status_code=416, detail="Range not satisfiable")
+
+    satisfiable.sort()
+    merged = [satisfiable[0]]
+    for start, end in satisfiable[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1 + RANGE_COALESCE_GAP:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _parse_range_spec(ranges: str, file_size: int) -> tuple[int, int]:
     if "-" not in ranges:
         raise HTTPException(status_code=416, detail="Invalid range format")
 
@@ -68,4 +127,157 @@ def parse_byte_range(range_header: str, file_size: int) -> tuple[int, int]:
     if start < 0 or end < start or start >= file_size:
         raise HTTPException(status_code=416, detail="Range not satisfiable")
 
-    return start, min(end, file_size - 1)
\ No newline at end of file
+    return start, min(end, file_size - 1)
+
+def file_validators(file_stat: os.stat_result) -> tuple[str, str]:
+    """Strong ETag and Last-Modified value for a file, derived from its stat."""
+    etag = f'"{file_stat.st_ino:x}-{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+    last_modified = formatdate(file_stat.st_mtime, usegmt=True)
+    return etag, last_modified
+
+def _parse_http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def _etag_list_matches(header_value: str, etag: str) -> bool:
+    # Weak comparison, as required for If-None-Match.
+    header_value = header_value.strip()
+    if header_value == "*":
+        return True
+    opaque_etag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque_etag for candidate in header_value.split(","))
+
+def is_not_modified(headers, etag: str, last_modified: Optional[str]) -> bool:
+    """
+    RFC 7232 GET/HEAD evaluation: If-None-Match wins over If-Modified-Since.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_list_matches(if_none_match, etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    since = _parse_http_date(if_modified_since)
+    modified = _parse_http_date(last_modified)
+    return since is not None and modified is not None and modified <= since
+
+def if_range_allows_partial(headers, etag: str, last_modified: Optional[str]) -> bool:
+    """
+    True when a Range header may be honoured. A failed If-Range means the client's copy
+    is outdated and it gets the full representation with 200 instead.
+    """
+    if_range = headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(("\"", "W/")):
+        # Strong comparison; weak validators never match.
+        return not if_range.startswith("W/") and not etag.startswith("W/") and if_range == etag
+    if last_modified is None:
+        return False
+    if_range_date = _parse_http_date(if_range)
+    return if_range_date is not None and if_range_date == _parse_http_date(last_modified)
+
+
+def iter_file_range(track_file: Path, start: int, length: int, chunk_size: int = STREAM_CHUNK_SIZE):
+    with track_file.open("rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            read_size = min(chunk_size, remaining)
+            chunk = f.read(read_size)
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+class FileRangeResponse(StreamingResponse):
+    """
+    Sends bytes [start, start + length) of a file.
+
+    When the ASGI server advertises the zero-copy send extension the whole range is handed
+    over in one message and the server writes it with os.sendfile, without copying it through
+    Python; zeroCopyHttp.ZeroCopyHttpToolsProtocol adds that extension to uvicorn. Otherwise
+    the body falls back to the chunked iter_file_range generator.
+    """
+
+    def __init__(self, track_file: Path, start: int, length: int, status_code: int = 200,
+                 headers: Optional[dict] = None, media_type: Optional[str] = None):
+        self.track_file = track_file
+        self.start = start
+        self.length = length
+        self.zero_copy = False
+        # The generator only opens the file once iterated, so it costs nothing on the sendfile path.
+        super().__init__(
+            iter_file_range(track_file, start, length),
+            status_code=status_code,
+            headers=headers,
+            media_type=media_type,
+        )
+
+    async def __call__(self, scope, receive, send):
+        self.zero_copy = SENDFILE_AVAILABLE and ZERO_COPY_SEND_EXTENSION in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def stream_response(self, send) -> None:
+        if not self.zero_copy:
+            await super().stream_response(send)
+            return
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        with self.track_file.open("rb") as f:
+            await send({
+                "type": ZERO_COPY_SEND_EXTENSION,
+                "file": f,
+                "offset": self.start,
+                "count": self.length,
+                "more_body": False,
+            })
+
+
+def _multipart_part_header(boundary: str, content_type: str, start: int, end: int, file_size: int) -> bytes:
+    return (
+        f"\r\n--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+    ).encode("latin-1")
+
+def _multipart_trailer(boundary: str) -> bytes:
+    return f"\r\n--{boundary}--\r\n".encode("latin-1")
+
+def multipart_byteranges_length(ranges: list[tuple[int, int]], file_size: int, content_type: str, boundary: str) -> int:
+    length = len(_multipart_trailer(boundary))
+    for start, end in ranges:
+        length += len(_multipart_part_header(boundary, content_type, start, end, file_size)) + end - start + 1
+    return length
+
+def iter_multipart_byteranges(track_file: Path, ranges: list[tuple[int, int]], file_size: int,
+                              content_type: str, boundary: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    with track_file.open("rb") as f:
+        for start, end in ranges:
+            yield _multipart_part_header(boundary, content_type, start, end, file_size)
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    yield _multipart_trailer(boundary)
+
+def multipart_byteranges_response(track_file: Path, ranges: list[tuple[int, int]], file_size: int,
+                                  content_type: str, headers: dict) -> StreamingResponse:
+    """206 multipart/byteranges response streaming every range of ranges."""
+    boundary = secrets.token_hex(16)
+    headers = dict(headers)
+    headers["Content-Length"] = str(multipart_byteranges_length(ranges, file_size, content_type, boundary))
+    return StreamingResponse(
+        iter_multipart_byteranges(track_file, ranges, file_size, content_type, boundary),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
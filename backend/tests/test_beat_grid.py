@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from Core import AudioProcessing
+from Core.AudioProcessing import AlignTransitionToPhrase, PlanTransition
+from Core.BeatGrid import BEATS_PER_BAR, PHRASE_BARS, ComputeBeatGrid, FindNearestTime
+
+BEAT_SECONDS = 0.5
+SONG_SECONDS = 200.0
+
+
+def MakeBeatGrid(firstBeatSec, lastBeatSec, downbeatPhase=0):
+    # A steady 120 BPM track whose strongest onsets are on downbeatPhase of every bar.
+    beatTimes = np.arange(firstBeatSec, lastBeatSec, BEAT_SECONDS)
+    beatStrengths = np.where(np.arange(len(beatTimes)) % BEATS_PER_BAR == downbeatPhase, 1.0, 0.2)
+    return ComputeBeatGrid(beatTimes, beatStrengths)
+
+
+def test_synthetic_grid_has_bars_and_phrases():
+    beatGrid = MakeBeatGrid(0.0, SONG_SECONDS, downbeatPhase=1)
+    barSeconds = BEATS_PER_BAR * BEAT_SECONDS
+    assert beatGrid["downbeats"][0] == BEAT_SECONDS
+    assert np.allclose(np.diff(beatGrid["downbeats"]), barSeconds)
+    assert np.allclose(np.diff(beatGrid["phrases"]), PHRASE_BARS * barSeconds)
+
+
+def test_find_nearest_time():
+    times = np.array([10.0, 20.0, 30.0, 40.0], dtype=np.float32)
+    assert FindNearestTime(times, 24.0, 0.0, 100.0) == 20.0
+    assert FindNearestTime(times, 26.0, 0.0, 100.0) == 30.0
+    # The nearest entry overall lies outside the window, so the nearest one inside wins.
+    assert FindNearestTime(times, 21.0, 25.0, 100.0) == 30.0
+    assert FindNearestTime(times, 5.0, 15.0, 35.0) == 20.0
+    assert FindNearestTime(times, 50.0, 15.0, 35.0) == 30.0
+    assert FindNearestTime(times, 30.0, 30.0, 30.0) == 30.0
+    assert FindNearestTime(times, 25.0, 21.0, 29.0) is None
+    assert FindNearestTime(np.zeros(0, dtype=np.float32), 25.0, 0.0, 100.0) is None
+
+
+def test_transition_snaps_to_the_nearest_phrase_in_the_window():
+    beatGrid = MakeBeatGrid(0.0, SONG_SECONDS)
+    # Phrases start every 16 s; 192 s is the only one inside the 180..198 s overlap window.
+    assert AlignTransitionToPhrase(185.0, SONG_SECONDS, beatGrid) == 192.0
+    assert AlignTransitionToPhrase(197.0, SONG_SECONDS, beatGrid) == 192.0
+
+
+def test_transition_lines_up_the_next_songs_first_downbeat():
+    beatGrid = MakeBeatGrid(0.0, SONG_SECONDS)
+    nextBeatGrid = MakeBeatGrid(1.5, 60.0)
+    # The next song starts 1.5 s early so its first downbeat hits the 192 s phrase.
+    assert AlignTransitionToPhrase(189.0, SONG_SECONDS, beatGrid, nextBeatGrid) == 190.5
+
+
+def test_transition_falls_back_to_a_downbeat_without_a_phrase_in_range():
+    beatGrid = MakeBeatGrid(0.0, SONG_SECONDS)
+    beatGrid["phrases"] = beatGrid["phrases"][beatGrid["phrases"] < 180.0]
+    assert AlignTransitionToPhrase(185.3, SONG_SECONDS, beatGrid) == 186.0
+
+
+def test_transition_start_is_kept_when_nothing_is_in_range():
+    # Beats stop long before the overlap window, e.g. a beatless outro.
+    beatGrid = MakeBeatGrid(0.0, 100.0)
+    assert AlignTransitionToPhrase(185.0, SONG_SECONDS, beatGrid) is None
+    assert AlignTransitionToPhrase(185.0, SONG_SECONDS, None) is None
+
+
+@pytest.fixture
+def plannedGrids(monkeypatch):
+    grids = {}
+    monkeypatch.setattr(
+        AudioProcessing, "AnalyzeSongForTransitionWithCacheStatus",
+        lambda songPath, store=None: ({"durationSec": SONG_SECONDS}, True),
+    )
+    monkeypatch.setattr(AudioProcessing, "CalculateTransitionFromAnalysis", lambda current, following: 185.0)
+    monkeypatch.setattr(AudioProcessing, "GetBeatGrid", lambda songPath, store=None: grids.get(songPath))
+    return grids
+
+
+def test_planned_transition_is_phrase_aligned_with_a_grid(plannedGrids):
+    plannedGrids["current.mp3"] = MakeBeatGrid(0.0, SONG_SECONDS)
+    transition = PlanTransition("current.mp3", "next.mp3")
+    assert transition["phraseAligned"]
+    assert transition["nextSongStartTimeSec"] == 192.0
+    assert transition["overlapSeconds"] == 8.0
+
+
+def test_planned_transition_keeps_its_start_without_a_grid(plannedGrids):
+    transition = PlanTransition("current.mp3", "next.mp3")
+    assert not transition["phraseAligned"]
+    assert transition["nextSongStartTimeSec"] == 185.0
+
+    plannedGrids["current.mp3"] = MakeBeatGrid(0.0, 100.0)
+    transition = PlanTransition("current.mp3", "next.mp3")
+    assert not transition["phraseAligned"]
+    assert transition["nextSongStartTimeSec"] == 185.0
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from streamAudio import (
+    MAX_BYTE_RANGES,
+    RANGE_COALESCE_GAP,
+    multipart_byteranges_response,
+    parse_byte_ranges,
+)
+
+FILE_SIZE = 10000
+
+
+def RangeStatus(rangeHeader, fileSize=FILE_SIZE):
+    with pytest.raises(HTTPException) as error:
+        parse_byte_ranges(rangeHeader, fileSize)
+    return error.value.status_code
+
+
+def test_suffix_and_open_ended_ranges():
+    assert parse_byte_ranges("bytes=-500", FILE_SIZE) == [(9500, 9999)]
+    # A suffix longer than the file selects all of it.
+    assert parse_byte_ranges("bytes=-20000", FILE_SIZE) == [(0, 9999)]
+    assert parse_byte_ranges("bytes=9000-", FILE_SIZE) == [(9000, 9999)]
+    # An end past the file is clamped to the last byte.
+    assert parse_byte_ranges("bytes=9000-20000", FILE_SIZE) == [(9000, 9999)]
+
+
+def test_ranges_within_the_gap_are_coalesced():
+    firstEnd = 99
+    touching = firstEnd + 1 + RANGE_COALESCE_GAP
+    assert parse_byte_ranges(f"bytes=0-{firstEnd},{touching}-{touching + 99}", FILE_SIZE) == [(0, touching + 99)]
+    apart = touching + 1
+    assert parse_byte_ranges(f"bytes=0-{firstEnd},{apart}-{apart + 99}", FILE_SIZE) == [(0, firstEnd), (apart, apart + 99)]
+    # Unsorted and overlapping ranges come back sorted and disjoint.
+    assert parse_byte_ranges("bytes=5000-5999,0-99,5500-6500,-100", FILE_SIZE) == [(0, 99), (5000, 6500), (9900, 9999)]
+
+
+def test_range_count_is_capped():
+    specs = ",".join(f"{i * 1000}-{i * 1000 + 9}" for i in range(MAX_BYTE_RANGES))
+    assert len(parse_byte_ranges(f"bytes={specs}", MAX_BYTE_RANGES * 1000)) == MAX_BYTE_RANGES
+    assert RangeStatus(f"bytes={specs},0-1", MAX_BYTE_RANGES * 1000) == 416
+
+
+def test_unsatisfiable_ranges_are_dropped():
+    assert parse_byte_ranges("bytes=20000-30000,0-9,9999-", FILE_SIZE) == [(0, 9), (9999, 9999)]
+    assert parse_byte_ranges("bytes=500-400,-0,100-199", FILE_SIZE) == [(100, 199)]
+
+
+def test_416_when_no_range_remains():
+    assert RangeStatus("bytes=10000-") == 416
+    assert RangeStatus("bytes=20000-30000,10000-10001") == 416
+    assert RangeStatus("bytes=0-9", 0) == 416
+    assert RangeStatus("items=0-9") == 416
+    assert RangeStatus("bytes=a-9") == 416
+    assert RangeStatus("bytes=-") == 416
+
+
+@pytest.fixture
+def trackFile(tmp_path):
+    path = tmp_path / "track.mp3"
+    path.write_bytes(os.urandom(FILE_SIZE))
+    return path
+
+
+def test_multipart_content_length_matches_the_bytes_sent(trackFile):
+    ranges = parse_byte_ranges("bytes=0-9,5000-5999,-1", FILE_SIZE)
+
+    def Multipart(request):
+        return multipart_byteranges_response(trackFile, ranges, FILE_SIZE, "audio/mpeg", {"Accept-Ranges": "bytes"})
+
+    client = TestClient(Starlette(routes=[Route("/track", Multipart)]))
+    response = client.get("/track")
+    assert response.status_code == 206
+    assert int(response.headers["content-length"]) == len(response.content)
+
+    boundary = response.headers["content-type"].split("boundary=", 1)[1]
+    parts = response.content.split(f"--{boundary}".encode())
+    assert parts[0] == b"\r\n" and parts[-1] == b"--\r\n"
+    data = trackFile.read_bytes()
+    for part, (start, end) in zip(parts[1:-1], ranges):
+        head, body = part.split(b"\r\n\r\n", 1)
+        assert f"Content-Range: bytes {start}-{end}/{FILE_SIZE}".encode() in head
+        assert body == data[start:end + 1] + b"\r\n"
@@ -0,0 +1,95 @@
+import os
+from email.utils import formatdate
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from streamAudio import file_validators, if_range_allows_partial, is_not_modified
+
+ETAG = '"1f-2710-abc"'
+LAST_MODIFIED = "Sat, 17 Oct 2026 12:00:00 GMT"
+EARLIER = "Sat, 17 Oct 2026 11:00:00 GMT"
+LATER = "Sat, 17 Oct 2026 13:00:00 GMT"
+FILE_SIZE = 10000
+
+
+def test_if_none_match_accepts_lists_and_star():
+    assert is_not_modified({"if-none-match": ETAG}, ETAG, LAST_MODIFIED)
+    assert is_not_modified({"if-none-match": f'"other", {ETAG} , "third"'}, ETAG, LAST_MODIFIED)
+    assert is_not_modified({"if-none-match": "*"}, ETAG, LAST_MODIFIED)
+    assert not is_not_modified({"if-none-match": '"other", "third"'}, ETAG, LAST_MODIFIED)
+
+
+def test_if_none_match_uses_weak_comparison():
+    assert is_not_modified({"if-none-match": f"W/{ETAG}"}, ETAG, LAST_MODIFIED)
+    assert is_not_modified({"if-none-match": ETAG}, f"W/{ETAG}", LAST_MODIFIED)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    assert not is_not_modified({"if-none-match": '"other"', "if-modified-since": LATER}, ETAG, LAST_MODIFIED)
+    assert is_not_modified({"if-none-match": ETAG, "if-modified-since": EARLIER}, ETAG, LAST_MODIFIED)
+
+
+def test_if_modified_since():
+    assert is_not_modified({"if-modified-since": LAST_MODIFIED}, ETAG, LAST_MODIFIED)
+    assert is_not_modified({"if-modified-since": LATER}, ETAG, LAST_MODIFIED)
+    assert not is_not_modified({"if-modified-since": EARLIER}, ETAG, LAST_MODIFIED)
+    assert not is_not_modified({"if-modified-since": "not a date"}, ETAG, LAST_MODIFIED)
+    assert not is_not_modified({"if-modified-since": LATER}, ETAG, None)
+    assert not is_not_modified({}, ETAG, LAST_MODIFIED)
+
+
+def test_if_range_uses_strong_comparison():
+    assert if_range_allows_partial({}, ETAG, LAST_MODIFIED)
+    assert if_range_allows_partial({"if-range": ETAG}, ETAG, LAST_MODIFIED)
+    assert not if_range_allows_partial({"if-range": '"other"'}, ETAG, LAST_MODIFIED)
+    assert not if_range_allows_partial({"if-range": f"W/{ETAG}"}, ETAG, LAST_MODIFIED)
+    assert not if_range_allows_partial({"if-range": f"W/{ETAG}"}, f"W/{ETAG}", LAST_MODIFIED)
+
+
+def test_if_range_date_must_match_exactly():
+    assert if_range_allows_partial({"if-range": LAST_MODIFIED}, ETAG, LAST_MODIFIED)
+    assert not if_range_allows_partial({"if-range": LATER}, ETAG, LAST_MODIFIED)
+    assert not if_range_allows_partial({"if-range": EARLIER}, ETAG, LAST_MODIFIED)
+    assert not if_range_allows_partial({"if-range": LAST_MODIFIED}, ETAG, None)
+
+
+@pytest.fixture
+def trackFile(tmp_path):
+    path = tmp_path / "track.mp3"
+    path.write_bytes(os.urandom(FILE_SIZE))
+    return path
+
+
+@pytest.fixture
+def client(trackFile):
+    main = pytest.importorskip("main")
+
+    def Track(request):
+        return main._stream_file(trackFile, request, "audio/mpeg", "public, no-cache")
+
+    return TestClient(Starlette(routes=[Route("/track", Track)]))
+
+
+def test_failed_if_range_falls_back_to_the_full_body(client, trackFile):
+    etag, lastModified = file_validators(trackFile.stat())
+    data = trackFile.read_bytes()
+
+    partial = client.get("/track", headers={"Range": "bytes=0-99", "If-Range": etag})
+    assert partial.status_code == 206
+    assert partial.content == data[:100]
+
+    staleDate = formatdate(trackFile.stat().st_mtime - 3600, usegmt=True)
+    for ifRange in ('"outdated"', staleDate):
+        full = client.get("/track", headers={"Range": "bytes=0-99", "If-Range": ifRange})
+        assert full.status_code == 200
+        assert "content-range" not in full.headers
+        assert int(full.headers["content-length"]) == FILE_SIZE
+        assert full.content == data
+
+    notModified = client.get("/track", headers={"If-None-Match": etag, "Range": "bytes=0-99"})
+    assert notModified.status_code == 304
+    assert notModified.headers["etag"] == etag
+    assert notModified.headers["last-modified"] == lastModified
@@ -0,0 +1,39 @@
+import fcntl
+
+from Core import LibraryIngest
+from Core.LibraryIngest import FeatureUpgrader
+
+
+def test_upgrades_stale_songs_once_in_the_background(tmp_path, monkeypatch):
+    checked, ingested = [], []
+    monkeypatch.setattr(LibraryIngest, "GetSongsWithoutFeatures", lambda songPaths: checked.append(list(songPaths)) or songPaths[:1])
+    monkeypatch.setattr(LibraryIngest, "IngestBeats", lambda songPaths, songData, **kwargs: ingested.append(list(songPaths)))
+    upgrader = FeatureUpgrader(lockFile=str(tmp_path / "upgrade.lock"))
+
+    assert upgrader.Start(["a.mp3", "b.mp3"])
+    upgrader.Join(10)
+    assert checked == [["a.mp3", "b.mp3"]]
+    assert ingested == [["a.mp3"]]
+
+    # Checked paths are not stat'ed again; only songs the process has not seen yet are.
+    assert not upgrader.Start(["a.mp3", "b.mp3"])
+    assert upgrader.Start(["a.mp3", "c.mp3"])
+    upgrader.Join(10)
+    assert checked[-1] == ["c.mp3"]
+
+
+def test_skips_while_another_worker_upgrades(tmp_path, monkeypatch):
+    checked = []
+    monkeypatch.setattr(LibraryIngest, "GetSongsWithoutFeatures", lambda songPaths: checked.append(songPaths) or [])
+    lockPath = tmp_path / "upgrade.lock"
+    upgrader = FeatureUpgrader(lockFile=str(lockPath))
+
+    with open(lockPath, "a") as otherWorkerLock:
+        fcntl.flock(otherWorkerLock, fcntl.LOCK_EX)
+        assert upgrader.Start(["a.mp3"])
+        upgrader.Join(10)
+    assert checked == []
+    # Not marked checked: the next build tries again.
+    assert upgrader.Start(["a.mp3"])
+    upgrader.Join(10)
+    assert checked == [["a.mp3"]]
@@ -0,0 +1,31 @@
+import json
+import os
+
+import pytest
+
+from Core import FileHandling
+from Core.FileHandling import GetSongData, SaveToJson
+
+
+def test_save_to_json_merges_into_existing_file(tmp_path):
+    songBeats = tmp_path / "songBeats.json"
+    SaveToJson({"a.mp3": 120}, filename=str(songBeats))
+    SaveToJson({"b.mp3": 128}, filename=str(songBeats))
+    assert GetSongData(str(songBeats)) == {"a.mp3": 120, "b.mp3": 128}
+
+
+def test_crash_while_saving_keeps_previous_version(tmp_path, monkeypatch):
+    songBeats = tmp_path / "songBeats.json"
+    SaveToJson({"a.mp3": 120}, filename=str(songBeats))
+
+    def crashingDump(data, file, **kwargs):
+        file.write('{"a.mp3": 1')
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(FileHandling.json, "dump", crashingDump)
+    with pytest.raises(KeyboardInterrupt):
+        SaveToJson({"b.mp3": 128}, filename=str(songBeats))
+    monkeypatch.undo()
+
+    assert json.loads(songBeats.read_text()) == {"a.mp3": 120}
+    assert os.listdir(tmp_path) == ["songBeats.json"]
@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from Core.Metrics import MetricsRegistry, RegisterCacheMetrics
+
+
+class FakeCache:
+    def __init__(self, hits, misses):
+        self.stats = {"hits": hits, "misses": misses, "entries": 1, "bytes": 10}
+
+    def Stats(self):
+        return self.stats
+
+
+def MakeWorker(directory, processId, hits=0, misses=0, sessions=0):
+    # One registry per simulated uvicorn worker, all sharing one metrics directory.
+    registry = MetricsRegistry()
+    registry.StartSharing(directory, processId)
+    metrics = {
+        "requests": registry.Counter("test_requests_total", "Requests.", ("route",)),
+        "latency": registry.Histogram("test_latency_seconds", "Latency.", (), (0.1, 1.0)),
+        "streams": registry.Gauge("test_streams", "Open streams."),
+    }
+    registry.Callback("test_sessions", "Sessions in shared state.", (), lambda: [((), sessions)], multiprocessMode="max")
+    RegisterCacheMetrics({"analysis": FakeCache(hits, misses)}, registry)
+    return registry, metrics
+
+
+def Samples(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / "metrics")
+
+
+def test_scrape_of_any_worker_reports_the_whole_group(directory):
+    workerA, metricsA = MakeWorker(directory, "a", hits=9, misses=1, sessions=5)
+    workerB, metricsB = MakeWorker(directory, "b", hits=1, misses=9, sessions=5)
+    metricsA["requests"].Inc(2, ("/api/play",))
+    metricsB["requests"].Inc(3, ("/api/play",))
+    metricsA["latency"].Observe(0.05)
+    metricsB["latency"].Observe(0.5)
+    metricsA["streams"].Inc()
+    metricsB["streams"].Inc()
+
+    for registry in (workerA, workerB):
+        text = registry.Render()
+        assert "worker=" not in text
+        samples = Samples(text)
+        assert samples['test_requests_total{route="/api/play"}'] == "5.0"
+        assert samples['test_latency_seconds_bucket{le="0.1"}'] == "1"
+        assert samples['test_latency_seconds_bucket{le="1.0"}'] == "2"
+        assert samples["test_latency_seconds_count"] == "2"
+        assert samples["test_streams"] == "2.0"
+        assert samples["test_sessions"] == "5.0"
+        assert samples['aidj_cache_lookups_total{cache="analysis",result="hit"}'] == "10.0"
+        # 10 hits of 20 lookups overall, not the mean of two per-worker ratios.
+        assert samples['aidj_cache_hit_ratio{cache="analysis"}'] == "0.5"
+
+    workerA.StopSharing()
+    workerB.StopSharing()
+
+
+def test_collectors_run_only_when_some_worker_is_scraped(directory):
+    calls = []
+    workers = []
+    for processId in ("a", "b"):
+        registry = MetricsRegistry()
+        registry.StartSharing(directory, processId)
+        registry.Callback("test_sessions", "Sessions.", (), lambda: calls.append(1) or [((), 1)])
+        registry.Counter("test_requests_total", "Requests.").Inc()
+        workers.append(registry)
+
+    time.sleep(0.3)
+    assert calls == []
+    assert not os.path.exists(os.path.join(directory, "process-a.json"))
+
+    assert Samples(workers[0].Render())["test_sessions"] == "2.0"
+    # One collection in the scraped worker, one in the worker it asked.
+    assert len(calls) == 2
+    for registry in workers:
+        registry.StopSharing()
+
+
+def test_stopped_worker_keeps_its_counters_but_not_its_gauges(directory):
+    workerA, metricsA = MakeWorker(directory, "a")
+    workerB, metricsB = MakeWorker(directory, "b")
+    metricsA["requests"].Inc(2, ("/api/play",))
+    metricsA["streams"].Inc()
+    metricsB["requests"].Inc(3, ("/api/play",))
+    workerA.StopSharing()
+
+    for _ in range(2):
+        # The second scrape reads the archive again; the stopped worker is not counted twice.
+        samples = Samples(workerB.Render())
+        assert samples['test_requests_total{route="/api/play"}'] == "5.0"
+        assert "test_streams" not in samples
+    assert sorted(os.listdir(directory)) == ["archived.json", "metrics.lock", "process-b.json", "process-b.lock", "process-b.sock"]
+
+    # A replacement worker continues the totals instead of resetting them.
+    workerC, metricsC = MakeWorker(directory, "c")
+    metricsC["requests"].Inc(1, ("/api/play",))
+    assert Samples(workerC.Render())['test_requests_total{route="/api/play"}'] == "6.0"
+    workerB.StopSharing()
+    workerC.StopSharing()
+
+
+def test_render_without_sharing_reports_this_process():
+    registry = MetricsRegistry()
+    counter = registry.Counter("test_requests_total", "Requests.")
+    counter.Inc()
+    registry.Callback("test_broken", "Broken.", (), lambda: 1 / 0)
+    text = registry.Render()
+    assert Samples(text)["test_requests_total"] == "1.0"
+    assert "# test_broken failed to collect" in text
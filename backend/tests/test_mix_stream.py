@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+
+import mixStream
+from mixStream import MixRelay, MixStream, MixStreamManager, _MixOwnership
+
+WAIT_TIMEOUT_SECONDS = 10.0
+
+
+@pytest.fixture(autouse=True)
+def relayDirectory(tmp_path, monkeypatch):
+    monkeypatch.setattr(mixStream, "MIX_RELAY_DIR", str(tmp_path))
+    monkeypatch.setattr(mixStream, "MIX_RELAY_ACCEPT_TIMEOUT_SECONDS", 0.05)
+
+
+@pytest.fixture
+def startWithoutEncoder(monkeypatch):
+    # No ffmpeg here: a started mix only gets its clock and relay server; tests feed the buffer.
+    def Start(self):
+        self._started_at = time.monotonic()
+        self._start_relay_server()
+
+    monkeypatch.setattr(MixStream, "start", Start)
+
+
+def NoState():
+    return None
+
+
+def NoTransition(currentPath, nextPath):
+    return {}
+
+
+def WaitFor(condition):
+    deadline = time.monotonic() + WAIT_TIMEOUT_SECONDS
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not reached")
+        time.sleep(0.01)
+
+
+def test_only_one_worker_owns_a_mix():
+    first, second = _MixOwnership("session"), _MixOwnership("session")
+    assert first.acquire()
+    assert not second.acquire()
+    assert _MixOwnership("other").acquire()
+
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_relay_streams_the_owner_output_and_counts_as_listener(startWithoutEncoder):
+    ownership = _MixOwnership("session")
+    assert ownership.acquire()
+    mix = MixStream("session", NoState, NoTransition, ownership=ownership)
+    mix.start()
+    chunks = [bytes([value]) * 1000 for value in range(3)]
+    for chunk in chunks:
+        mix._append_encoded(chunk)
+
+    async def Listen():
+        received = bytearray()
+        async for data in MixRelay("session", ownership.socket_path).listen():
+            received.extend(data)
+            if len(received) == sum(map(len, chunks)):
+                await asyncio.to_thread(WaitFor, lambda: mix.status()["relayedListeners"] == 1)
+                assert mix.status()["listeners"] == 0
+                mix._finish()
+        return bytes(received)
+
+    assert asyncio.run(Listen()) == b"".join(chunks)
+    WaitFor(lambda: mix.status()["relayedListeners"] == 0)
+
+
+def test_second_worker_relays_and_takes_over_when_the_owner_stops(startWithoutEncoder):
+    workerA, workerB = MixStreamManager(), MixStreamManager()
+
+    owned = workerA.get_or_start("session", NoState, NoTransition)
+    relayed = workerB.get_or_start("session", NoState, NoTransition)
+    assert isinstance(owned, MixStream)
+    assert isinstance(relayed, MixRelay)
+    assert workerA.stats()["mixes"] == 1 and workerB.stats()["mixes"] == 0
+
+    owned._finish()
+    takenOver = workerB.get_or_start("session", NoState, NoTransition)
+    assert isinstance(takenOver, MixStream)
+    assert isinstance(workerA.get_or_start("session", NoState, NoTransition), MixRelay)
+    takenOver._finish()
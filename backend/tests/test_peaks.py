@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from Core import AudioProcessing, WaveformPeaks
+from Core.AudioProcessing import GetPeaksFile
+from Core.WaveformPeaks import PEAKS_HEADER, PEAKS_MAGIC
+
+
+@pytest.fixture
+def track(tmp_path, monkeypatch):
+    monkeypatch.setattr(WaveformPeaks, "PEAKS_DIRECTORY", str(tmp_path / "peaks"))
+    decodes = []
+
+    def DecodeTrack(path):
+        decodes.append(path)
+        time = np.arange(44100 * 2) / 44100
+        return np.stack([0.5 * np.sin(2 * np.pi * 440 * time)] * 2, axis=1).astype(np.float32), 44100
+
+    def AnalyzeAndStore(*args, **kwargs):
+        raise AssertionError("A peaks request must not run the full analysis pass")
+
+    monkeypatch.setattr(AudioProcessing, "DecodeTrack", DecodeTrack)
+    monkeypatch.setattr(AudioProcessing, "_AnalyzeAndStore", AnalyzeAndStore)
+    trackPath = tmp_path / "song.mp3"
+    trackPath.write_bytes(b"not decoded in this test")
+    return trackPath, decodes
+
+
+def test_missing_peaks_are_computed_from_a_decode_only(track):
+    trackPath, decodes = track
+    peaksPath = GetPeaksFile(str(trackPath))
+    with open(peaksPath, "rb") as peaksFile:
+        assert PEAKS_HEADER.unpack(peaksFile.read(PEAKS_HEADER.size))[0] == PEAKS_MAGIC
+    assert len(decodes) == 1
+
+    # Fresh peaks are served without decoding again.
+    assert GetPeaksFile(str(trackPath)) == peaksPath
+    assert len(decodes) == 1
+
+
+def test_changed_track_gets_new_peaks(track):
+    trackPath, decodes = track
+    GetPeaksFile(str(trackPath))
+    trackPath.write_bytes(b"a rewritten file of another size")
+    GetPeaksFile(str(trackPath))
+    assert len(decodes) == 2
+
+
+def test_unsupported_extension_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        GetPeaksFile(str(tmp_path / "cover.jpg"))
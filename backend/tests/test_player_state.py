@@ -0,0 +1,100 @@
+import multiprocessing
+
+import pytest
+
+from playerState import PlayerStateBackend, SqlitePlayerState
+
+PLAYLIST_LENGTH = 7
+MOVES_PER_PROCESS = 150
+PROCESS_TIMEOUT_SECONDS = 120
+
+
+def MakeEntries(count, prefix="track"):
+    return [{"path": f"{prefix}{i}.mp3", "absolute_path": f"/music/{prefix}{i}.mp3"} for i in range(count)]
+
+
+def MoveRepeatedly(databasePath, step, moves, results):
+    # Runs in its own process, like a uvicorn worker: its own backend, connection and playlist cache.
+    state = SqlitePlayerState(databasePath)
+    versions = []
+    for _ in range(moves):
+        snapshot = state.move(step)
+        assert 0 <= snapshot["index"] < len(snapshot["playlist"])
+        versions.append(snapshot["version"])
+    results.put(versions)
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        PlayerStateBackend()
+
+
+def test_concurrent_moves_from_several_processes_lose_no_step(tmp_path):
+    databasePath = str(tmp_path / "playerState.sqlite3")
+    initial = SqlitePlayerState(databasePath).set_playlist(MakeEntries(PLAYLIST_LENGTH))
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    steps = [1, 1, -1, 1]
+    processes = [
+        context.Process(target=MoveRepeatedly, args=(databasePath, step, MOVES_PER_PROCESS, results))
+        for step in steps
+    ]
+    for process in processes:
+        process.start()
+    versions = [version for _ in processes for version in results.get(timeout=PROCESS_TIMEOUT_SECONDS)]
+    for process in processes:
+        process.join(PROCESS_TIMEOUT_SECONDS)
+        assert process.exitcode == 0
+
+    # Every move saw its own version: none overwrote another one.
+    totalMoves = MOVES_PER_PROCESS * len(steps)
+    assert sorted(versions) == list(range(initial["version"] + 1, initial["version"] + totalMoves + 1))
+    final = SqlitePlayerState(databasePath).get_state()
+    assert final["version"] == initial["version"] + totalMoves
+    assert final["index"] == (MOVES_PER_PROCESS * sum(steps)) % PLAYLIST_LENGTH
+
+
+class _ConnectionWithHook:
+    """Runs hook once, right after the first statement matching marker, like a write from another worker."""
+
+    def __init__(self, connection, marker, hook):
+        self._connection = connection
+        self._marker = marker
+        self._hook = hook
+
+    def execute(self, sql, *args):
+        cursor = self._connection.execute(sql, *args)
+        if self._hook is not None and self._marker in sql:
+            rows = cursor.fetchall()
+            hook, self._hook = self._hook, None
+            hook()
+            return _Rows(rows)
+        return cursor
+
+
+class _Rows:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+
+def test_cursor_is_never_paired_with_a_newer_playlist(tmp_path):
+    databasePath = str(tmp_path / "playerState.sqlite3")
+    writer = SqlitePlayerState(databasePath)
+    reader = SqlitePlayerState(databasePath)
+    writer.set_playlist(MakeEntries(PLAYLIST_LENGTH, "long"))
+    writer.move(PLAYLIST_LENGTH - 1)
+
+    # The reader has no cached playlist; another worker replaces it with a shorter one
+    # between the reader's cursor read and its playlist read.
+    connection = reader._connection()
+    reader._connection = lambda: _ConnectionWithHook(
+        connection, "SELECT currentIndex", lambda: writer.set_playlist(MakeEntries(2, "short"))
+    )
+    snapshot = reader.get_state()
+    assert 0 <= snapshot["index"] < len(snapshot["playlist"])
+    assert snapshot["playlist"][0]["path"] == "short0.mp3"
+    assert snapshot["index"] == 0
@@ -0,0 +1,107 @@
+import random
+
+import numpy as np
+
+from Core.PatternGeneration import (
+    MAX_BPM_STEP,
+    MIN_BPM_STEP,
+    NUMBER_OF_INITIAL_CANDIDATES,
+    STOP_BPM_MARGIN,
+    Pattern,
+    PlaylistEngine,
+)
+
+RUNS = 200
+
+
+def MakeLibrary(count, seed=0):
+    rng = random.Random(seed)
+    return {f"song{i}.mp3": round(rng.uniform(80.0, 160.0), 1) for i in range(count)}
+
+
+class FirstIndexRandom(random.Random):
+    """Always draws the lowest index, so every probe of a window hits the same song."""
+
+    def randrange(self, start, stop=None):
+        return 0 if stop is None else start
+
+
+def test_every_step_stays_in_the_bpm_window():
+    songData = MakeLibrary(500)
+    engine = PlaylistEngine(songData)
+    slowest = sorted(songData.values())[:NUMBER_OF_INITIAL_CANDIDATES]
+    rng = random.Random(1)
+    for _ in range(RUNS):
+        bpms = list(engine.Generate(Pattern.PATTERN_ASCENDING, rng).values())
+        assert bpms[0] in slowest
+        for previous, current in zip(bpms, bpms[1:]):
+            assert previous + MIN_BPM_STEP < current < previous + MAX_BPM_STEP
+
+
+def test_descending_run_is_an_ascending_run_reversed():
+    engine = PlaylistEngine(MakeLibrary(200))
+    ascending = engine.Generate(Pattern.PATTERN_ASCENDING, random.Random(7))
+    descending = engine.Generate(Pattern.PATTERN_DESCENDING, random.Random(7))
+    assert list(descending) == list(reversed(list(ascending)))
+
+
+class RecordingEngine(PlaylistEngine):
+    def __init__(self, songData):
+        super().__init__(songData)
+        self.picks = []
+
+    def _PickUnused(self, lower, upper, used, rng):
+        index = super()._PickUnused(lower, upper, used, rng)
+        if index is not None:
+            self.picks.append(self.songs[index])
+        return index
+
+
+def test_no_song_repeats_within_a_run():
+    # Ten songs share every BPM, so each window offers several candidates.
+    songData = {f"song{i}.mp3": 100.0 + 3.0 * (i % 20) for i in range(200)}
+    engine = RecordingEngine(songData)
+    rng = random.Random(2)
+    for _ in range(RUNS):
+        engine.picks = []
+        playlist = engine.Generate(Pattern.PATTERN_ASCENDING, rng)
+        # A repeated pick would collapse into one dict entry, so check the picks themselves.
+        assert len(engine.picks) == len(set(engine.picks)) == len(playlist) - 1
+        assert list(playlist)[1:] == engine.picks
+
+
+def test_excluded_songs_are_never_picked():
+    songData = MakeLibrary(300)
+    excluded = set(list(songData)[::2])
+    engine = PlaylistEngine(songData, excluded)
+    for _ in range(20):
+        assert not excluded & set(engine.Generate(Pattern.PATTERN_ASCENDING))
+
+
+def test_used_window_falls_back_to_its_unused_songs():
+    engine = PlaylistEngine({"a.mp3": 100.0, "b.mp3": 104.0, "c.mp3": 104.5})
+    used = np.array([False, True, False])
+    # Every random probe lands on the used b.mp3; listing the window still finds c.mp3.
+    assert engine._PickUnused(1, 3, used, FirstIndexRandom()) == 2
+    used[2] = True
+    assert engine._PickUnused(1, 3, used, FirstIndexRandom()) is None
+    assert engine._PickUnused(2, 2, used, FirstIndexRandom()) is None
+
+
+def test_run_ends_when_the_next_window_is_empty():
+    # Nothing lies 2.5..7 BPM above 100, although faster songs exist.
+    songData = {"a.mp3": 100.0, "b.mp3": 101.0, "c.mp3": 120.0, "d.mp3": 125.0}
+    engine = PlaylistEngine(songData)
+    assert engine.Generate(Pattern.PATTERN_ASCENDING, FirstIndexRandom()) == {"a.mp3": 100.0}
+
+
+def test_run_stops_near_the_highest_bpm():
+    songData = {"a.mp3": 100.0, "b.mp3": 105.0, "c.mp3": 110.0, "d.mp3": 112.0}
+    playlist = PlaylistEngine(songData).Generate(Pattern.PATTERN_ASCENDING, FirstIndexRandom())
+    assert playlist == {"a.mp3": 100.0, "b.mp3": 105.0, "c.mp3": 110.0}
+    assert max(songData.values()) - list(playlist.values())[-1] < STOP_BPM_MARGIN
+
+
+def test_empty_library_and_unknown_pattern():
+    assert PlaylistEngine({}).Generate() == {}
+    assert PlaylistEngine({"a.mp3": 100.0}).Generate(Pattern.PATTERN_ENUM_END) is None
@@ -0,0 +1,181 @@
+import threading
+import time
+
+import pytest
+
+import playlistJobs
+from Core.LibraryIngest import IngestCancelled
+from playlistJobs import PlaylistJobManager, PlaylistJobStore, JOB_HISTORY_LIMIT, TERMINAL_JOB_STATES
+
+WAIT_TIMEOUT_SECONDS = 10.0
+
+
+@pytest.fixture(autouse=True)
+def fastHeartbeat(monkeypatch):
+    monkeypatch.setattr(playlistJobs, "JOB_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(playlistJobs, "JOB_LOCK_POLL_SECONDS", 0.05)
+
+
+def WaitForState(manager, jobId, states):
+    deadline = time.monotonic() + WAIT_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        job = manager.get(jobId)
+        if job["state"] in states:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {jobId} never reached {states}: {manager.get(jobId)}")
+
+
+class BlockingBuild:
+    """A build that reports progress, then waits until released or cancelled; records overlaps."""
+
+    activeBuilds = 0
+    maxActiveBuilds = 0
+    counterLock = threading.Lock()
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def __call__(self, progressCallback, cancelEvent):
+        with BlockingBuild.counterLock:
+            BlockingBuild.activeBuilds += 1
+            BlockingBuild.maxActiveBuilds = max(BlockingBuild.maxActiveBuilds, BlockingBuild.activeBuilds)
+        try:
+            progressCallback("analyzing", 1, 4)
+            self.started.set()
+            while not self.release.wait(0.02):
+                if cancelEvent.is_set():
+                    raise IngestCancelled()
+            return ["a.mp3", "b.mp3"]
+        finally:
+            with BlockingBuild.counterLock:
+                BlockingBuild.activeBuilds -= 1
+
+
+@pytest.fixture
+def databasePath(tmp_path):
+    return str(tmp_path / "playerState.sqlite3")
+
+
+def MakeManager(databasePath, build, published=None):
+    # One manager per simulated uvicorn worker, each with its own store connection.
+    onSuccess = (lambda paths, sessionId: published.append((sessionId, paths))) if published is not None else (lambda paths, sessionId: None)
+    return PlaylistJobManager(build, onSuccess, PlaylistJobStore(databasePath))
+
+
+def test_job_is_visible_and_cancellable_from_another_worker(databasePath):
+    build = BlockingBuild()
+    workerA = MakeManager(databasePath, build)
+    workerB = MakeManager(databasePath, BlockingBuild())
+
+    job = workerA.start("session")
+    assert build.started.wait(WAIT_TIMEOUT_SECONDS)
+    running = WaitForState(workerB, job["jobId"], ("running",))
+    assert running["phase"] == "analyzing" and running["done"] == 1 and running["total"] == 4
+
+    assert workerB.cancel(job["jobId"])["cancelRequested"]
+    cancelled = WaitForState(workerA, job["jobId"], TERMINAL_JOB_STATES)
+    assert cancelled["state"] == "cancelled"
+    assert workerB.get(job["jobId"])["state"] == "cancelled"
+
+
+def test_succeeded_job_publishes_playlist(databasePath):
+    build = BlockingBuild()
+    published = []
+    workerA = MakeManager(databasePath, build, published)
+    workerB = MakeManager(databasePath, BlockingBuild())
+
+    job = workerA.start("session")
+    build.release.set()
+    finished = WaitForState(workerB, job["jobId"], TERMINAL_JOB_STATES)
+    assert finished["state"] == "succeeded"
+    assert finished["playlist"] == ["a.mp3", "b.mp3"]
+    assert published == [("session", ["a.mp3", "b.mp3"])]
+
+
+def test_builds_of_different_workers_never_overlap(databasePath):
+    BlockingBuild.maxActiveBuilds = 0
+    buildA, buildB = BlockingBuild(), BlockingBuild()
+    workerA = MakeManager(databasePath, buildA)
+    workerB = MakeManager(databasePath, buildB)
+
+    jobA = workerA.start("first")
+    assert buildA.started.wait(WAIT_TIMEOUT_SECONDS)
+    # A synchronous build on the other worker waits for the running one instead of racing it.
+    result = []
+    runner = threading.Thread(target=lambda: result.append(workerB.run("second")))
+    runner.start()
+    time.sleep(0.3)
+    assert not buildB.started.is_set()
+
+    buildA.release.set()
+    buildB.release.set()
+    runner.join(WAIT_TIMEOUT_SECONDS)
+    assert result == [["a.mp3", "b.mp3"]]
+    assert WaitForState(workerA, jobA["jobId"], TERMINAL_JOB_STATES)["state"] == "succeeded"
+    assert BlockingBuild.maxActiveBuilds == 1
+
+
+def test_run_raises_when_cancelled_while_queued(databasePath):
+    buildA = BlockingBuild()
+    workerA = MakeManager(databasePath, buildA)
+    workerB = MakeManager(databasePath, BlockingBuild())
+    workerA.start("first")
+    assert buildA.started.wait(WAIT_TIMEOUT_SECONDS)
+
+    errors = []
+
+    def RunSecond():
+        try:
+            workerB.run("second")
+        except IngestCancelled as e:
+            errors.append(e)
+
+    runner = threading.Thread(target=RunSecond)
+    runner.start()
+    deadline = time.monotonic() + WAIT_TIMEOUT_SECONDS
+    queued = []
+    while not queued and time.monotonic() < deadline:
+        queued = [row["jobId"] for row in workerA._store._connection().execute(
+            "SELECT jobId FROM playlistJobs WHERE sessionId = 'second'")]
+        time.sleep(0.02)
+    workerA.cancel(queued[0])
+    runner.join(WAIT_TIMEOUT_SECONDS)
+    buildA.release.set()
+    assert len(errors) == 1
+    assert workerA.get(queued[0])["state"] == "cancelled"
+
+
+def test_failed_job_records_error(databasePath):
+    def FailingBuild(progressCallback, cancelEvent):
+        raise ValueError("no songs")
+
+    manager = MakeManager(databasePath, FailingBuild)
+    job = manager.start("session")
+    failed = WaitForState(manager, job["jobId"], TERMINAL_JOB_STATES)
+    assert failed["state"] == "failed" and failed["error"] == "no songs"
+    with pytest.raises(ValueError):
+        manager.run("session")
+
+
+def test_job_of_a_stopped_worker_is_reported_failed(databasePath):
+    store = PlaylistJobStore(databasePath, stale_seconds=0.1)
+    job = store.create("session")
+    time.sleep(0.2)
+    stale = store.get(job["jobId"])
+    assert stale["state"] == "failed" and stale["error"] == playlistJobs.STALE_JOB_ERROR
+
+
+def test_history_keeps_only_recent_finished_jobs(databasePath):
+    store = PlaylistJobStore(databasePath)
+    jobIds = []
+    for _ in range(JOB_HISTORY_LIMIT + 5):
+        jobId = store.create("session")["jobId"]
+        store.set_state(jobId, "succeeded", finished_at=time.time())
+        jobIds.append(jobId)
+    unfinished = store.create("session")["jobId"]
+
+    assert store.get(unfinished) is not None
+    assert all(store.get(jobId) is None for jobId in jobIds[:5])
+    assert all(store.get(jobId) is not None for jobId in jobIds[-JOB_HISTORY_LIMIT:])
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from Core.AudioProcessing import (
+    AnalyzeSilence,
+    DetectSilencePortionsOfSong,
+    DetectSilencePortionsOfSongVectorized,
+    GetNonSilentEndTime,
+    GetNonSilentStartTime,
+    GetSongDuration,
+    GetSilenceAtEndDuration,
+)
+
+
+def MakeSong(leadInMs, musicMs, tailMs, channels=1, frameRate=44100, extraFrames=0, noiseAmplitude=0, seed=0):
+    """
+    A 440 Hz tone framed by leadInMs and tailMs of near silence. extraFrames appends that
+    many frames of tail, so the last millisecond window is only partly filled.
+    """
+    generator = np.random.default_rng(seed)
+    framesPerMs = frameRate / 1000.0
+    leadInFrames = int(round(leadInMs * framesPerMs))
+    musicFrames = int(round(musicMs * framesPerMs))
+    tailFrames = int(round(tailMs * framesPerMs)) + extraFrames
+
+    time = np.arange(musicFrames) / frameRate
+    tone = 0.5 * 32767 * np.sin(2 * np.pi * 440.0 * time)
+    mono = np.concatenate([np.zeros(leadInFrames), tone, np.zeros(tailFrames)])
+    if noiseAmplitude:
+        mono += generator.uniform(-noiseAmplitude, noiseAmplitude, len(mono))
+    samples = np.repeat(mono[:, None], channels, axis=1)
+    if channels > 1:
+        # Different levels per channel, so the interleaved RMS actually mixes them.
+        samples[:, 1:] *= 0.25
+    pcm = np.clip(np.round(samples), -32768, 32767).astype("<i2")
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=frameRate, channels=channels)
+
+
+SONG_CASES = {
+    "mono": dict(leadInMs=250, musicMs=1000, tailMs=400),
+    "stereo": dict(leadInMs=120, musicMs=900, tailMs=330, channels=2),
+    "partialLastWindowMono": dict(leadInMs=75, musicMs=800, tailMs=200, extraFrames=17),
+    "partialLastWindowStereo": dict(leadInMs=40, musicMs=700, tailMs=10, channels=2, extraFrames=29),
+    "oddFrameRate": dict(leadInMs=333, musicMs=600, tailMs=123, frameRate=22050, extraFrames=5),
+    "quietNoiseInSilence": dict(leadInMs=300, musicMs=700, tailMs=300, channels=2, noiseAmplitude=200),
+    "noSilence": dict(leadInMs=0, musicMs=800, tailMs=0),
+    "allSilent": dict(leadInMs=500, musicMs=0, tailMs=500),
+}
+
+
+@pytest.fixture(params=sorted(SONG_CASES), ids=sorted(SONG_CASES))
+def song(request):
+    return MakeSong(**SONG_CASES[request.param])
+
+
+def test_detect_silence_portions_matches_millisecond_loops(song):
+    assert DetectSilencePortionsOfSongVectorized(song) == DetectSilencePortionsOfSong(song)
+
+
+def test_analyze_silence_matches_per_value_functions(song):
+    analysis = AnalyzeSilence(song)
+    assert analysis["nonSilentStartSec"] == GetNonSilentStartTime(song)
+    assert analysis["silenceAtEndSec"] == GetSilenceAtEndDuration(song)
+    assert analysis["durationSec"] == GetSongDuration(song)
+
+
+def test_end_time_matches_legacy(song):
+    _, nonSilentEndTime, _, _ = DetectSilencePortionsOfSongVectorized(song)
+    assert nonSilentEndTime == GetNonSilentEndTime(song)
+
+
+def test_known_lead_in_and_tail_are_found():
+    song = MakeSong(leadInMs=250, musicMs=1000, tailMs=400)
+    nonSilentStartTime, nonSilentEndTime, silenceAtEndDuration, songDuration = DetectSilencePortionsOfSongVectorized(song)
+    assert songDuration == pytest.approx(1.65)
+    # The tone starts and ends on a zero crossing, so allow the first and last millisecond to read as silent.
+    assert nonSilentStartTime == pytest.approx(0.25, abs=0.0015)
+    assert nonSilentEndTime == pytest.approx(1.249, abs=0.0015)
+    assert silenceAtEndDuration == pytest.approx(0.401, abs=0.0015)
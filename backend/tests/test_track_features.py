@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from Core import TrackFeatures
+from Core.TrackFeatures import ComputeIntegratedLoudness
+
+
+def MakeSine(sampleRate, seconds, amplitude, channels=1, frequency=997.0):
+    time = np.arange(int(sampleRate * seconds)) / sampleRate
+    tone = (amplitude * np.sin(2 * np.pi * frequency * time)).astype(np.float32)
+    return np.repeat(tone[:, None], channels, axis=1)
+
+
+@pytest.mark.parametrize("sampleRate", [44100, 48000])
+def test_full_scale_sine_in_one_channel_reads_minus_3_lufs(sampleRate):
+    # The BS.1770 reference: a 0 dBFS sine near 1 kHz in one channel is -3.01 LUFS.
+    assert ComputeIntegratedLoudness(MakeSine(sampleRate, 10, 1.0), sampleRate) == pytest.approx(-3.01, abs=0.05)
+
+
+def test_loudness_does_not_depend_on_chunk_size(monkeypatch):
+    sampleRate = 22050
+    samples = np.concatenate([MakeSine(sampleRate, 4, 0.01, 2), MakeSine(sampleRate, 20, 0.5, 2, 220.0)])
+    samples[:, 1] += 0.05 * np.random.default_rng(0).standard_normal(len(samples)).astype(np.float32)
+
+    wholeTrack = ComputeIntegratedLoudness(samples, sampleRate)
+    # Chunks that end mid-block and mid-step exercise the carried filter state and sums.
+    monkeypatch.setattr(TrackFeatures, "LOUDNESS_CHUNK_SECONDS", 0.37)
+    assert ComputeIntegratedLoudness(samples, sampleRate) == pytest.approx(wholeTrack, abs=1e-3)
+
+
+def test_short_or_silent_tracks_have_no_loudness():
+    assert ComputeIntegratedLoudness(MakeSine(44100, 0.3, 0.5), 44100) is None
+    assert ComputeIntegratedLoudness(np.zeros((44100 * 2, 2), dtype=np.float32), 44100) is None
@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+from transcodeAudio import build_once
+
+fcntl = pytest.importorskip("fcntl")
+
+WAIT_TIMEOUT_SECONDS = 10.0
+
+
+def test_lock_file_outlives_the_build(tmp_path):
+    outputPath = tmp_path / "rendition.mp3"
+    builds = []
+
+    def Produce():
+        builds.append(1)
+        raise OSError("ffmpeg failed")
+
+    with pytest.raises(OSError):
+        build_once(outputPath, Produce)
+    lockPath = tmp_path / "rendition.mp3.lock"
+    assert lockPath.exists()
+
+    # Another worker holding the lock on that same file keeps the next build waiting.
+    started = threading.Event()
+
+    def ProduceOnce():
+        started.set()
+        outputPath.write_bytes(b"mp3")
+
+    with open(lockPath, "a") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        builder = threading.Thread(target=build_once, args=(outputPath, ProduceOnce))
+        builder.start()
+        assert not started.wait(0.3)
+        fcntl.flock(lockFile, fcntl.LOCK_UN)
+    builder.join(WAIT_TIMEOUT_SECONDS)
+    assert started.is_set() and outputPath.read_bytes() == b"mp3"
+    assert lockPath.exists()
+    assert builds == [1]
@@ -0,0 +1,106 @@
+import http.client
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+uvicorn = pytest.importorskip("uvicorn")
+pytest.importorskip("httptools")
+
+from streamAudio import FileRangeResponse
+from zeroCopyHttp import ZeroCopyHttpToolsProtocol
+
+FILE_BYTES = 3 * 1024 * 1024 + 123
+
+
+@pytest.fixture(scope="module")
+def audio_file(tmp_path_factory):
+    path = tmp_path_factory.mktemp("zerocopy") / "track.mp3"
+    path.write_bytes(os.urandom(FILE_BYTES))
+    return path
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture(scope="module", params=["asyncio", "uvloop"])
+def server(request, audio_file):
+    if request.param == "uvloop":
+        pytest.importorskip("uvloop")
+    responses = []
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        start, _, length = scope["query_string"].decode().partition(",")
+        response = FileRangeResponse(Path(audio_file), int(start), int(length), media_type="audio/mpeg",
+                                     headers={"Content-Length": length})
+        responses.append(response)
+        await response(scope, receive, send)
+
+    # The middleware main.py wraps every route in must pass the zerocopysend message through.
+    from starlette.middleware.cors import CORSMiddleware
+    from requestMetrics import RequestMetricsMiddleware
+    wrapped_app = RequestMetricsMiddleware(CORSMiddleware(app, allow_origins=["*"]))
+
+    port = _free_port()
+    config = uvicorn.Config(wrapped_app, host="127.0.0.1", port=port, loop=request.param, http=ZeroCopyHttpToolsProtocol,
+                            lifespan="off", log_level="warning")
+    uvicorn_server = uvicorn.Server(config)
+    thread = threading.Thread(target=uvicorn_server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not uvicorn_server.started:
+        assert time.monotonic() < deadline, "uvicorn did not start"
+        time.sleep(0.01)
+    yield port, responses
+    uvicorn_server.should_exit = True
+    thread.join(10)
+
+
+def test_ranges_are_sent_with_zero_copy_over_keep_alive(server, audio_file):
+    port, responses = server
+    expected = audio_file.read_bytes()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    for start, length in ((0, FILE_BYTES), (1000, 4096), (FILE_BYTES - 10, 10)):
+        connection.request("GET", f"/track?{start},{length}")
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.read() == expected[start:start + length]
+        assert responses[-1].zero_copy
+    connection.close()
+
+
+def test_zero_length_body_completes_the_response(server):
+    port, responses = server
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request("GET", "/track?0,0")
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.getheader("content-length") == "0"
+    assert response.read() == b""
+    assert responses[-1].zero_copy
+    # The connection stays usable after an empty body.
+    connection.request("GET", "/track?0,16")
+    assert len(connection.getresponse().read()) == 16
+    connection.close()
+
+
+def test_head_sends_headers_only(server):
+    port, _ = server
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request("HEAD", "/track?0,4096")
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.getheader("content-length") == "4096"
+    assert response.read() == b""
+    # The connection stays usable after a HEAD.
+    connection.request("GET", "/track?0,16")
+    assert len(connection.getresponse().read()) == 16
+    connection.close()
@@ -0,0 +1,256 @@
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Optional
+from fastapi import HTTPException
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from Core.FileHandling import transcodeCacheDirectory
+from Logging.MainLogger import mainLogger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+TRANSCODE_CACHE_DIR = os.getenv("AIDJ_TRANSCODE_CACHE_DIR", transcodeCacheDirectory)
+TRANSCODE_CACHE_MAX_BYTES = int(os.getenv("AIDJ_TRANSCODE_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+TRANSCODE_TIMEOUT_SECONDS = float(os.getenv("AIDJ_TRANSCODE_TIMEOUT_SECONDS", "300"))
+FFMPEG_BINARY = os.getenv("AIDJ_FFMPEG_BINARY") or shutil.which("ffmpeg")
+
+MIN_BITRATE_KBPS = 24
+MAX_BITRATE_KBPS = 320
+ORIGINAL_FORMAT = "original"
+
+# format -> how ffmpeg writes it and how it is served. AAC goes into MP4 with the index
+# up front (faststart), so players can seek with range requests before the end arrives.
+RENDITION_FORMATS = {
+    "opus": {
+        "codec_args": ["-c:a", "libopus", "-vbr", "on"],
+        "container_args": ["-f", "ogg"],
+        "extension": ".opus",
+        "media_type": "audio/ogg",
+        "default_bitrate_kbps": 96,
+        "accept_types": ("audio/ogg", "audio/opus"),
+    },
+    "aac": {
+        "codec_args": ["-c:a", "aac"],
+        "container_args": ["-movflags", "+faststart", "-f", "mp4"],
+        "extension": ".m4a",
+        "media_type": "audio/mp4",
+        "default_bitrate_kbps": 128,
+        "accept_types": ("audio/mp4", "audio/aac"),
+    },
+}
+
+_in_flight: dict[str, Future] = {}
+_in_flight_lock = threading.Lock()
+
+def _accepted_media_types(accept_header: str) -> list[str]:
+    accepted = []
+    for part in accept_header.split(","):
+        media_range, *parameters = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_range and quality > 0:
+            accepted.append(media_range.lower())
+    return accepted
+
+def negotiate_rendition(format_param: Optional[str], bitrate_param: Optional[int], accept_header: Optional[str],
+                        original_media_type: str) -> Optional[tuple[str, int]]:
+    """
+    Pick the delivery rendition of a request: (format, bitrate_kbps), or None for the original file.
+    An explicit ?format= wins. Otherwise Accept only selects a transcode when it lists opus or aac
+    and does not accept the original type, so browsers sending audio/* or */* keep the original.
+    """
+    if format_param:
+        format_name = format_param.lower()
+        if format_name == ORIGINAL_FORMAT:
+            return None
+        if format_name not in RENDITION_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported delivery format: {format_param}")
+    elif accept_header:
+        accepted = _accepted_media_types(accept_header)
+        original_major = original_media_type.split("/", 1)[0]
+        if original_media_type in accepted or f"{original_major}/*" in accepted or "*/*" in accepted:
+            return None
+        format_name = next(
+            (name for name, rendition in RENDITION_FORMATS.items()
+             if any(media_type in accepted for media_type in rendition["accept_types"])),
+            None,
+        )
+        if format_name is None:
+            return None
+    else:
+        return None
+
+    bitrate_kbps = bitrate_param or RENDITION_FORMATS[format_name]["default_bitrate_kbps"]
+    if not MIN_BITRATE_KBPS <= bitrate_kbps <= MAX_BITRATE_KBPS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Bitrate must be between {MIN_BITRATE_KBPS} and {MAX_BITRATE_KBPS} kbps",
+        )
+    return format_name, bitrate_kbps
+
+def rendition_media_type(format_name: str) -> str:
+    return RENDITION_FORMATS[format_name]["media_type"]
+
+def _rendition_path(track_file: Path, format_name: str, bitrate_kbps: int) -> Path:
+    # The source's size and mtime are part of the key, so an edited file gets a new rendition
+    # and the old one simply ages out of the cache.
+    file_stat = track_file.stat()
+    key_source = f"{track_file.resolve()}|{file_stat.st_size}|{file_stat.st_mtime_ns}|{format_name}|{bitrate_kbps}"
+    key = hashlib.sha1(key_source.encode("utf-8")).hexdigest()
+    return Path(TRANSCODE_CACHE_DIR) / f"{key}{RENDITION_FORMATS[format_name]['extension']}"
+
+def _run_ffmpeg(track_file: Path, output_file: Path, format_name: str, bitrate_kbps: int) -> None:
+    rendition = RENDITION_FORMATS[format_name]
+    temporary_file = output_file.with_name(f"{output_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    command = [
+        FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(track_file),
+        "-map", "0:a:0", "-vn",
+        *rendition["codec_args"], "-b:a", f"{bitrate_kbps}k",
+        *rendition["container_args"],
+        str(temporary_file),
+    ]
+    try:
+        completed = subprocess.run(command, capture_output=True, timeout=TRANSCODE_TIMEOUT_SECONDS)
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.decode("utf-8", errors="replace").strip() or f"ffmpeg exited with {completed.returncode}")
+        # Readers only ever see complete renditions.
+        os.replace(temporary_file, output_file)
+    finally:
+        if temporary_file.exists():
+            temporary_file.unlink()
+
+def _build_locked(output_path: Path, produce: Callable[[], None]) -> None:
+    # The lock file makes the other uvicorn workers wait for this build instead of repeating it.
+    # It is never removed: a worker still waiting on the unlinked file and one locking a new file
+    # at the same path would both hold "the" lock. Eviction skips .lock files.
+    lock_path = output_path.with_name(f"{output_path.name}.lock")
+    with open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if output_path.exists():
+                return
+            produce()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def build_once(output_path: Path, produce: Callable[[], None]) -> None:
+    """
+    Run produce() to create output_path unless it already exists. Concurrent callers, in this
+    process or in other workers, wait for a single run; every waiter gets produce()'s exception.
+    """
+    key = str(output_path)
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = _in_flight[key] = Future()
+
+    if owner:
+        try:
+            os.makedirs(output_path.parent, exist_ok=True)
+            _build_locked(output_path, produce)
+            future.set_result(output_path)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with _in_flight_lock:
+                _in_flight.pop(key, None)
+
+    future.result()
+
+def touch_cache_entry(path: Path) -> bool:
+    """
+    Mark a cached file as used; False when it does not exist (not built yet, or evicted).
+    The atime is the LRU position. It is set explicitly (noatime mounts never update it) and
+    the mtime is kept, because ETags of cached files are derived from it.
+    """
+    try:
+        path_stat = path.stat()
+        os.utime(path, ns=(time.time_ns(), path_stat.st_mtime_ns))
+        return True
+    except FileNotFoundError:
+        return False
+
+def raise_for_build_error(error: Exception, description: str) -> None:
+    if isinstance(error, subprocess.TimeoutExpired):
+        raise HTTPException(status_code=504, detail="Transcoding timed out")
+    mainLogger.error("%s failed: %s", description, error)
+    raise HTTPException(status_code=500, detail="Transcoding failed")
+
+def require_ffmpeg() -> None:
+    if FFMPEG_BINARY is None:
+        raise HTTPException(status_code=503, detail="Transcoding is not available: ffmpeg was not found")
+
+def get_rendition(track_file: Path, format_name: str, bitrate_kbps: int) -> Path:
+    """
+    Return the path of the cached rendition of track_file, transcoding it first on a miss.
+    Concurrent requests for the same rendition wait for a single ffmpeg run.
+    """
+    require_ffmpeg()
+    output_file = _rendition_path(track_file, format_name, bitrate_kbps)
+    if touch_cache_entry(output_file):
+        return output_file
+
+    def transcode():
+        with mainLogger.timed("Transcoding %s to %s %sk", track_file, format_name, bitrate_kbps, level=logging.INFO):
+            _run_ffmpeg(track_file, output_file, format_name, bitrate_kbps)
+        evict_transcode_cache(keep_path=str(output_file))
+
+    try:
+        build_once(output_file, transcode)
+    except Exception as e:
+        raise_for_build_error(e, f"Transcoding {track_file} to {format_name} {bitrate_kbps}k")
+    return output_file
+
+def evict_transcode_cache(max_bytes: int = TRANSCODE_CACHE_MAX_BYTES, keep_path: Optional[str] = None) -> int:
+    """
+    Delete the least recently used renditions until the cache fits in max_bytes, never keep_path
+    (the rendition about to be served). Returns the number of files deleted.
+    """
+    renditions = []
+    total_bytes = 0
+    try:
+        with os.scandir(TRANSCODE_CACHE_DIR) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.endswith((".tmp", ".lock")):
+                    continue
+                try:
+                    entry_stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                total_bytes += entry_stat.st_size
+                if entry.path != keep_path:
+                    renditions.append((entry_stat.st_atime, entry_stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+
+    deleted = 0
+    renditions.sort()
+    for _, size, path in renditions:
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+        deleted += 1
+    return deleted
@@ -0,0 +1,98 @@
+"""
+uvicorn HTTP protocol that implements the zero-copy send ASGI extension.
+
+Stock uvicorn never advertises "http.response.zerocopysend", so FileRangeResponse would
+always take its chunked generator path. This protocol advertises it on every request and
+writes the file range with loop.sendfile, which on the asyncio loop is os.sendfile on the
+socket: the bytes go from the page cache to the socket without passing through Python.
+
+Opt-in; the stock CMD keeps uvicorn's own protocol and uvloop. Run with:
+    uvicorn main:app --loop asyncio --http zeroCopyHttp:ZeroCopyHttpToolsProtocol
+or set UVICORN_LOOP=asyncio and UVICORN_HTTP=zeroCopyHttp:ZeroCopyHttpToolsProtocol.
+
+uvloop has no loop.sendfile; under it (and for TLS transports, where asyncio itself falls
+back) the range is copied in STREAM_CHUNK_SIZE blocks, which is what the generator does.
+
+This subclasses uvicorn internals (_start_asgi_task and the RequestResponseCycle fields used
+below), which is why requirements.txt pins uvicorn to the tested minor release.
+"""
+import asyncio
+
+from uvicorn.protocols.http.httptools_impl import HttpToolsProtocol
+
+from streamAudio import ZERO_COPY_SEND_EXTENSION, STREAM_CHUNK_SIZE
+
+
+async def _copy_file_range(cycle, file, offset: int, count: int) -> None:
+    file.seek(offset)
+    while count > 0 and not cycle.disconnected:
+        chunk = await asyncio.to_thread(file.read, min(STREAM_CHUNK_SIZE, count))
+        if not chunk:
+            raise RuntimeError("File is shorter than the zero-copy send count")
+        cycle.transport.write(chunk)
+        count -= len(chunk)
+        if cycle.flow.write_paused:
+            await cycle.flow.drain()
+
+
+async def send_file_range(cycle, message) -> None:
+    """
+    Handle one http.response.zerocopysend message for a uvicorn RequestResponseCycle,
+    with the same framing checks and completion steps as its http.response.body path.
+    """
+    if not cycle.response_started or cycle.response_complete:
+        raise RuntimeError(f"Unexpected ASGI message '{ZERO_COPY_SEND_EXTENSION}' outside a response body.")
+    if cycle.chunked_encoding:
+        raise RuntimeError("Zero-copy send needs a response with a Content-Length.")
+    if cycle.flow.write_paused and not cycle.disconnected:
+        await cycle.flow.drain()
+    if cycle.disconnected:
+        return
+
+    count = message.get("count")
+    offset = message.get("offset") or 0
+    file = message["file"]
+    if count is None:
+        count = cycle.expected_content_length
+    more_body = message.get("more_body", False)
+
+    if cycle.scope["method"] == "HEAD":
+        cycle.expected_content_length = 0
+    elif count > 0:
+        # loop.sendfile rejects count=0, so an empty body (an empty file) skips straight to completion.
+        if count > cycle.expected_content_length:
+            raise RuntimeError("Response content longer than Content-Length")
+        try:
+            await asyncio.get_running_loop().sendfile(cycle.transport, file, offset, count)
+        except NotImplementedError:
+            await _copy_file_range(cycle, file, offset, count)
+        except OSError:
+            if cycle.disconnected or cycle.transport.is_closing():
+                return
+            raise
+        cycle.expected_content_length -= count
+
+    if not more_body:
+        if cycle.expected_content_length != 0:
+            raise RuntimeError("Response content shorter than Content-Length")
+        cycle.response_complete = True
+        cycle.message_event.set()
+        if not cycle.keep_alive:
+            cycle.transport.close()
+        cycle.on_response()
+
+
+class ZeroCopyHttpToolsProtocol(HttpToolsProtocol):
+    def _start_asgi_task(self, cycle, app) -> None:
+        cycle.scope.setdefault("extensions", {})[ZERO_COPY_SEND_EXTENSION] = {}
+
+        async def send(message) -> None:
+            if message["type"] == ZERO_COPY_SEND_EXTENSION:
+                await send_file_range(cycle, message)
+            else:
+                await cycle.send(message)
+
+        async def app_with_zero_copy(scope, receive, _send) -> None:
+            await app(scope, receive, send)
+
+        super()._start_asgi_task(cycle, app_with_zero_copy)